@@ -1,11 +1,14 @@
 import streamlit as st
 import os
-from datetime import datetime
-from transcribe import transcribe_audio
-from summarize import summarize_text
-from export_pdf import export_to_pdf
-from database import init_db, log_care_summary
-from email_utils import send_pdf_email
+import time
+from database import init_db
+from mail_queue import queue_email, outbox_status, start_mail_worker, DIGEST_MODE
+from jobs import start_workers, enqueue_job, get_job, warm_up
+from uploads import ingest_upload, UploadRejected, UPLOAD_DIR, MAX_UPLOAD_BYTES, MAX_UPLOAD_SECONDS
+from storage import start_maintenance
+from history import search_logs, page_cursor, snippet_markdown, PAGE_SIZE
+from tracing import stage_percentiles, transcription_rtf, cache_hit_rates
+from reports import totals, daily_stats, caregiver_stats, open_follow_ups, close_follow_up, day_range
 from dotenv import load_dotenv
 
 # Load environment variables (for any non-secret configurations)
@@ -128,14 +131,176 @@ st.markdown("""
 # Initialize database
 init_db()
 
+# Start the background job workers and resume any jobs interrupted by a restart.
+# Whisper itself is only loaded after login, by warm_up().
+start_workers()
+start_mail_worker()
+start_maintenance()
+
 # Ensure required directories exist
-os.makedirs("audio_uploads", exist_ok=True)
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs("summaries", exist_ok=True)
 
+def render_history_page():
+    """Browse and search past care logs. Caregivers see their own logs; admins see everyone's."""
+    st.markdown("<h3 style='margin-bottom: 1rem;'>📚 Care Log History</h3>", unsafe_allow_html=True)
+    
+    is_admin = st.session_state.username == "admin"
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("Search transcripts and summaries", placeholder='e.g. fall, medication refused')
+    with col2:
+        caregiver = st.text_input("Caregiver") if is_admin else st.session_state.username
+    
+    # Keyset cursors for the pages already visited; reset when the search changes
+    search_state = (query, caregiver)
+    if st.session_state.get("history_search") != search_state:
+        st.session_state.history_search = search_state
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+    
+    logs = search_logs(query, caregiver or None, before=cursors[-1])
+    if not logs:
+        st.info("No care logs found.")
+    
+    for log in logs:
+        with st.expander(f"🗓️ {log['timestamp']} — {log['original_filename']} ({log['username']})"):
+            if log.get("snippet"):
+                st.markdown(snippet_markdown(log["snippet"]))
+            st.text_area("Summary", log["summary"], height=200, key=f"history_summary_{log['id']}")
+            st.markdown("**🗒️ Transcript**")
+            st.code(log["transcript"], language='text')
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("◀ Newer", use_container_width=True):
+            cursors.pop()
+            st.experimental_rerun()
+    with col2:
+        if len(logs) == PAGE_SIZE and st.button("Older ▶", use_container_width=True):
+            cursors.append(page_cursor(logs))
+            st.experimental_rerun()
+
+def render_metrics_page():
+    """Per-stage latency percentiles, cache hit rates and transcription speed, for admins."""
+    st.markdown("<h3 style='margin-bottom: 1rem;'>📈 Pipeline Metrics</h3>", unsafe_allow_html=True)
+    
+    window = st.selectbox("Time window", list(METRICS_WINDOWS))
+    since = time.time() - METRICS_WINDOWS[window]
+    
+    rtf = transcription_rtf(since)
+    if rtf:
+        # Real-time factor: seconds spent transcribing per second of audio (lower is faster)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Transcriptions", rtf["count"])
+        col2.metric("RTF p50", f"{rtf['p50']:.2f}")
+        col3.metric("RTF p95", f"{rtf['p95']:.2f}")
+        col4.metric("RTF p99", f"{rtf['p99']:.2f}")
+    
+    caches = cache_hit_rates(since)
+    if caches:
+        # Transcripts and summaries answered from homecare.db instead of Whisper / the LLM
+        st.dataframe(
+            [
+                {
+                    "Stage": cache["name"],
+                    "Lookups": cache["lookups"],
+                    "Cache hits": cache["hits"],
+                    "Hit rate": f"{cache['hits'] / cache['lookups']:.0%}",
+                }
+                for cache in caches
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    stages = stage_percentiles(since)
+    if not stages:
+        st.info("No timings recorded in this window.")
+        return
+    
+    st.dataframe(
+        [
+            {
+                "Stage": stage["name"],
+                "Count": stage["count"],
+                "Errors": stage["errors"],
+                "p50 (ms)": round(stage["p50"] * 1000),
+                "p95 (ms)": round(stage["p95"] * 1000),
+                "p99 (ms)": round(stage["p99"] * 1000),
+            }
+            for stage in sorted(stages, key=lambda stage: stage["p95"], reverse=True)
+        ],
+        use_container_width=True,
+        hide_index=True
+    )
+
+def render_dashboard_page():
+    """Care log activity per day and caregiver, and open follow-ups, for admins."""
+    st.markdown("<h3 style='margin-bottom: 1rem;'>📊 Supervisor Dashboard</h3>", unsafe_allow_html=True)
+    
+    window = st.selectbox("Period", list(DASHBOARD_WINDOWS))
+    start, end = day_range(DASHBOARD_WINDOWS[window])
+    
+    # Everything here reads the precomputed rollups, not care_logs
+    summary = totals(start, end)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Care logs", summary["logs"])
+    col2.metric("Audio minutes", f"{summary['audio_seconds'] / 60:.0f}")
+    col3.metric("Follow-ups still open", summary["open_follow_ups"])
+    
+    days = daily_stats(start, end)
+    if not days:
+        st.info("No care logs in this period.")
+    else:
+        st.bar_chart({day["day"]: day["logs"] for day in days})
+        st.dataframe(
+            [
+                {
+                    "Caregiver": row["username"],
+                    "Logs": row["logs"],
+                    "Audio minutes": round(row["audio_seconds"] / 60, 1),
+                    "Follow-ups": row["follow_ups"],
+                    "Open follow-ups (all time)": row["open_now"],
+                    "Last log": row["last_log_at"],
+                }
+                for row in caregiver_stats(start, end)
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    st.markdown("#### 📌 Open Follow-ups")
+    follow_ups = open_follow_ups()
+    if not follow_ups:
+        st.success("No open follow-ups.")
+    for item in follow_ups:
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            st.markdown(f"**#{item['id']} - {item['username']} - {item['timestamp']}**")
+            st.markdown(item["follow_up_notes"])
+        with col2:
+            if st.button("Mark done", key=f"close_follow_up_{item['id']}"):
+                close_follow_up(item["id"])
+                st.experimental_rerun()
+
 # Login system
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 
+# Background job per upload, so widget reruns don't reprocess the file
+if 'upload_jobs' not in st.session_state:
+    st.session_state.upload_jobs = {}
+MAX_STORED_RESULTS = 5
+POLL_SECONDS = 0.5
+NEW_LOG_PAGE = "📝 New Care Log"
+HISTORY_PAGE = "📚 History"
+METRICS_PAGE = "📈 Metrics"
+DASHBOARD_PAGE = "📊 Dashboard"
+DASHBOARD_WINDOWS = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90}
+METRICS_WINDOWS = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400}
+STAGE_LABELS = ["🎙️ Transcribing audio...", "🧠 Generating summary...", "📄 Creating PDF...", "💾 Saving log..."]
+
 # Predefined users
 USERS = {
     "caregiver1": "password123",
@@ -185,6 +350,9 @@ if not st.session_state.logged_in:
     
     st.markdown("</div></div>", unsafe_allow_html=True)
 else:
+    # Load the transcription, summary and PDF modules (and Whisper) while the user picks a file
+    warm_up()
+    
     # Main app interface
     with st.container():
         # Top bar with user info and logout
@@ -198,135 +366,172 @@ else:
         
         st.markdown("<hr style='border: 1px solid #F0F2F6;'>", unsafe_allow_html=True)
         
-        # Main workflow section
-        col1, col2 = st.columns(2)
+        # Page navigation
+        job = None
+        pages = [NEW_LOG_PAGE, HISTORY_PAGE]
+        if st.session_state.username == "admin":
+            pages.extend([DASHBOARD_PAGE, METRICS_PAGE])
+        page = st.sidebar.radio("Navigate", pages)
         
-        with col1:
-            st.markdown("<h3 style='margin-bottom: 1rem;'>📤 Upload Voice Memo</h3>", unsafe_allow_html=True)
+        if page == HISTORY_PAGE:
+            render_history_page()
+        elif page == DASHBOARD_PAGE:
+            render_dashboard_page()
+        elif page == METRICS_PAGE:
+            render_metrics_page()
+        else:
+            # Main workflow section
+            col1, col2 = st.columns(2)
+        
+            with col1:
+                st.markdown("<h3 style='margin-bottom: 1rem;'>📤 Upload Voice Memo</h3>", unsafe_allow_html=True)
             
-            # Add supported formats info
-            st.markdown("""
-            ℹ️ **Supported Audio Formats:**
-            - `.wav` - Standard audio format
-            - `.mp3` - Compressed audio format
-            - `.m4a` - Common mobile recording format
+                # Add supported formats info
+                st.markdown("""
+                ℹ️ **Supported Audio Formats:**
+                - `.wav` - Standard audio format
+                - `.mp3` - Compressed audio format
+                - `.m4a` - Common mobile recording format
             
-            ⚠️ **Not Supported:**
-            - Video files (`.mov`, `.mp4`)
-            - iOS voice memos (`.m4a` from older iOS versions)
-            - Corrupted or empty files
-            """)
+                ⚠️ **Not Supported:**
+                - Video files (`.mov`, `.mp4`)
+                - iOS voice memos (`.m4a` from older iOS versions)
+                - Corrupted or empty files
+                """)
+                st.caption(f"Up to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB and {MAX_UPLOAD_SECONDS / 60:.0f} minutes per recording.")
             
-            uploaded_file = st.file_uploader("Upload a voice memo", type=["wav", "mp3", "m4a"])
+                uploaded_file = st.file_uploader("Upload a voice memo", type=["wav", "mp3", "m4a"])
             
-            st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("<br>", unsafe_allow_html=True)
             
-            if uploaded_file is not None:
-                try:
-                    # Save uploaded file with proper extension
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    file_extension = os.path.splitext(uploaded_file.name)[1].lower()
-                    file_path = f"audio_uploads/{timestamp}{file_extension}"
-                    
-                    # Ensure the uploads directory exists
-                    os.makedirs("audio_uploads", exist_ok=True)
-                    
-                    # Save the file
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    
-                    # Process audio
-                    with st.spinner("🎙️ Transcribing audio..."):
-                        transcript = transcribe_audio(file_path)
-                        if transcript is None:
-                            st.error("❌ Could not transcribe the audio file. Please try a different file.")
+                # Reruns (typing an email address, clicking a button) look up the job
+                # for this upload; only a newly uploaded file queues new work
+                job = None
+                if uploaded_file is not None:
+                    upload_key = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+                    job_id = st.session_state.upload_jobs.get(upload_key)
+                
+                    if job_id is None:
+                        try:
+                            # Copied to the archive in chunks and checked before any decoding;
+                            # the archived copy is what the background job transcribes
+                            file_path, _ = ingest_upload(uploaded_file, uploaded_file.name, size=uploaded_file.size)
+                        
+                            job_id = enqueue_job(st.session_state.username, uploaded_file.name, file_path)
+                            st.session_state.upload_jobs[upload_key] = job_id
+                        
+                            # Only keep jobs for the last few uploads in this session
+                            while len(st.session_state.upload_jobs) > MAX_STORED_RESULTS:
+                                st.session_state.upload_jobs.pop(next(iter(st.session_state.upload_jobs)))
+                        
+                        except UploadRejected as e:
+                            st.error(f"❌ {str(e)}")
                             st.stop()
-                    
-                    with st.spinner("🧠 Generating summary..."):
-                        summary = summarize_text(transcript)
-                    
-                    # Save files
-                    base_filename = f"care_log_{timestamp}"
-                    txt_path = f"summaries/{base_filename}.txt"
-                    pdf_path = f"summaries/{base_filename}.pdf"
-                    
-                    # Ensure the summaries directory exists
-                    os.makedirs("summaries", exist_ok=True)
-                    
-                    with open(txt_path, "w") as f:
-                        f.write(summary)
-                    
-                    export_to_pdf(summary, base_filename)
-                    
-                    # Log to database
-                    if log_care_summary(
-                        st.session_state.username,
-                        uploaded_file.name,
-                        transcript,
-                        summary,
-                        txt_path,
-                        pdf_path
-                    ):
+                        except Exception as e:
+                            st.error(f"❌ Error processing file: {str(e)}")
+                            st.stop()
+                
+                    job = get_job(job_id)
+            
+                if job is not None:
+                    if job["status"] in ("queued", "running"):
+                        stage = STAGE_LABELS[min(job["stage"], len(STAGE_LABELS) - 1)]
+                        st.progress(job["progress"], text=stage)
+                    elif job["status"] == "failed":
+                        st.error(f"❌ {job['error']}")
+                    elif job["log_saved"]:
                         st.success("✅ Log saved successfully!")
                     else:
                         st.error("❌ Error saving to database")
-                    
-                except Exception as e:
-                    st.error(f"❌ Error processing file: {str(e)}")
-                    st.stop()
         
-        with col2:
-            st.markdown("<h3 style='margin-bottom: 1rem;'>📋 Results</h3>", unsafe_allow_html=True)
-            if uploaded_file is not None:
-                with st.expander("🗒️ Transcript", expanded=True):
-                    st.code(transcript, language='text')
+            with col2:
+                st.markdown("<h3 style='margin-bottom: 1rem;'>📋 Results</h3>", unsafe_allow_html=True)
+                if job is not None and job["status"] in ("queued", "running"):
+                    # Show the transcript as long memos are transcribed chunk by chunk
+                    transcript = job["transcript"] or job["partial_transcript"]
+                    if transcript:
+                        with st.expander("🗒️ Transcript", expanded=True):
+                            st.code(transcript, language='text')
+                
+                    # And the summary as it streams in from the model
+                    if job["partial_summary"]:
+                        with st.expander("🧾 Summary", expanded=True):
+                            st.markdown(job["partial_summary"] + " ▌")
+            
+                elif job is not None and job["status"] == "done":
+                    transcript = job["transcript"]
+                    summary = job["summary"]
+                    base_filename = job["base_filename"]
                 
-                with st.expander("🧾 Summary", expanded=True):
-                    st.text_area("AI-Generated Summary:", summary, height=250)
+                    with st.expander("🗒️ Transcript", expanded=True):
+                        st.code(transcript, language='text')
                 
-                # Download options
-                st.markdown("<h3 style='margin: 1rem 0;'>📄 Download Summary</h3>", unsafe_allow_html=True)
-                col1, col2 = st.columns(2)
-                with col1:
-                    with open(txt_path, "r") as f:
+                    with st.expander("🧾 Summary", expanded=True):
+                        st.text_area("AI-Generated Summary:", summary, height=250)
+                
+                    # Render the PDF in memory once per job; downloads and email reuse the bytes
+                    if st.session_state.get("pdf_job_id") != job["id"]:
+                        from export_pdf import render_pdf
+                        st.session_state.pdf_job_id = job["id"]
+                        st.session_state.pdf_bytes = render_pdf(summary)
+                    pdf_bytes = st.session_state.pdf_bytes
+                    
+                    # Download options
+                    st.markdown("<h3 style='margin: 1rem 0;'>📄 Download Summary</h3>", unsafe_allow_html=True)
+                    col1, col2 = st.columns(2)
+                    with col1:
                         st.download_button(
                             "📥 Download TXT",
-                            f.read(),
+                            summary,
                             file_name=f"{base_filename}.txt",
                             mime="text/plain",
                             use_container_width=True
                         )
-                with col2:
-                    with open(pdf_path, "rb") as f:
+                    with col2:
                         st.download_button(
                             "📥 Download PDF",
-                            f.read(),
+                            pdf_bytes,
                             file_name=f"{base_filename}.pdf",
                             mime="application/pdf",
                             use_container_width=True
                         )
-                
-                # Email section
-                st.markdown("<h3 style='margin: 1rem 0;'>✉️ Email Summary</h3>", unsafe_allow_html=True)
-                recipient_email = st.text_input("Send to email address")
-                if st.button("📩 Send PDF via Email", use_container_width=True):
-                    if recipient_email:
-                        try:
-                            with st.spinner("📧 Sending email..."):
-                                if send_pdf_email(
-                                    recipient_email,
-                                    f"Care Log Summary - {base_filename}",
-                                    f"Please find attached the care log summary for {uploaded_file.name}.",
-                                    pdf_path
-                                ):
-                                    st.success("✅ Email sent successfully!")
-                                else:
-                                    st.error("❌ Failed to send email")
-                        except ValueError as e:
-                            st.error(f"❌ {str(e)}")
-                    else:
-                        st.warning("⚠️ Please enter a recipient email address")
+                    
+                    # Email section
+                    st.markdown("<h3 style='margin: 1rem 0;'>✉️ Email Summary</h3>", unsafe_allow_html=True)
+                    recipient_email = st.text_input("Send to email address")
+                    add_to_digest = DIGEST_MODE == "daily" and st.checkbox("Add to today's digest instead of sending now")
+                    if st.button("📩 Send PDF via Email", use_container_width=True):
+                        if recipient_email:
+                            # The mail worker sends it in the background, so the page doesn't wait on SMTP
+                            st.session_state.outbox_id = queue_email(
+                                recipient_email,
+                                f"Care Log Summary - {base_filename}",
+                                f"Please find attached the care log summary for {job['original_filename']}.",
+                                pdf_bytes,
+                                filename=f"{base_filename}.pdf",
+                                digest=add_to_digest
+                            )
+                        else:
+                            st.warning("⚠️ Please enter a recipient email address")
+                    
+                    if st.session_state.get("outbox_id"):
+                        status = outbox_status(st.session_state.outbox_id)
+                        if status is None:
+                            pass
+                        elif status[0] == "sent":
+                            st.success("✅ Email sent successfully!")
+                        elif status[0] == "failed":
+                            st.error(f"❌ Failed to send email: {status[1]}")
+                        elif add_to_digest:
+                            st.info("🗓️ Added to today's digest")
+                        else:
+                            st.info("📧 Email queued, it will be sent in the background")
 
 # Footer
 st.markdown("<hr style='border: 1px solid #F0F2F6;'>", unsafe_allow_html=True)
-st.markdown("<p style='text-align: center; color: gray;'>© 2025 HomeCare AI. All rights reserved.</p>", unsafe_allow_html=True) 
\ No newline at end of file
+st.markdown("<p style='text-align: center; color: gray;'>© 2025 HomeCare AI. All rights reserved.</p>", unsafe_allow_html=True)
+
+# Poll the background job until it finishes
+if st.session_state.logged_in and job is not None and job["status"] in ("queued", "running"):
+    time.sleep(POLL_SECONDS)
+    st.experimental_rerun() 
\ No newline at end of file
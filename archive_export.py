@@ -0,0 +1,244 @@
+"""
+Stream an audit archive of care logs for a date range.
+
+Builds a ZIP or tar archive on the fly from the care_logs rows: each log's
+transcript, summary, PDF (rendered on the fly if the file is missing) and
+archived audio, plus manifest.csv and manifest.jsonl. Archive bytes are
+yielded as they are produced, so no file is ever held in memory whole. Tar
+archives keep nothing per member; ZIP archives keep each entry's metadata
+(name, size, CRC) for the central directory written at the end, a few
+hundred bytes per file.
+
+    python archive_export.py --from 2025-01-01 --to 2025-01-31 -o january.zip
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from database import init_db
+from export_pdf import render_pdf
+from history import iter_logs
+
+FORMATS = ["zip", "tar", "tar.gz"]
+COPY_CHUNK_BYTES = 1024 * 1024
+
+MANIFEST_FIELDS = [
+    "id", "username", "timestamp", "original_filename",
+    "transcript_file", "summary_file", "pdf_file", "pdf_rendered", "audio_file"
+]
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Write-only, non-seekable sink that collects archive output until drained.
+
+    zipfile and tarfile both support writing to unseekable streams, which is
+    what lets the archive be produced incrementally.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _ZipWriter:
+    def __init__(self, sink, fmt):
+        self.sink = sink
+        self._zip = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+
+    def add_bytes(self, name, data):
+        self._zip.writestr(name, data)
+
+    def iter_add_stream(self, name, src, size, compress=True):
+        """Copy ``src`` into the archive in chunks, yielding output as it is produced."""
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.file_size = size
+        with self._zip.open(info, mode="w") as dst:
+            for block in iter(lambda: src.read(COPY_CHUNK_BYTES), b""):
+                dst.write(block)
+                yield self.sink.drain()
+        yield self.sink.drain()
+
+    def close(self):
+        self._zip.close()
+
+
+class _TarWriter:
+    """
+    Writes tar members' headers, data and padding itself.
+
+    TarFile.addfile copies a whole member in one call and appends every
+    member to TarFile.members; writing them directly streams large files
+    and keeps memory flat however many logs are exported.
+    """
+
+    def __init__(self, sink, fmt):
+        self.sink = sink
+        self._tar = tarfile.open(fileobj=sink, mode="w|gz" if fmt == "tar.gz" else "w|")
+
+    def _write_header(self, name, size):
+        tar = self._tar
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = time.time()
+        header = info.tobuf(tar.format, tar.encoding, tar.errors)
+        tar.fileobj.write(header)
+        tar.offset += len(header)
+
+    def _write_padding(self, size):
+        tar = self._tar
+        blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+        if remainder:
+            tar.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks += 1
+        tar.offset += blocks * tarfile.BLOCKSIZE
+
+    def add_bytes(self, name, data):
+        self._write_header(name, len(data))
+        self._tar.fileobj.write(data)
+        self._write_padding(len(data))
+
+    def iter_add_stream(self, name, src, size, compress=True):
+        """Copy ``src`` into the archive in chunks, yielding output as it is produced."""
+        self._write_header(name, size)
+        remaining = size
+        while remaining:
+            block = src.read(min(COPY_CHUNK_BYTES, remaining))
+            if not block:
+                raise OSError(f"{name} ended before its expected size")
+            self._tar.fileobj.write(block)
+            remaining -= len(block)
+            yield self.sink.drain()
+        self._write_padding(size)
+        yield self.sink.drain()
+
+    def close(self):
+        self._tar.close()
+
+
+def _entry_prefix(log):
+    day = str(log["timestamp"])[:10]
+    return f"{log['username']}/{day}_{log['id']}"
+
+
+def stream_archive(start, end, username=None, fmt="zip", include_audio=True):
+    """
+    Yield the bytes of an archive of every care log in the date range.
+
+    Args:
+        start (str): First day, YYYY-MM-DD
+        end (str): Last day (inclusive), YYYY-MM-DD
+        username (str): Only this caregiver's logs (None for all)
+        fmt (str): "zip", "tar" or "tar.gz"
+        include_audio (bool): Include the archived voice memos
+
+    Yields:
+        bytes: Consecutive pieces of the archive
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported archive format: {fmt}")
+
+    sink = _StreamBuffer()
+    writer = (_ZipWriter if fmt == "zip" else _TarWriter)(sink, fmt)
+
+    # Manifest rows are spooled (to disk past 1 MB) and streamed in as the last entries
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as csv_spool, \
+            tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as jsonl_spool:
+        csv_spool.write(_csv_line(MANIFEST_FIELDS))
+
+        for log in iter_logs(start, end, username):
+            prefix = _entry_prefix(log)
+            row = {
+                "id": log["id"],
+                "username": log["username"],
+                "timestamp": log["timestamp"],
+                "original_filename": log["original_filename"],
+                "transcript_file": f"{prefix}/transcript.txt",
+                "summary_file": f"{prefix}/summary.txt",
+                "pdf_file": f"{prefix}/care_log.pdf",
+                "pdf_rendered": False,
+                "audio_file": "",
+            }
+
+            writer.add_bytes(row["transcript_file"], log["transcript"].encode("utf-8"))
+            writer.add_bytes(row["summary_file"], log["summary"].encode("utf-8"))
+
+            if log["pdf_path"] and os.path.exists(log["pdf_path"]):
+                with open(log["pdf_path"], "rb") as src:
+                    yield from writer.iter_add_stream(row["pdf_file"], src, os.path.getsize(log["pdf_path"]))
+            else:
+                writer.add_bytes(row["pdf_file"], render_pdf(log["summary"]))
+                row["pdf_rendered"] = True
+            yield sink.drain()
+
+            audio_path = log.get("audio_path")
+            if include_audio and audio_path and os.path.exists(audio_path):
+                row["audio_file"] = f"{prefix}/audio{os.path.splitext(audio_path)[1]}"
+                # Audio is already compressed, so it is stored as is
+                with open(audio_path, "rb") as src:
+                    yield from writer.iter_add_stream(row["audio_file"], src, os.path.getsize(audio_path), compress=False)
+
+            csv_spool.write(_csv_line([row[field] for field in MANIFEST_FIELDS]))
+            jsonl_spool.write((json.dumps(row) + "\n").encode("utf-8"))
+
+        for name, spool in [("manifest.csv", csv_spool), ("manifest.jsonl", jsonl_spool)]:
+            size = spool.tell()
+            spool.seek(0)
+            yield from writer.iter_add_stream(name, spool, size)
+
+    writer.close()
+    yield sink.drain()
+
+
+def _csv_line(values):
+    line = io.StringIO()
+    csv.writer(line).writerow(values)
+    return line.getvalue().encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export care logs for a date range as a ZIP or tar archive")
+    parser.add_argument("--from", dest="start", required=True, help="First day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", required=True, help="Last day, YYYY-MM-DD")
+    parser.add_argument("--user", help="Only this caregiver's logs")
+    parser.add_argument("--format", choices=FORMATS, default="zip")
+    parser.add_argument("--no-audio", action="store_true", help="Leave out the voice memos")
+    parser.add_argument("-o", "--output", required=True, help="Archive path, or - for stdout")
+    args = parser.parse_args()
+
+    init_db()
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for piece in stream_archive(args.start, args.end, args.user, args.format, not args.no_audio):
+            if piece:
+                out.write(piece)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
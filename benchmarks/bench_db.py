@@ -0,0 +1,88 @@
+"""
+Insert throughput of care_logs under concurrent writers.
+
+Compares the old access pattern (a new connection, default journaling and a
+commit per insert) with the WAL connection pool and batching writer thread
+in database.py. Each run uses a fresh database in a temp directory.
+
+    python benchmarks/bench_db.py --writers 1 4 16 --rows 500
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+ROW = ("caregiver1", "memo.m4a", "Transcript text " * 40, "Summary text " * 40, "summaries/x.txt", "summaries/x.pdf")
+
+
+def insert_per_connection(path):
+    """The pre-pool pattern: connect, insert, commit and close for every row."""
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute('''
+            INSERT INTO care_logs
+            (username, original_filename, transcript, summary, txt_path, pdf_path)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', ROW)
+        conn.commit()
+        conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def insert_with_writer(path):
+    return database.log_care_summary(*ROW)
+
+
+def run(insert, writers, rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        database.DB_PATH = path
+        database.init_db()
+        if insert is insert_per_connection:
+            # Start from the default rollback journal, as the old code did
+            conn = sqlite3.connect(path)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.close()
+
+        failures = []
+
+        def worker():
+            failed = sum(1 for _ in range(rows) if not insert(path))
+            failures.append(failed)
+
+        threads = [threading.Thread(target=worker) for _ in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        total = writers * rows
+        return total / elapsed, sum(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 4, 16], help="Concurrent writer threads")
+    parser.add_argument("--rows", type=int, default=500, help="Inserts per writer")
+    args = parser.parse_args()
+
+    print(f"{'writers':>8} {'mode':>16} {'rows/s':>10} {'failed':>8}")
+    for writers in args.writers:
+        for name, insert in [("per-connection", insert_per_connection), ("batched writer", insert_with_writer)]:
+            rate, failed = run(insert, writers, args.rows)
+            print(f"{writers:>8} {name:>16} {rate:>10.0f} {failed:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+End-to-end pipeline benchmark on synthetic audio.
+
+Generates speech-like test memos (voiced syllables with a moving pitch,
+pauses and background noise) in each requested length and format, then runs
+the real transcribe_audio -> summarize_text -> export_to_pdf ->
+log_care_summary path at each concurrency level, with the offline stub
+summarizer standing in for the LLM. Every run uses a fresh database and
+working directory, and every memo is unique so caches don't flatter the
+numbers.
+
+    python benchmarks/bench_pipeline.py --seconds 30 120 --formats wav mp3 m4a \\
+        --concurrency 1 2 4 --requests 8 --output before.json
+    python benchmarks/bench_pipeline.py --compare before.json after.json
+
+Needs ffmpeg on the PATH and the Whisper model configured by HOMECARE_WHISPER_MODEL.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# The stub backend must be selected before summarize.py reads the setting
+os.environ.setdefault("HOMECARE_SUMMARIZER", "stub")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database
+from export_pdf import export_to_pdf
+from model_pool import get_pool, DEFAULT_MODEL
+from summarize import summarize_text
+from transcribe import transcribe_audio, SAMPLE_RATE
+
+STAGES = ["transcribe", "summarize", "export", "log"]
+
+# ffmpeg encoder settings per format
+ENCODERS = {
+    "wav": [],
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "64k"],
+    "m4a": ["-c:a", "aac", "-b:a", "64k"],
+}
+
+
+def synthetic_speech(seconds, seed):
+    """
+    Return float32 samples that look like speech to a VAD or ASR front end.
+
+    Syllables of 120-300 ms carry a harmonic series on a drifting pitch with
+    formant-like emphasis, grouped into phrases separated by short pauses,
+    over low-level noise.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SAMPLE_RATE)
+    audio = rng.normal(0, 0.003, total).astype(np.float32)
+
+    position = 0
+    while position < total:
+        # A phrase of 3-10 syllables, then a 200-800 ms pause
+        for _ in range(rng.integers(3, 11)):
+            length = int(rng.uniform(0.12, 0.30) * SAMPLE_RATE)
+            if position + length > total:
+                break
+            t = np.arange(length) / SAMPLE_RATE
+            f0 = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(1, 4) * t))
+            phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+            formants = rng.uniform([300, 900, 2200], [900, 2200, 3200])
+            syllable = np.zeros(length)
+            for harmonic in range(1, 16):
+                frequency = f0 * harmonic
+                gain = sum(np.exp(-((frequency - formant) / 250) ** 2) for formant in formants) + 0.05
+                syllable += gain * np.sin(harmonic * phase) / harmonic
+            envelope = np.sin(np.pi * np.arange(length) / length) ** 2
+            audio[position:position + length] += (0.3 * envelope * syllable / np.abs(syllable).max()).astype(np.float32)
+            position += length + int(rng.uniform(0.02, 0.08) * SAMPLE_RATE)
+        position += int(rng.uniform(0.2, 0.8) * SAMPLE_RATE)
+
+    return np.clip(audio, -1, 1)
+
+
+def write_memo(path, seconds, fmt, seed):
+    """Write one synthetic memo to ``path`` in the given format."""
+    samples = (synthetic_speech(seconds, seed) * 32767).astype(np.int16)
+    wav_path = path if fmt == "wav" else path + ".wav"
+    with wave.open(wav_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+    if fmt != "wav":
+        subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-i", wav_path, *ENCODERS[fmt], path],
+            check=True
+        )
+        os.remove(wav_path)
+
+
+class PeakRss:
+    """Sample this process's resident set size in the background and keep the peak."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        while not self._stop.is_set():
+            with open("/proc/self/statm") as f:
+                self.peak = max(self.peak, int(f.read().split()[1]) * page_size)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.exists("/proc/self/statm"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if not self.peak:
+            # ru_maxrss is the lifetime peak (KiB on Linux, bytes on macOS)
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    pick = lambda fraction: values[max(0, int(np.ceil(fraction * len(values))) - 1)]
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def process_memo(path):
+    """Run one memo through the pipeline and return the time spent in each stage."""
+    timings = {}
+    start = time.perf_counter()
+    transcript = transcribe_audio(path)
+    if transcript is None:
+        raise RuntimeError(f"Transcription failed for {path}")
+    timings["transcribe"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summary = summarize_text(transcript)
+    timings["summarize"] = time.perf_counter() - start
+
+    base_filename = os.path.splitext(os.path.basename(path))[0]
+    start = time.perf_counter()
+    export_to_pdf(summary, base_filename)
+    timings["export"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if not database.log_care_summary(
+        "benchmark", os.path.basename(path), transcript, summary,
+        f"summaries/{base_filename}.txt", f"summaries/{base_filename}.pdf", path
+    ):
+        raise RuntimeError("Could not save the care log")
+    timings["log"] = time.perf_counter() - start
+    return timings
+
+
+def run_level(seconds, fmt, concurrency, requests, seed):
+    """Benchmark ``requests`` unique memos at one concurrency level in a fresh workspace."""
+    with tempfile.TemporaryDirectory() as tmp:
+        previous_cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            database.DB_PATH = os.path.join(tmp, "bench.db")
+            database.init_db()
+
+            paths = []
+            for index in range(requests):
+                path = os.path.join(tmp, f"memo_{index}.{fmt}")
+                write_memo(path, seconds, fmt, seed + index)
+                paths.append(path)
+
+            latencies = []
+            stage_times = {stage: [] for stage in STAGES}
+            failures = 0
+
+            def timed(path):
+                start = time.perf_counter()
+                timings = process_memo(path)
+                return time.perf_counter() - start, timings
+
+            with PeakRss() as rss, ThreadPoolExecutor(max_workers=concurrency) as executor:
+                start = time.perf_counter()
+                for future in [executor.submit(timed, path) for path in paths]:
+                    try:
+                        latency, timings = future.result()
+                    except Exception as e:
+                        print(f"  request failed: {e}", file=sys.stderr)
+                        failures += 1
+                        continue
+                    latencies.append(latency)
+                    for stage, value in timings.items():
+                        stage_times[stage].append(value)
+                elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(previous_cwd)
+
+    completed = len(latencies)
+    return {
+        "seconds": seconds,
+        "format": fmt,
+        "concurrency": concurrency,
+        "requests": requests,
+        "failures": failures,
+        "wall_seconds": elapsed,
+        "memos_per_minute": 60 * completed / elapsed,
+        "audio_seconds_per_second": completed * seconds / elapsed,
+        "latency": percentiles(latencies),
+        "stages": {stage: percentiles(values) for stage, values in stage_times.items()},
+        "peak_rss_mb": rss.peak / (1024 * 1024),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "whisper_model": DEFAULT_MODEL,
+        "summarizer": os.environ["HOMECARE_SUMMARIZER"],
+    }
+
+
+def compare(baseline_path, current_path, threshold):
+    """Print throughput and p95 latency changes; return True if anything regressed past ``threshold``."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+
+    key = lambda result: (result["seconds"], result["format"], result["concurrency"])
+    before = {key(result): result for result in baseline["results"]}
+
+    regressed = False
+    print(f"{'len':>6} {'fmt':>4} {'conc':>4} {'memos/min':>22} {'p95 latency (s)':>24}")
+    for result in current["results"]:
+        old = before.get(key(result))
+        if old is None or not old["memos_per_minute"] or not old["latency"]["p95"] or not result["latency"]["p95"]:
+            continue
+        throughput_change = result["memos_per_minute"] / old["memos_per_minute"] - 1
+        p95_change = result["latency"]["p95"] / old["latency"]["p95"] - 1
+        flag = ""
+        if throughput_change < -threshold or p95_change > threshold:
+            regressed = True
+            flag = "  REGRESSION"
+        print(
+            f"{result['seconds']:>6} {result['format']:>4} {result['concurrency']:>4} "
+            f"{old['memos_per_minute']:>8.1f} -> {result['memos_per_minute']:>6.1f} ({throughput_change:+.0%}) "
+            f"{old['latency']['p95']:>7.2f} -> {result['latency']['p95']:>6.2f} ({p95_change:+.0%}){flag}"
+        )
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, nargs="+", default=[30], help="Memo lengths in seconds")
+    parser.add_argument("--formats", nargs="+", choices=list(ENCODERS), default=["wav"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4], help="Concurrent requests")
+    parser.add_argument("--requests", type=int, default=8, help="Memos per concurrency level")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic audio")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    start = time.perf_counter()
+    get_pool().warm()
+    print(f"Loaded Whisper '{DEFAULT_MODEL}' in {time.perf_counter() - start:.1f}s")
+
+    results = []
+    print(f"{'len':>6} {'fmt':>4} {'conc':>4} {'memos/min':>10} {'audio x':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'rss MB':>7}")
+    for seconds in args.seconds:
+        for fmt in args.formats:
+            for concurrency in args.concurrency:
+                result = run_level(seconds, fmt, concurrency, args.requests, args.seed)
+                results.append(result)
+                latency = result["latency"]
+                print(
+                    f"{seconds:>6g} {fmt:>4} {concurrency:>4} {result['memos_per_minute']:>10.1f} "
+                    f"{result['audio_seconds_per_second']:>8.1f} {latency['p50'] or 0:>7.2f} "
+                    f"{latency['p95'] or 0:>7.2f} {latency['p99'] or 0:>7.2f} {result['peak_rss_mb']:>7.0f}"
+                )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "args": vars(args), "results": results}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
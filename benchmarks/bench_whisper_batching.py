@@ -0,0 +1,120 @@
+"""
+Throughput and latency of cross-request Whisper batching.
+
+Sends --requests transcriptions from --concurrency threads through a
+WhisperBatcher at every max batch size / max wait combination, and reports
+audio seconds transcribed per wall-clock second next to per-request latency.
+Batch size 1 is the unbatched baseline; "added p50" is how much longer a
+request takes than there: the batching wait it pays, minus the queueing it
+saves when requests pile up (so it can be negative).
+
+Recordings come from --data (audio files, references not needed) or are
+spoken with espeak-ng, as in bench_whisper_profiles.py.
+
+    python benchmarks/bench_whisper_batching.py --batch-sizes 1 4 8 --wait-ms 20 50 100 \\
+        --concurrency 8 --requests 32 --output batching.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_whisper_profiles import AUDIO_EXTENSIONS, synthesize_dataset
+from model_pool import get_pool, set_thread_budget, DEFAULT_MODEL
+from tracing import percentile
+from transcribe import decode_audio, split_on_silence, SAMPLE_RATE, BATCH_WINDOW_SECONDS, MIN_BATCH_WINDOW_SECONDS
+from whisper_batcher import WhisperBatcher
+
+
+def load_recordings(folder):
+    return [
+        os.path.join(folder, name) for name in sorted(os.listdir(folder))
+        if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+    ]
+
+
+def run_setting(batch_size, wait_ms, recordings, concurrency, requests):
+    batcher = WhisperBatcher(batch_size, wait_ms)
+    # One untimed request so thread start-up isn't counted
+    batcher.transcribe_windows(recordings[0])
+
+    def request(index):
+        windows = recordings[index % len(recordings)]
+        start = time.perf_counter()
+        batcher.transcribe_windows(windows)
+        return time.perf_counter() - start, sum(len(window) for window in windows) / SAMPLE_RATE
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(request, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    stats = batcher.stats()
+    return {
+        "batch_size": batch_size,
+        "wait_ms": wait_ms,
+        "wall_seconds": wall,
+        "audio_per_second": sum(seconds for _, seconds in results) / wall,
+        "requests_per_second": requests / wall,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        # The warm-up request is in the batcher's counters too; it barely moves the means
+        "mean_batch_size": stats["mean_batch_size"],
+        "mean_queue_wait": stats["mean_wait"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="Folder of audio files")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[25, 50, 100])
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per setting")
+    parser.add_argument("--threads", type=int, help="Torch thread budget")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = load_recordings(args.data) if args.data else [path for path, _ in synthesize_dataset(tmp)]
+        if not paths:
+            sys.exit("No recordings found")
+        recordings = [
+            list(split_on_silence([decode_audio(path)], MIN_BATCH_WINDOW_SECONDS, BATCH_WINDOW_SECONDS))
+            for path in paths
+        ]
+
+    set_thread_budget(args.threads)
+    get_pool().warm()
+    windows = sum(len(windows) for windows in recordings)
+    print(f"Whisper {DEFAULT_MODEL}: {len(recordings)} recordings ({windows} windows), "
+          f"{args.requests} requests, {args.concurrency} in flight\n")
+    print(f"{'batch':>5} {'wait ms':>7} {'audio s/s':>9} {'req/s':>6} {'p50 s':>6} {'p95 s':>6} {'added p50':>9} {'mean batch':>10} {'queue ms':>8}")
+
+    settings = [(1, 0)] + [(size, wait) for size in args.batch_sizes if size > 1 for wait in args.wait_ms]
+    results = []
+    for batch_size, wait_ms in settings:
+        result = run_setting(batch_size, wait_ms, recordings, args.concurrency, args.requests)
+        result["added_p50"] = result["latency_p50"] - results[0]["latency_p50"] if results else 0.0
+        results.append(result)
+        print(
+            f"{batch_size:>5} {wait_ms:>7.0f} {result['audio_per_second']:>9.1f} {result['requests_per_second']:>6.2f} "
+            f"{result['latency_p50']:>6.2f} {result['latency_p95']:>6.2f} {result['added_p50']:>+9.2f} "
+            f"{result['mean_batch_size']:>10.1f} {result['mean_queue_wait'] * 1000:>8.0f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"model": DEFAULT_MODEL, "concurrency": args.concurrency, "results": results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
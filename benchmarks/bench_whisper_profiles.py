@@ -0,0 +1,165 @@
+"""
+Accuracy and speed of the Whisper inference profiles on CPU.
+
+Transcribes a set of recordings with every profile in model_pool.PROFILES
+(or the ones named) at each torch thread budget, and reports word error
+rate against reference transcripts, the real-time factor (seconds of
+compute per second of audio) and model load time.
+
+Recordings come from --data, a folder of audio files each with a .txt
+reference of the same name. Without --data, a small set of care-log
+sentences is spoken with espeak-ng, which is enough to compare profiles
+against each other but not to quote absolute accuracy.
+
+    python benchmarks/bench_whisper_profiles.py --data samples/ --threads 2 4 --output profiles.json
+"""
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from model_pool import PROFILES, load_whisper_model, set_thread_budget
+from transcribe import decode_audio, SAMPLE_RATE
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a")
+
+SENTENCES = [
+    "Visited Mrs Thompson at nine this morning. She was alert and in good spirits.",
+    "Blood pressure was one hundred thirty over eighty five and her pulse was seventy two.",
+    "She took her morning medication with breakfast and reported mild pain in her left knee.",
+    "I helped her with a shower and changed the dressing on her right ankle. The wound is healing well.",
+    "She refused her afternoon walk because she felt tired. I encouraged fluids and she drank two glasses of water.",
+    "Her daughter called to ask about the appointment with the cardiologist next Tuesday.",
+    "Please follow up with the pharmacy about the refill for her blood thinner before Friday.",
+    "No falls or new bruising today. She was resting comfortably in her chair when I left.",
+]
+
+
+def normalize(text):
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """Return (edit distance in words, number of reference words)."""
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def load_dataset(folder):
+    """Return (audio path, reference text) pairs from ``folder``."""
+    samples = []
+    for name in sorted(os.listdir(folder)):
+        base, ext = os.path.splitext(name)
+        reference = os.path.join(folder, base + ".txt")
+        if ext.lower() in AUDIO_EXTENSIONS and os.path.exists(reference):
+            with open(reference) as f:
+                samples.append((os.path.join(folder, name), f.read().strip()))
+    return samples
+
+
+def synthesize_dataset(folder):
+    """Speak SENTENCES with espeak-ng into ``folder`` and return the dataset."""
+    espeak = shutil.which("espeak-ng") or shutil.which("espeak")
+    if espeak is None:
+        sys.exit("No --data folder given and espeak-ng is not installed to synthesize one")
+    samples = []
+    for index, sentence in enumerate(SENTENCES):
+        path = os.path.join(folder, f"sentence_{index}.wav")
+        subprocess.run([espeak, "-s", "150", "-w", path, sentence], check=True)
+        samples.append((path, sentence))
+    return samples
+
+
+def run_profile(name, profile, threads, dataset):
+    set_thread_budget(threads)
+    start = time.perf_counter()
+    model = load_whisper_model(profile["model"], "cpu", profile["precision"])
+    load_seconds = time.perf_counter() - start
+
+    options = {"fp16": False}
+    if profile["language"]:
+        options["language"] = profile["language"]
+    if profile["beam_size"]:
+        options["beam_size"] = profile["beam_size"]
+
+    errors = words = 0
+    compute = audio_seconds = 0.0
+    rtfs = []
+    for audio, reference in dataset:
+        start = time.perf_counter()
+        text = model.transcribe(audio, **options)["text"]
+        elapsed = time.perf_counter() - start
+        seconds = len(audio) / SAMPLE_RATE
+
+        file_errors, file_words = word_errors(reference, text)
+        errors += file_errors
+        words += file_words
+        compute += elapsed
+        audio_seconds += seconds
+        rtfs.append(elapsed / seconds)
+
+    rtfs.sort()
+    return {
+        "profile": name,
+        **profile,
+        "threads": threads,
+        "load_seconds": load_seconds,
+        "wer": errors / max(1, words),
+        "rtf": compute / audio_seconds,
+        "rtf_p95": rtfs[max(0, math.ceil(0.95 * len(rtfs)) - 1)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", help="Folder of audio files with .txt references")
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1], help="Torch thread budgets to try")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = load_dataset(args.data) if args.data else synthesize_dataset(tmp)
+        if not files:
+            sys.exit("No recordings with references found")
+        # Decode once up front so ffmpeg time isn't counted against the model
+        dataset = [(decode_audio(path), reference) for path, reference in files]
+
+    total_audio = sum(len(audio) for audio, _ in dataset) / SAMPLE_RATE
+    print(f"{len(dataset)} recordings, {total_audio:.0f}s of audio\n")
+    print(f"{'profile':>14} {'model':>6} {'prec':>5} {'lang':>5} {'beam':>5} {'thr':>4} {'load s':>7} {'WER':>6} {'RTF':>6} {'RTF p95':>8}")
+
+    results = []
+    for name in args.profiles:
+        for threads in args.threads:
+            result = run_profile(name, PROFILES[name], threads, dataset)
+            results.append(result)
+            print(
+                f"{name:>14} {result['model']:>6} {result['precision']:>5} {result['language'] or 'auto':>5} "
+                f"{result['beam_size'] or 'greedy':>5} {threads:>4} {result['load_seconds']:>7.1f} "
+                f"{result['wer']:>6.1%} {result['rtf']:>6.3f} {result['rtf_p95']:>8.3f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"recordings": len(dataset), "audio_seconds": total_audio, "results": results}, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
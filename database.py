@@ -1,11 +1,142 @@
+import os
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future
 from datetime import datetime
+from sections import SECTIONS, parse_sections, needs_follow_up
+from tracing import traced, record_error
 
-def init_db():
-    """Initialize the SQLite database and create the care_logs table if it doesn't exist."""
-    conn = sqlite3.connect('homecare.db')
-    c = conn.cursor()
-    
+DB_PATH = 'homecare.db'
+
+# Applied to every connection. WAL lets readers run alongside the single writer.
+PRAGMAS = [
+    # Must come before WAL to apply to a new database; existing databases
+    # switch with `python storage.py maintain --full-vacuum`
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+]
+
+# The writer thread commits everything queued so far, up to this many writes, in one transaction
+WRITE_BATCH_SIZE = 256
+
+_local = threading.local()
+
+
+def _connect(path=None):
+    conn = sqlite3.connect(path or DB_PATH, isolation_level=None, check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection():
+    """
+    Return this thread's persistent connection to the HomeCare database.
+
+    Connections are opened once per thread (and again after a fork) and
+    kept for the life of the process, so callers must not close them.
+    Use it for reads; send writes through execute_write/run_in_writer.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid() or _local.path != DB_PATH:
+        conn = _local.conn = _connect()
+        _local.pid = os.getpid()
+        _local.path = DB_PATH
+    return conn
+
+
+class DatabaseWriter:
+    """
+    Single thread that owns all writes to the database.
+
+    Queued writes are grouped into one transaction per batch, which is far
+    cheaper than a commit per row and avoids "database is locked" errors
+    between concurrent sessions. Each write runs in its own savepoint, so a
+    failing statement only fails its own Future.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or DB_PATH
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, work):
+        """Queue ``work`` (a callable taking the connection) and return a Future for its result."""
+        future = Future()
+        self._queue.put((work, future))
+        return future
+
+    def _next_batch(self):
+        # Block for the first write, then take whatever else queued up meanwhile.
+        # Writes that arrive during a commit are grouped into the next one.
+        batch = [self._queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = _connect(self.path)
+        while True:
+            batch = self._next_batch()
+            results = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for work, future in batch:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        results.append((future, work(conn), None))
+                        conn.execute("RELEASE write")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO write")
+                        conn.execute("RELEASE write")
+                        results.append((future, None, e))
+                conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                results = [(future, None, e) for _, future in batch]
+
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Return the process-wide writer, starting its thread on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.path != DB_PATH or not _writer._thread.is_alive():
+            _writer = DatabaseWriter()
+        return _writer
+
+
+def run_in_writer(work):
+    """Run ``work(conn)`` on the writer thread; returns a Future for its result."""
+    return get_writer().submit(work)
+
+
+def execute_write(sql, params=()):
+    """Queue one write statement; the Future resolves to its cursor (lastrowid, rowcount)."""
+    return run_in_writer(lambda conn: conn.execute(sql, params))
+
+
+def _create_care_logs(c):
     c.execute('''
         CREATE TABLE IF NOT EXISTS care_logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -18,14 +149,371 @@ def init_db():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
-    conn.commit()
-    conn.close()
 
-def log_care_summary(username, filename, transcript, summary, txt_path, pdf_path):
+
+def _create_jobs(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            original_filename TEXT NOT NULL,
+            audio_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            stage INTEGER NOT NULL DEFAULT 0,
+            progress REAL NOT NULL DEFAULT 0,
+            partial_transcript TEXT,
+            partial_summary TEXT,
+            transcript TEXT,
+            summary TEXT,
+            base_filename TEXT,
+            txt_path TEXT,
+            pdf_path TEXT,
+            log_saved INTEGER,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Databases that already had a jobs table may predate streamed summaries
+    columns = [row[1] for row in c.execute('PRAGMA table_info(jobs)')]
+    if 'partial_summary' not in columns:
+        c.execute('ALTER TABLE jobs ADD COLUMN partial_summary TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+
+
+def _add_care_log_audio_path(c):
+    c.execute('ALTER TABLE care_logs ADD COLUMN audio_path TEXT')
+
+
+def create_cache_table(c, table):
+    """Create a ResultCache table and its LRU index."""
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+    ''')
+    c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_last_access ON {table} (last_access)')
+
+
+def _create_caches(c):
+    create_cache_table(c, 'transcript_cache')
+    create_cache_table(c, 'summary_cache')
+
+
+def _add_history_indexes(c):
+    c.execute('CREATE INDEX IF NOT EXISTS idx_care_logs_user_timestamp ON care_logs (username, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_care_logs_timestamp ON care_logs (timestamp)')
+
+    # Full-text index over transcripts and summaries, kept in sync by triggers
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS care_logs_fts USING fts5(
+            transcript, summary,
+            content='care_logs', content_rowid='id',
+            tokenize='porter unicode61'
+        )
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS care_logs_fts_insert AFTER INSERT ON care_logs BEGIN
+            INSERT INTO care_logs_fts (rowid, transcript, summary) VALUES (new.id, new.transcript, new.summary);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS care_logs_fts_delete AFTER DELETE ON care_logs BEGIN
+            INSERT INTO care_logs_fts (care_logs_fts, rowid, transcript, summary) VALUES ('delete', old.id, old.transcript, old.summary);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS care_logs_fts_update AFTER UPDATE OF transcript, summary ON care_logs BEGIN
+            INSERT INTO care_logs_fts (care_logs_fts, rowid, transcript, summary) VALUES ('delete', old.id, old.transcript, old.summary);
+            INSERT INTO care_logs_fts (rowid, transcript, summary) VALUES (new.id, new.transcript, new.summary);
+        END
+    ''')
+    # Index the logs already in the database
+    c.execute("INSERT INTO care_logs_fts (care_logs_fts) VALUES ('rebuild')")
+
+
+def _create_outbox(c):
+    # Outbound email queue drained by mail_queue.MailWorker
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            attachment BLOB,
+            attachment_name TEXT,
+            digest INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status_next ON outbox (status, next_attempt_at)')
+
+
+def _create_metrics(c):
+    # Timing spans written by tracing.py
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trace_id TEXT NOT NULL,
+            span_id TEXT NOT NULL,
+            parent_id TEXT,
+            name TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            duration REAL NOT NULL,
+            error TEXT,
+            attributes TEXT
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_metrics_name_started ON metrics (name, started_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_metrics_started ON metrics (started_at)')
+
+
+def _create_ingest_files(c):
+    # Per-file checkpoints of `python ingest.py` bulk imports
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_path TEXT NOT NULL UNIQUE,
+            username TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            stage INTEGER NOT NULL DEFAULT 0,
+            audio_path TEXT,
+            audio_seconds REAL,
+            transcript TEXT,
+            summary TEXT,
+            txt_path TEXT,
+            pdf_path TEXT,
+            error TEXT,
+            updated_at REAL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ingest_files_status ON ingest_files (status)')
+
+
+def section_values(summary):
+    """Values for SECTION_COLUMNS, parsed from ``summary``."""
+    parsed = parse_sections(summary)
+    open_follow_up = int(needs_follow_up(parsed["follow_up_notes"]))
+    return (*(parsed[column] for column, _ in SECTIONS), open_follow_up, open_follow_up)
+
+
+SECTION_COLUMNS = [column for column, _ in SECTIONS] + ["has_follow_up", "follow_up_open"]
+_INSERT_SECTIONS = f'''
+    INSERT INTO care_log_sections (log_id, {', '.join(SECTION_COLUMNS)})
+    VALUES ({', '.join('?' for _ in range(len(SECTION_COLUMNS) + 1))})
+'''
+
+
+def rebuild_rollups(c):
+    """Recompute the daily and per-caregiver rollups from care_logs and care_log_sections."""
+    c.execute('DELETE FROM caregiver_daily_stats')
+    c.execute('DELETE FROM caregiver_stats')
+    c.execute('''
+        INSERT INTO caregiver_daily_stats (day, username, logs, audio_seconds, follow_ups, open_follow_ups)
+        SELECT date(l.timestamp), l.username, COUNT(*), coalesce(SUM(l.audio_seconds), 0),
+               coalesce(SUM(s.has_follow_up), 0), coalesce(SUM(s.follow_up_open), 0)
+        FROM care_logs l LEFT JOIN care_log_sections s ON s.log_id = l.id
+        GROUP BY date(l.timestamp), l.username
+    ''')
+    c.execute('''
+        INSERT INTO caregiver_stats (username, logs, audio_seconds, follow_ups, open_follow_ups, last_log_at)
+        SELECT username, SUM(logs), SUM(audio_seconds), SUM(follow_ups), SUM(open_follow_ups),
+               (SELECT max(timestamp) FROM care_logs WHERE care_logs.username = d.username)
+        FROM caregiver_daily_stats d
+        GROUP BY username
+    ''')
+
+
+def _create_sections_and_rollups(c):
+    c.execute('ALTER TABLE care_logs ADD COLUMN audio_seconds REAL')
+
+    # The summary's four sections, parsed once when the log is saved (see sections.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS care_log_sections (
+            log_id INTEGER PRIMARY KEY REFERENCES care_logs (id) ON DELETE CASCADE,
+            patient_status TEXT,
+            key_observations TEXT,
+            actions_taken TEXT,
+            follow_up_notes TEXT,
+            has_follow_up INTEGER NOT NULL DEFAULT 0,
+            follow_up_open INTEGER NOT NULL DEFAULT 0,
+            follow_up_closed_at DATETIME
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_care_log_sections_open ON care_log_sections (follow_up_open) WHERE follow_up_open = 1')
+
+    # Rollups for the dashboard, kept up to date by the triggers below
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS caregiver_daily_stats (
+            day TEXT NOT NULL,
+            username TEXT NOT NULL,
+            logs INTEGER NOT NULL DEFAULT 0,
+            audio_seconds REAL NOT NULL DEFAULT 0,
+            follow_ups INTEGER NOT NULL DEFAULT 0,
+            open_follow_ups INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, username)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS caregiver_stats (
+            username TEXT PRIMARY KEY,
+            logs INTEGER NOT NULL DEFAULT 0,
+            audio_seconds REAL NOT NULL DEFAULT 0,
+            follow_ups INTEGER NOT NULL DEFAULT 0,
+            open_follow_ups INTEGER NOT NULL DEFAULT 0,
+            last_log_at DATETIME
+        )
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS care_logs_rollup_insert AFTER INSERT ON care_logs BEGIN
+            INSERT INTO caregiver_daily_stats (day, username, logs, audio_seconds)
+            VALUES (date(new.timestamp), new.username, 1, coalesce(new.audio_seconds, 0))
+            ON CONFLICT (day, username) DO UPDATE SET
+                logs = logs + 1, audio_seconds = audio_seconds + excluded.audio_seconds;
+            INSERT INTO caregiver_stats (username, logs, audio_seconds, last_log_at)
+            VALUES (new.username, 1, coalesce(new.audio_seconds, 0), new.timestamp)
+            ON CONFLICT (username) DO UPDATE SET
+                logs = logs + 1, audio_seconds = audio_seconds + excluded.audio_seconds,
+                last_log_at = max(coalesce(last_log_at, ''), excluded.last_log_at);
+        END
+    ''')
+    # Sections are inserted right after their log, so the rollup rows already exist
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS care_log_sections_rollup_insert AFTER INSERT ON care_log_sections BEGIN
+            UPDATE caregiver_daily_stats SET
+                follow_ups = follow_ups + new.has_follow_up, open_follow_ups = open_follow_ups + new.follow_up_open
+            WHERE (day, username) = (SELECT date(timestamp), username FROM care_logs WHERE id = new.log_id);
+            UPDATE caregiver_stats SET
+                follow_ups = follow_ups + new.has_follow_up, open_follow_ups = open_follow_ups + new.follow_up_open
+            WHERE username = (SELECT username FROM care_logs WHERE id = new.log_id);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS care_log_sections_rollup_update AFTER UPDATE OF follow_up_open ON care_log_sections BEGIN
+            UPDATE caregiver_daily_stats SET open_follow_ups = open_follow_ups + new.follow_up_open - old.follow_up_open
+            WHERE (day, username) = (SELECT date(timestamp), username FROM care_logs WHERE id = new.log_id);
+            UPDATE caregiver_stats SET open_follow_ups = open_follow_ups + new.follow_up_open - old.follow_up_open
+            WHERE username = (SELECT username FROM care_logs WHERE id = new.log_id);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS care_logs_rollup_delete BEFORE DELETE ON care_logs BEGIN
+            UPDATE caregiver_daily_stats SET
+                logs = logs - 1,
+                audio_seconds = audio_seconds - coalesce(old.audio_seconds, 0),
+                follow_ups = follow_ups - coalesce((SELECT has_follow_up FROM care_log_sections WHERE log_id = old.id), 0),
+                open_follow_ups = open_follow_ups - coalesce((SELECT follow_up_open FROM care_log_sections WHERE log_id = old.id), 0)
+            WHERE day = date(old.timestamp) AND username = old.username;
+            UPDATE caregiver_stats SET
+                logs = logs - 1,
+                audio_seconds = audio_seconds - coalesce(old.audio_seconds, 0),
+                follow_ups = follow_ups - coalesce((SELECT has_follow_up FROM care_log_sections WHERE log_id = old.id), 0),
+                open_follow_ups = open_follow_ups - coalesce((SELECT follow_up_open FROM care_log_sections WHERE log_id = old.id), 0)
+            WHERE username = old.username;
+        END
+    ''')
+
+    # Parse the logs already in the database and build their rollups.
+    # Their audio length is unknown until `python reports.py backfill`.
+    for log_id, summary in c.execute('SELECT id, summary FROM care_logs').fetchall():
+        c.execute(_INSERT_SECTIONS, (log_id, *section_values(summary)))
+    rebuild_rollups(c)
+
+
+def _add_job_audio_seconds(c):
+    # Probed once when the job is transcribed and passed on to its care log
+    c.execute('ALTER TABLE jobs ADD COLUMN audio_seconds REAL')
+
+
+def _recount_follow_ups(c):
+    # Re-run whenever sections.needs_follow_up changes what counts as nothing to follow up
+    for log_id, notes in c.execute('SELECT log_id, follow_up_notes FROM care_log_sections').fetchall():
+        has_follow_up = int(needs_follow_up(notes))
+        c.execute('''
+            UPDATE care_log_sections SET has_follow_up = ?,
+                follow_up_open = CASE WHEN follow_up_closed_at IS NULL THEN ? ELSE 0 END
+            WHERE log_id = ?
+        ''', (has_follow_up, has_follow_up, log_id))
+    rebuild_rollups(c)
+
+
+def _add_job_heartbeats(c):
+    # Which runner is working on a job and when it last said so, so that a
+    # starting process only requeues jobs whose runner has died
+    c.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+    c.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at REAL')
+
+
+def _add_outbox_claims(c):
+    # Which mail worker is sending a row and when it last said so (see mail_queue.MailWorker)
+    c.execute('ALTER TABLE outbox ADD COLUMN owner TEXT')
+    c.execute('ALTER TABLE outbox ADD COLUMN claimed_at REAL')
+
+
+# Schema migrations, applied in order. PRAGMA user_version records the last one applied.
+MIGRATIONS = [
+    (1, _create_care_logs),
+    (2, _create_jobs),
+    (3, _add_care_log_audio_path),
+    (4, _create_caches),
+    (5, _add_history_indexes),
+    (6, _create_outbox),
+    (7, _create_metrics),
+    (8, _create_ingest_files),
+    (9, _create_sections_and_rollups),
+    (10, _add_job_audio_seconds),
+    (11, _recount_follow_ups),
+    (12, _add_job_heartbeats),
+    (13, _add_outbox_claims),
+    (14, _recount_follow_ups),
+]
+
+
+def schema_version():
+    """Return the schema version of the database."""
+    return get_connection().execute('PRAGMA user_version').fetchone()[0]
+
+
+def init_db():
+    """Initialize the SQLite database and apply any pending schema migrations."""
+    conn = _connect()
+    c = conn.cursor()
+
+    # BEGIN IMMEDIATE stops two processes from migrating at the same time
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        version = c.execute('PRAGMA user_version').fetchone()[0]
+        for target, migrate in MIGRATIONS:
+            if target > version:
+                migrate(c)
+                c.execute(f'PRAGMA user_version = {target}')
+        c.execute('COMMIT')
+    except Exception:
+        c.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+@traced("log_care_summary")
+def log_care_summary(username, filename, transcript, summary, txt_path, pdf_path, audio_path=None, audio_seconds=None):
     """
     Log a new care summary entry to the database.
-    
+
+    The summary's sections are parsed and stored alongside it, and the
+    dashboard rollups are updated by triggers in the same transaction. The
+    insert goes through the writer thread, which commits it together with
+    any other writes queued at the same time.
+
     Args:
         username (str): Name of the caregiver
         filename (str): Original audio filename
@@ -33,20 +521,22 @@ def log_care_summary(username, filename, transcript, summary, txt_path, pdf_path
         summary (str): AI-generated summary
         txt_path (str): Path to saved text file
         pdf_path (str): Path to saved PDF file
+        audio_path (str): Path to the archived audio, if kept
+        audio_seconds (float): Length of the recording, if known
     """
+    def insert(conn):
+        log_id = conn.execute('''
+            INSERT INTO care_logs
+            (username, original_filename, transcript, summary, txt_path, pdf_path, audio_path, audio_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (username, filename, transcript, summary, txt_path, pdf_path, audio_path, audio_seconds)).lastrowid
+        conn.execute(_INSERT_SECTIONS, (log_id, *sections))
+
     try:
-        conn = sqlite3.connect('homecare.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            INSERT INTO care_logs 
-            (username, original_filename, transcript, summary, txt_path, pdf_path)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (username, filename, transcript, summary, txt_path, pdf_path))
-        
-        conn.commit()
-        conn.close()
+        sections = section_values(summary)
+        run_in_writer(insert).result()
         return True
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-        return False 
\ No newline at end of file
+        record_error(str(e))
+        return False
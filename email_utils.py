@@ -1,49 +1,171 @@
 import streamlit as st
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 import os
+from tracing import traced, record_error
 
-def send_pdf_email(recipient_email, subject, body, pdf_path):
+# A pooled SMTP connection idle for longer than this is closed (servers drop them anyway)
+SMTP_IDLE_SECONDS = 60
+SMTP_TIMEOUT_SECONDS = 30
+
+
+def _secret_flag(name, default=True):
+    # TOML booleans arrive as bool, but "false" written as a string must not count as true
+    value = st.secrets.get(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ("on", "1", "true")
+    return bool(value)
+
+
+def smtp_settings():
     """
-    Send a PDF file via email using Gmail SMTP.
+    Read the SMTP configuration from Streamlit secrets.
+
+    EMAIL_SMTP_STARTTLS and EMAIL_SMTP_LOGIN default to true; set them to
+    false to point the app at a local test server such as aiosmtpd.
+
+    Returns:
+        dict: Settings for SmtpConnection, or None if any are missing
     """
-    # Check for required secrets
     required_secrets = ["EMAIL_USERNAME", "EMAIL_PASSWORD", "EMAIL_SMTP_SERVER", "EMAIL_SMTP_PORT"]
     missing_secrets = [secret for secret in required_secrets if secret not in st.secrets]
-    
+
     if missing_secrets:
         st.warning(f"Missing email configuration in Streamlit secrets: {', '.join(missing_secrets)}")
+        return None
+
+    return {
+        "host": st.secrets["EMAIL_SMTP_SERVER"],
+        "port": int(st.secrets["EMAIL_SMTP_PORT"]),
+        "username": st.secrets["EMAIL_USERNAME"],
+        "password": st.secrets["EMAIL_PASSWORD"],
+        "sender": st.secrets.get("EMAIL_SENDER", st.secrets["EMAIL_USERNAME"]),
+        "starttls": _secret_flag("EMAIL_SMTP_STARTTLS"),
+        "login": _secret_flag("EMAIL_SMTP_LOGIN"),
+    }
+
+
+def build_message(sender, recipient_email, subject, body, attachments=()):
+    """
+    Build a plain-text email with PDF attachments.
+
+    Args:
+        sender (str): From address
+        recipient_email (str): Address to send to
+        subject (str): Email subject
+        body (str): Plain-text message body
+        attachments (iterable): (filename, pdf bytes) pairs
+    """
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+
+    for filename, pdf_bytes in attachments:
+        attachment = MIMEApplication(pdf_bytes, _subtype='pdf')
+        attachment.add_header('Content-Disposition', 'attachment', filename=filename or "care_log.pdf")
+        msg.attach(attachment)
+    return msg
+
+
+class SmtpConnection:
+    """
+    A reusable, authenticated SMTP connection.
+
+    Connects (STARTTLS and login) on the first send and keeps the session
+    open for the next one. A connection the server has dropped is reopened
+    once transparently; one left idle past SMTP_IDLE_SECONDS is closed by
+    close_if_idle.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._server = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.settings["host"], self.settings["port"], timeout=SMTP_TIMEOUT_SECONDS)
+        try:
+            if self.settings.get("starttls", True):
+                server.starttls()
+            if self.settings.get("login", True):
+                server.login(self.settings["username"], self.settings["password"])
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def send(self, msg):
+        """Send ``msg``, connecting or reconnecting as needed."""
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+            self.close()
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server closed the pooled session; retry once on a fresh one
+            self.close()
+            self._server = self._connect()
+            self._server.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+            self.close()
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+
+@traced("send_email")
+def send_pdf_email(recipient_email, subject, body, pdf, filename=None):
+    """
+    Send a PDF via email right away, over a one-off SMTP connection.
+
+    The app queues mail through mail_queue.queue_email instead; this is for
+    scripts that need to know the message went out before they continue.
+
+    Args:
+        recipient_email (str): Address to send to
+        subject (str): Email subject
+        body (str): Plain-text message body
+        pdf (str | bytes): Path to a PDF file, or the PDF bytes
+        filename (str): Attachment name (defaults to the file's name)
+    """
+    settings = smtp_settings()
+    if settings is None:
         return False
-    
+
     try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = st.secrets["EMAIL_USERNAME"]
-        msg['To'] = recipient_email
-        msg['Subject'] = subject
-        
-        # Add body
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Attach PDF
-        with open(pdf_path, 'rb') as f:
-            pdf = MIMEApplication(f.read(), _subtype='pdf')
-            pdf.add_header('Content-Disposition', 'attachment', filename=os.path.basename(pdf_path))
-            msg.attach(pdf)
-        
-        # Connect to SMTP server
-        server = smtplib.SMTP(st.secrets["EMAIL_SMTP_SERVER"], st.secrets["EMAIL_SMTP_PORT"])
-        server.starttls()
-        server.login(st.secrets["EMAIL_USERNAME"], st.secrets["EMAIL_PASSWORD"])
-        
-        # Send email
-        server.send_message(msg)
-        server.quit()
-        
+        # Attach PDF, reading it from disk only if we were given a path
+        if isinstance(pdf, (bytes, bytearray)):
+            pdf_bytes = pdf
+        else:
+            with open(pdf, 'rb') as f:
+                pdf_bytes = f.read()
+            filename = filename or os.path.basename(pdf)
+
+        msg = build_message(settings["sender"], recipient_email, subject, body, [(filename, pdf_bytes)])
+        connection = SmtpConnection(settings)
+        try:
+            connection.send(msg)
+        finally:
+            connection.close()
+
         return True
-        
+
     except Exception as e:
         st.error(f"Error sending email: {str(e)}")
-        return False 
\ No newline at end of file
+        record_error(str(e))
+        return False
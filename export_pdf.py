@@ -1,26 +1,191 @@
 from fpdf import FPDF
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import argparse
 import os
+from tracing import traced, annotate
 
-def export_to_pdf(text: str, filename: str):
+# Optional TrueType font for summaries with characters outside Latin-1.
+# fpdf caches the parsed font metrics next to the .ttf after the first use.
+FONT_PATH = os.getenv("HOMECARE_PDF_FONT")
+FONT_SIZE = 12
+LINE_HEIGHT = 10
+
+# Typographic characters the built-in Arial font can't encode
+_LATIN1_REPLACEMENTS = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "•": "-", "…": "...", "\u00a0": " ",
+})
+
+
+class CareLogPDF(FPDF):
+    """Shared page setup for every care log PDF."""
+
+    def __init__(self):
+        super().__init__()
+        self.set_auto_page_break(True, margin=15)
+        if FONT_PATH:
+            self.add_font("CareLog", "", FONT_PATH, uni=True)
+            self.font_family_name = "CareLog"
+        else:
+            self.font_family_name = "Arial"
+
+    def prepare(self, text):
+        """Make ``text`` printable in the configured font."""
+        if FONT_PATH:
+            return text
+        return text.translate(_LATIN1_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+    def add_care_log(self, text, heading=None):
+        """Start a new page with an optional heading line, followed by the text."""
+        self.add_page()
+        if heading:
+            self.set_font(self.font_family_name, size=FONT_SIZE + 2)
+            self.multi_cell(0, LINE_HEIGHT, txt=self.prepare(heading))
+            self.ln(2)
+        self.set_font(self.font_family_name, size=FONT_SIZE)
+        self.multi_cell(0, LINE_HEIGHT, txt=self.prepare(text))
+
+    def to_bytes(self):
+        data = self.output(dest="S")
+        # fpdf 1.7 returns a latin-1 str, newer releases return bytes
+        return data.encode("latin-1") if isinstance(data, str) else bytes(data)
+
+
+def render_pdf(text: str, pdf: CareLogPDF = None) -> bytes:
+    """
+    Render text to PDF bytes in memory.
+
+    Args:
+        text (str): Text to export
+        pdf (CareLogPDF): Document already set up ahead of time (default: a new one)
+    """
+    pdf = pdf or CareLogPDF()
+    pdf.add_care_log(text)
+    return pdf.to_bytes()
+
+
+@traced("export_pdf")
+def export_to_pdf(text: str, filename: str = None, pdf: CareLogPDF = None) -> bytes:
     """
-    Exports text to a PDF file.
-    
+    Exports text to a PDF and returns the PDF bytes.
+
     Args:
         text (str): Text to export
-        filename (str): Name of the output file (without extension)
-    """
-    # Create PDF object
-    pdf = FPDF()
-    pdf.add_page()
-    
-    # Set font
-    pdf.set_font("Arial", size=12)
-    
-    # Add text
-    pdf.multi_cell(0, 10, txt=text)
-    
-    # Ensure summaries directory exists
-    os.makedirs("summaries", exist_ok=True)
-    
-    # Save PDF
-    pdf.output(f"summaries/{filename}.pdf") 
\ No newline at end of file
+        filename (str): If given, also save to summaries/{filename}.pdf
+        pdf (CareLogPDF): Document already set up ahead of time (default: a new one)
+    """
+    data = render_pdf(text, pdf)
+    annotate(pdf_bytes=len(data))
+
+    if filename:
+        # Ensure summaries directory exists
+        os.makedirs("summaries", exist_ok=True)
+
+        # Save PDF
+        with open(f"summaries/{filename}.pdf", "wb") as f:
+            f.write(data)
+
+    return data
+
+
+def care_log_heading(log):
+    """Heading line used for a care log in batch exports."""
+    return f"Care Log #{log['id']} - {log['username']} - {log['timestamp']}"
+
+
+def render_care_logs(logs) -> bytes:
+    """
+    Render many care logs into one multi-page PDF, each log starting on a new page.
+
+    Args:
+        logs (iterable): Care log dicts with id, username, timestamp and summary
+    """
+    pdf = CareLogPDF()
+    for log in logs:
+        pdf.add_care_log(log["summary"], heading=care_log_heading(log))
+    return pdf.to_bytes()
+
+
+def _template_fields(logs):
+    # Only the fields the template uses are sent to the workers
+    return ({key: log[key] for key in ("id", "username", "timestamp", "summary")} for log in logs)
+
+
+def _render_to_file(log, output_dir):
+    path = os.path.join(output_dir, f"care_log_{log['id']}.pdf")
+    pdf = CareLogPDF()
+    pdf.add_care_log(log["summary"], heading=care_log_heading(log))
+    with open(path, "wb") as f:
+        f.write(pdf.to_bytes())
+    return path
+
+
+def _render_combined_to_file(logs, path):
+    with open(path, "wb") as f:
+        f.write(render_care_logs(logs))
+    return path
+
+
+def export_batch(logs, output_dir, workers=None):
+    """
+    Render each care log to its own PDF in ``output_dir`` across a process pool.
+
+    Args:
+        logs (iterable): Care log dicts with id, username, timestamp and summary
+        output_dir (str): Folder for the PDFs
+        workers (int): Number of processes (default: one per CPU)
+
+    Returns:
+        list: Paths of the written PDFs
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_to_file, _template_fields(logs), repeat(output_dir), chunksize=32))
+
+
+def export_combined(logs, path):
+    """
+    Render every care log into one multi-page PDF at ``path`` in a worker process.
+
+    One fpdf document can't be split across processes, so this is a single
+    task, but it runs in a process pool like export_batch rather than in
+    the caller's interpreter.
+
+    Args:
+        logs (iterable): Care log dicts with id, username, timestamp and summary
+        path (str): Where to write the PDF
+
+    Returns:
+        str: ``path``
+    """
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_render_combined_to_file, list(_template_fields(logs)), path).result()
+
+
+def main():
+    from database import init_db
+    from history import iter_logs
+
+    parser = argparse.ArgumentParser(description="Export care logs to PDF for a date range")
+    parser.add_argument("--from", dest="start", required=True, help="First day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", required=True, help="Last day, YYYY-MM-DD")
+    parser.add_argument("--user", help="Only this caregiver's logs")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--combined", metavar="PDF", help="Write one multi-page PDF")
+    output.add_argument("--output-dir", help="Write one PDF per log into this folder")
+    parser.add_argument("--workers", type=int, help="Processes for --output-dir (default: one per CPU)")
+    args = parser.parse_args()
+
+    init_db()
+    logs = iter_logs(args.start, args.end, args.user)
+    if args.combined:
+        export_combined(logs, args.combined)
+        print(f"Wrote {args.combined}")
+    else:
+        paths = export_batch(logs, args.output_dir, args.workers)
+        print(f"Wrote {len(paths)} PDFs to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
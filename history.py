@@ -0,0 +1,185 @@
+"""
+Read-side queries over care_logs: paginated history and full-text search.
+
+Existing logs are indexed when the search index is created;
+`python history.py backfill` rebuilds the index from scratch.
+"""
+import argparse
+import re
+from database import get_connection, init_db, run_in_writer
+
+PAGE_SIZE = 20
+
+# Mark the matches in search snippets. Control characters never occur in
+# transcripts, so the text around them can be escaped before highlighting.
+MATCH_START, MATCH_END = "\x02", "\x03"
+_MARKDOWN_PUNCTUATION = re.compile(r"([!-/:-@\[-`{-~])")
+
+LOG_FIELDS = ["id", "username", "original_filename", "timestamp", "transcript", "summary", "txt_path", "pdf_path", "audio_path"]
+
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 query that matches every word.
+
+    Each word is quoted so punctuation or FTS operators typed by the user
+    can't cause a syntax error.
+    """
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"' for term in terms if term)
+
+
+def fetch_logs(username=None, before=None, limit=PAGE_SIZE):
+    """
+    Return one page of care logs, newest first.
+
+    Uses keyset pagination on (timestamp, id), so later pages cost the same
+    as the first one.
+
+    Args:
+        username (str): Only return this caregiver's logs (None for all)
+        before (tuple): (timestamp, id) of the last log on the previous page
+        limit (int): Page size
+
+    Returns:
+        list: Logs as dicts
+    """
+    conditions = []
+    params = []
+    if username:
+        conditions.append("username = ?")
+        params.append(username)
+    if before:
+        conditions.append("(timestamp, id) < (?, ?)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    rows = get_connection().execute(f'''
+        SELECT {', '.join(LOG_FIELDS)} FROM care_logs
+        {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    ''', (*params, limit)).fetchall()
+    return [dict(zip(LOG_FIELDS, row)) for row in rows]
+
+
+def search_logs(text, username=None, before=None, limit=PAGE_SIZE):
+    """
+    Full-text search over transcripts and summaries, newest first.
+
+    Every word in ``text`` must appear (stemmed, so "falls" finds "fall").
+    Pagination works like fetch_logs. Each result also carries a
+    ``snippet`` with the matching words between MATCH_START and MATCH_END
+    (see snippet_markdown).
+    """
+    query = fts_query(text)
+    if not query:
+        return fetch_logs(username, before, limit)
+
+    conditions = ["care_logs_fts MATCH ?"]
+    params = [query]
+    if username:
+        conditions.append("l.username = ?")
+        params.append(username)
+    if before:
+        conditions.append("(l.timestamp, l.id) < (?, ?)")
+        params.extend(before)
+
+    rows = get_connection().execute(f'''
+        SELECT {', '.join('l.' + field for field in LOG_FIELDS)},
+               snippet(care_logs_fts, -1, ?, ?, '…', 16)
+        FROM care_logs_fts
+        JOIN care_logs l ON l.id = care_logs_fts.rowid
+        WHERE {' AND '.join(conditions)}
+        ORDER BY l.timestamp DESC, l.id DESC
+        LIMIT ?
+    ''', (MATCH_START, MATCH_END, *params, limit)).fetchall()
+    return [dict(zip(LOG_FIELDS + ["snippet"], row)) for row in rows]
+
+
+def snippet_markdown(snippet):
+    """
+    Markdown for a search snippet: the transcript text escaped, the matches in bold.
+
+    Transcripts are caregivers' words, so "*", "#", "[...](...)" and the like
+    must show up as typed rather than be rendered.
+    """
+    escaped = _MARKDOWN_PUNCTUATION.sub(r"\\\1", " ".join(snippet.split()))
+    return escaped.replace(MATCH_START, "**").replace(MATCH_END, "**")
+
+
+def iter_logs(start, end, username=None, batch_size=500):
+    """
+    Yield every care log from day ``start`` through day ``end``, oldest first.
+
+    Rows are read in keyset-paginated batches, so memory stays constant
+    however many logs are in the range.
+
+    Args:
+        start (str): First day, YYYY-MM-DD
+        end (str): Last day (inclusive), YYYY-MM-DD
+        username (str): Only this caregiver's logs (None for all)
+    """
+    after = (start, 0)
+    while True:
+        conditions = ["(timestamp, id) > (?, ?)", "timestamp < date(?, '+1 day')"]
+        params = [*after, end]
+        if username:
+            conditions.append("username = ?")
+            params.append(username)
+
+        rows = get_connection().execute(f'''
+            SELECT {', '.join(LOG_FIELDS)} FROM care_logs
+            WHERE {' AND '.join(conditions)}
+            ORDER BY timestamp, id
+            LIMIT ?
+        ''', (*params, batch_size)).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(LOG_FIELDS, row))
+        after = (rows[-1][LOG_FIELDS.index("timestamp")], rows[-1][0])
+
+
+def page_cursor(logs):
+    """Return the cursor for the page after ``logs`` (None when there are no more)."""
+    if not logs:
+        return None
+    return (logs[-1]["timestamp"], logs[-1]["id"])
+
+
+def backfill_search_index():
+    """
+    Rebuild the full-text index from every row in care_logs.
+
+    Returns:
+        int: Number of logs indexed
+    """
+    def rebuild(conn):
+        conn.execute("INSERT INTO care_logs_fts(care_logs_fts) VALUES('rebuild')")
+        conn.execute("INSERT INTO care_logs_fts(care_logs_fts) VALUES('optimize')")
+        return conn.execute("SELECT COUNT(*) FROM care_logs").fetchone()[0]
+
+    return run_in_writer(rebuild).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Care log history tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("backfill", help="Rebuild the full-text search index")
+    search = subcommands.add_parser("search", help="Search care logs from the command line")
+    search.add_argument("text")
+    search.add_argument("--user")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "backfill":
+        print(f"Indexed {backfill_search_index()} care logs")
+    elif args.command == "search":
+        for log in search_logs(args.text, args.user):
+            snippet = log["snippet"].replace(MATCH_START, "**").replace(MATCH_END, "**")
+            print(f"[{log['timestamp']}] #{log['id']} {log['username']}: {snippet}")
+
+
+if __name__ == "__main__":
+    main()
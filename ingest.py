@@ -0,0 +1,290 @@
+"""
+Bulk import of legacy voice memos from a directory tree.
+
+Every audio file under the folder goes through the same pipeline as an
+upload (archive -> transcribe -> summarize -> export -> log) with a limit
+on how many files may be in each stage at once: Whisper runs in a process
+pool (recordings over HOMECARE_LONG_AUDIO_SECONDS go through
+transcribe_long's chunked pool instead), the other stages in thread pools.
+Size and duration limits are HOMECARE_INGEST_MAX_MB / _MINUTES, not the
+interactive upload limits. Progress is checkpointed per file
+and stage in the ingest_files table, so an interrupted import picks up
+where it stopped when run again.
+
+    python ingest.py /mnt/legacy-memos --user jsmith --transcribe-workers 4
+    python ingest.py /mnt/legacy-memos --user-per-folder --retry-failed
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from database import init_db, get_connection, execute_write, run_in_writer, log_care_summary
+from model_pool import set_thread_budget, TORCH_THREADS
+from storage import export_paths, save_exports
+from uploads import ALLOWED_EXTENSIONS, ingest_upload
+
+# transcribe (whisper, torch) is imported by the Whisper workers (and by the
+# driver of a long recording), and summarize / export_pdf by the threads that use them
+
+STAGES = ["archive", "transcribe", "summarize", "export", "log"]
+
+# Columns read back when a file is resumed, in order
+INGEST_FIELDS = [
+    "id", "source_path", "username", "stage", "audio_path", "audio_seconds",
+    "transcript", "summary", "txt_path", "pdf_path"
+]
+
+REPORT_SECONDS = 30
+
+# Legacy recordings may be far longer than interactive uploads, so imports have their own limits
+INGEST_MAX_BYTES = int(float(os.getenv("HOMECARE_INGEST_MAX_MB", "4096")) * 1024 * 1024)
+INGEST_MAX_SECONDS = float(os.getenv("HOMECARE_INGEST_MAX_MINUTES", "720")) * 60
+
+
+def find_audio(root):
+    """Yield every supported audio file under ``root``, in a stable order."""
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in ALLOWED_EXTENSIONS:
+                yield os.path.join(folder, name)
+
+
+def _caregiver(root, path, username):
+    if username:
+        return username
+    # --user-per-folder: the first folder under the root names the caregiver
+    relative = os.path.relpath(path, root).split(os.sep)
+    return relative[0] if len(relative) > 1 else "import"
+
+
+def register_files(root, username=None, retry_failed=False):
+    """
+    Record the files under ``root`` in ingest_files and return the unfinished ones.
+
+    Files already recorded keep their checkpoint; failed files are only
+    queued again with ``retry_failed``.
+    """
+    root = os.path.abspath(root)
+    rows = [(path, _caregiver(root, path, username)) for path in find_audio(root)]
+    paths = {path for path, _ in rows}
+
+    def register(conn):
+        conn.executemany("INSERT OR IGNORE INTO ingest_files (source_path, username) VALUES (?, ?)", rows)
+        if retry_failed:
+            conn.execute("UPDATE ingest_files SET status = 'pending', error = NULL WHERE status = 'failed'")
+
+    run_in_writer(register).result()
+
+    pending = get_connection().execute(f'''
+        SELECT {', '.join(INGEST_FIELDS)} FROM ingest_files
+        WHERE status = 'pending'
+        ORDER BY source_path
+    ''')
+    # Files from imports of other folders stay for their own runs
+    return [dict(zip(INGEST_FIELDS, row)) for row in pending if row[1] in paths]
+
+
+def _save(item, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    execute_write(f"UPDATE ingest_files SET {assignments} WHERE id = ?", (*fields.values(), item["id"])).result()
+    item.update(fields)
+
+
+def _init_whisper_worker(threads):
+    # Ctrl+C stops the import after the files in flight finish their current stage
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    set_thread_budget(threads)
+
+
+def _transcribe_file(audio_path):
+    # Runs in a Whisper worker process; the model stays loaded between files
+    from transcribe import transcribe_audio
+    return transcribe_audio(audio_path)
+
+
+class Ingester:
+    """
+    Runs files through the pipeline with a fixed number of workers per stage.
+
+    Each file is driven by its own thread, which hands every stage to that
+    stage's executor and waits for it, so the per-stage limits hold however
+    many files are in flight.
+    """
+
+    def __init__(self, transcribe_workers=1, summarize_workers=4, export_workers=2,
+                 max_bytes=INGEST_MAX_BYTES, max_seconds=INGEST_MAX_SECONDS):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        threads = TORCH_THREADS or max(1, (os.cpu_count() or 1) // transcribe_workers)
+        self._stages = {
+            "transcribe": ProcessPoolExecutor(
+                max_workers=transcribe_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_whisper_worker,
+                initargs=(threads,)
+            ),
+            "summarize": ThreadPoolExecutor(max_workers=summarize_workers, thread_name_prefix="ingest-summarize"),
+            "export": ThreadPoolExecutor(max_workers=export_workers, thread_name_prefix="ingest-export"),
+        }
+        # Enough drivers to keep every stage busy, plus one file being archived or logged
+        self._drivers = ThreadPoolExecutor(
+            max_workers=2 * transcribe_workers + summarize_workers + export_workers + 1,
+            thread_name_prefix="ingest"
+        )
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.done = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+
+    def run(self, items, report_seconds=REPORT_SECONDS):
+        """Process ``items`` (from register_files), printing throughput as files finish."""
+        started = time.monotonic()
+        futures = [self._drivers.submit(self._process, item) for item in items]
+        last_report = started
+        try:
+            for future in futures:
+                future.result()
+                if time.monotonic() - last_report >= report_seconds:
+                    last_report = time.monotonic()
+                    self.report(len(items), last_report - started)
+        except KeyboardInterrupt:
+            print("\nStopping after the current stages; run the same command again to resume.", file=sys.stderr)
+            self._stopping = True
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            self.close()
+        self.report(len(items), time.monotonic() - started)
+
+    def report(self, total, elapsed):
+        minutes = max(elapsed, 1e-9) / 60
+        with self._lock:
+            print(
+                f"{self.done + self.failed}/{total} files ({self.failed} failed) in {elapsed / 60:.1f} min: "
+                f"{self.done / minutes:.1f} files/min, "
+                f"{self.audio_seconds / 3600 / (minutes / 60):.2f} audio-hours/hour",
+                file=sys.stderr
+            )
+
+    def close(self):
+        self._drivers.shutdown(wait=True, cancel_futures=True)
+        for executor in self._stages.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _process(self, item):
+        try:
+            for index in range(item["stage"], len(STAGES)):
+                if self._stopping:
+                    return
+                stage = STAGES[index]
+                fields = getattr(self, f"_{stage}")(item)
+                _save(item, stage=index + 1, **fields)
+            _save(item, status="done")
+            with self._lock:
+                self.done += 1
+                self.audio_seconds += item["audio_seconds"] or 0
+        except Exception as e:
+            _save(item, status="failed", error=str(e))
+            with self._lock:
+                self.failed += 1
+            print(f"Failed {item['source_path']}: {e}", file=sys.stderr)
+
+    def _archive(self, item):
+        with open(item["source_path"], "rb") as src:
+            audio_path, audio_seconds = ingest_upload(
+                src,
+                os.path.basename(item["source_path"]),
+                size=os.path.getsize(item["source_path"]),
+                max_bytes=self.max_bytes,
+                max_seconds=self.max_seconds
+            )
+        return {"audio_path": audio_path, "audio_seconds": audio_seconds}
+
+    def _transcribe(self, item):
+        from transcribe import transcribe_long, LONG_AUDIO_SECONDS
+
+        if item["audio_seconds"] and item["audio_seconds"] > LONG_AUDIO_SECONDS:
+            # As in jobs.py: long recordings are split into chunks on transcribe's own process pool
+            transcript = transcribe_long(item["audio_path"])
+        else:
+            transcript = self._stages["transcribe"].submit(_transcribe_file, item["audio_path"]).result()
+        if transcript is None:
+            raise RuntimeError("Could not transcribe the audio file.")
+        return {"transcript": transcript}
+
+    def _summarize(self, item):
+        from summarize import summarize_text
+
+        return {"summary": self._stages["summarize"].submit(summarize_text, item["transcript"]).result()}
+
+    def _export(self, item):
+        return self._stages["export"].submit(_export_files, item).result()
+
+    def _log(self, item):
+        saved = log_care_summary(
+            item["username"],
+            os.path.basename(item["source_path"]),
+            item["transcript"],
+            item["summary"],
+            item["txt_path"],
+            item["pdf_path"],
+            item["audio_path"],
+            item["audio_seconds"]
+        )
+        if not saved:
+            raise RuntimeError("Error saving to database")
+        return {}
+
+
+def _export_files(item):
+    base_filename = f"care_log_import_{item['id']}_{os.path.splitext(os.path.basename(item['source_path']))[0]}"
+    paths = export_paths(base_filename)
+    save_exports(paths, item["summary"])
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a folder of voice memos as care logs")
+    parser.add_argument("folder", help="Folder to search for .wav, .mp3 and .m4a files")
+    owner = parser.add_mutually_exclusive_group(required=True)
+    owner.add_argument("--user", help="Caregiver to log every memo under")
+    owner.add_argument("--user-per-folder", action="store_true", help="Use each top-level subfolder's name as the caregiver")
+    parser.add_argument("--transcribe-workers", type=int, default=1, help="Whisper processes")
+    parser.add_argument("--summarize-workers", type=int, default=4, help="Concurrent summary requests")
+    parser.add_argument("--export-workers", type=int, default=2, help="Concurrent TXT/PDF exports")
+    parser.add_argument("--retry-failed", action="store_true", help="Also retry files that failed in an earlier run")
+    parser.add_argument("--max-mb", type=float, default=INGEST_MAX_BYTES / (1024 * 1024), help="Skip files larger than this")
+    parser.add_argument("--max-minutes", type=float, default=INGEST_MAX_SECONDS / 60, help="Skip recordings longer than this")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"{args.folder} is not a folder")
+
+    init_db()
+    items = register_files(args.folder, args.user, args.retry_failed)
+    print(f"{len(items)} files to import", file=sys.stderr)
+    if not items:
+        return
+
+    ingester = Ingester(
+        args.transcribe_workers, args.summarize_workers, args.export_workers,
+        max_bytes=int(args.max_mb * 1024 * 1024), max_seconds=args.max_minutes * 60
+    )
+    try:
+        ingester.run(items)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    if ingester.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
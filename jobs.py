@@ -0,0 +1,345 @@
+import importlib
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from database import get_connection, execute_write, run_in_writer, log_care_summary
+from model_pool import set_thread_budget, TORCH_THREADS, MAX_BATCH_SIZE
+from storage import export_paths, save_exports, KEEP_EXPORT_FILES
+from tracing import span, current_context, record_error
+
+# transcribe (whisper, torch), summarize (LLM clients) and export_pdf are imported
+# where they are used, so importing this module from app.py stays cheap.
+# warm_up() imports them in the background once someone has logged in.
+PIPELINE_MODULES = ["transcribe", "summarize", "pipeline", "export_pdf", "mail_queue", "email_utils"]
+
+# Stages run in this order; a job's `stage` column counts how many have completed
+STAGES = ["transcribe", "summarize", "export", "log"]
+
+JOB_THREADS = int(os.getenv("HOMECARE_JOB_THREADS", "4"))
+WHISPER_PROCESSES = int(os.getenv("HOMECARE_WHISPER_PROCESSES", "1"))
+
+# Runners mark their running jobs alive this often; a running job whose mark is
+# older than STALE_JOB_SECONDS belonged to a process that died and is requeued
+HEARTBEAT_SECONDS = 30
+STALE_JOB_SECONDS = 4 * HEARTBEAT_SECONDS
+
+# Columns returned by get_job, in order
+JOB_FIELDS = [
+    "id", "username", "original_filename", "audio_path", "audio_seconds", "status", "stage", "progress",
+    "partial_transcript", "partial_summary", "transcript", "summary", "base_filename", "txt_path", "pdf_path",
+    "log_saved", "error", "created_at", "updated_at"
+]
+
+
+def _update_job(job_id, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    execute_write(
+        f"UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (*fields.values(), job_id)
+    ).result()
+
+
+def get_job(job_id):
+    """Return a job as a dict, or None if it doesn't exist."""
+    row = get_connection().execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(zip(JOB_FIELDS, row)) if row else None
+
+
+def _transcribe_in_worker(audio_path, trace_parent=None):
+    # Runs in a Whisper worker process; the model stays loaded between jobs
+    from transcribe import transcribe_audio
+    with span("whisper_worker", parent=trace_parent):
+        return transcribe_audio(audio_path)
+
+
+class JobRunner:
+    """
+    Runs queued jobs through transcribe -> summarize -> export -> log.
+
+    Each job is driven by a thread (the summarize/export/log stages are I/O
+    bound); Whisper runs in a separate process pool, or in this process when
+    cross-request batching is on (HOMECARE_WHISPER_BATCH_SIZE > 1). Progress
+    is written to the jobs table after every stage, so a restarted process
+    picks each job up again after its last completed stage.
+
+    Several app processes may share the database: each runner stamps the
+    jobs it is running with its owner id and a heartbeat, and only jobs
+    whose heartbeat has gone stale are taken over. Heartbeats cover only the
+    jobs a thread is still working on, so a job whose final status couldn't
+    be written goes stale and is retried.
+    """
+
+    def __init__(self, threads=JOB_THREADS, whisper_processes=WHISPER_PROCESSES):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job")
+        self._whisper = ProcessPoolExecutor(
+            max_workers=whisper_processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=set_thread_budget,
+            initargs=(TORCH_THREADS or max(1, (os.cpu_count() or 1) // whisper_processes),)
+        )
+        self._active = set()
+        self._active_lock = threading.Lock()
+
+    def warm(self):
+        """Load the Whisper model ahead of the first job, wherever jobs will run it."""
+        if MAX_BATCH_SIZE > 1:
+            from model_pool import warm_up as warm_models
+            set_thread_budget()
+            warm_models()
+        else:
+            self._whisper.submit(_warm_worker)
+
+    def recover(self):
+        """Requeue jobs whose runner has died, start every queued job and begin heartbeats."""
+        self._requeue_stale()
+        job_ids = [row[0] for row in get_connection().execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id")]
+        for job_id in job_ids:
+            self.submit(job_id)
+        threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    def _requeue_stale(self):
+        """Requeue running jobs with no heartbeat for STALE_JOB_SECONDS; returns their ids."""
+        def requeue(conn):
+            stale = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND coalesce(heartbeat_at, 0) < ?",
+                (time.time() - STALE_JOB_SECONDS,)
+            )]
+            conn.executemany("UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ?", [(job_id,) for job_id in stale])
+            return stale
+
+        return run_in_writer(requeue).result()
+
+    def _beat(self):
+        """Mark the jobs this runner's threads are still working on as alive."""
+        now = time.time()
+        with self._active_lock:
+            rows = [(now, job_id, self.owner) for job_id in self._active]
+        run_in_writer(lambda conn: conn.executemany(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND owner = ? AND status = 'running'", rows
+        )).result()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                self._beat()
+                # Take over jobs from runners that died while this one was up
+                for job_id in self._requeue_stale():
+                    self.submit(job_id)
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    def submit(self, job_id):
+        self._threads.submit(self._run, job_id)
+
+    def _claim(self, job_id):
+        # Only one runner may move a job from queued to running
+        cursor = execute_write(
+            '''
+            UPDATE jobs SET status = 'running', owner = ?, heartbeat_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+            ''',
+            (self.owner, time.time(), job_id)
+        ).result()
+        return cursor.rowcount == 1
+
+    def _run(self, job_id):
+        if not self._claim(job_id):
+            return
+        with self._active_lock:
+            self._active.add(job_id)
+        try:
+            self._run_claimed(job_id)
+        finally:
+            # From here on the job is only kept alive if its status was written
+            with self._active_lock:
+                self._active.discard(job_id)
+
+    def _run_claimed(self, job_id):
+        job = get_job(job_id)
+        # Stage spans recorded by the pipeline functions share this job's trace
+        with span("job", job_id=job_id, resumed_at_stage=job["stage"]):
+            try:
+                if job["stage"] == 0:
+                    self._run_overlapped(job)
+                # A job resumed after a restart finishes its remaining stages one by one
+                for index in range(job["stage"], len(STAGES)):
+                    self._save_stage(job, index, getattr(self, f"_{STAGES[index]}")(job))
+                _update_job(job_id, status="done")
+            except Exception as e:
+                record_error(str(e))
+                try:
+                    _update_job(job_id, status="failed", error=str(e))
+                except Exception as update_error:
+                    # Left 'running' with no heartbeat, so it is requeued once stale
+                    print(f"Could not mark job {job_id} as failed: {update_error}")
+
+    def _save_stage(self, job, index, fields):
+        fields.update(stage=index + 1, progress=(index + 1) / len(STAGES))
+        _update_job(job["id"], **fields)
+        job.update(fields)
+
+    def _run_overlapped(self, job):
+        """
+        Run all four stages for a fresh job.
+
+        Only two things overlap Whisper: the empty CareLogPDF document is set
+        up on a side thread (when exports are kept), and for long recordings,
+        which transcribe_long reports chunk by chunk, an IncrementalSummarizer
+        starts section notes from the partial transcripts. Short recordings
+        are transcribed in one call, so they are summarized afterwards as
+        usual. The care log is only inserted after the export has succeeded,
+        so it never points at files that were not written. Each stage is
+        still saved as it completes, so resuming works as before.
+        """
+        from export_pdf import CareLogPDF
+        from pipeline import IncrementalSummarizer
+
+        summarizer = IncrementalSummarizer()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="overlap") as side:
+            skeleton = side.submit(CareLogPDF) if KEEP_EXPORT_FILES else None
+            try:
+                transcribed = self._transcribe(job, on_partial=summarizer.update)
+            except BaseException:
+                summarizer.close()
+                raise
+            self._save_stage(job, 0, transcribed)
+            self._save_stage(job, 1, self._summarize(job, summarizer))
+
+            self._save_stage(job, 2, self._export(job, skeleton.result() if skeleton else None))
+            self._save_stage(job, 3, self._log(job))
+
+    def _transcribe(self, job, on_partial=None):
+        from transcribe import transcribe_audio, transcribe_long, probe_duration, LONG_AUDIO_SECONDS
+
+        def partial(text):
+            _update_job(job["id"], partial_transcript=text)
+            if on_partial is not None:
+                on_partial(text)
+
+        duration = probe_duration(job["audio_path"])
+        if duration and duration > LONG_AUDIO_SECONDS:
+            # Long memos already fan out over their own process pool
+            transcript = transcribe_long(job["audio_path"], on_partial=partial)
+        elif MAX_BATCH_SIZE > 1:
+            # In this process, so concurrent jobs' windows meet in the shared WhisperBatcher
+            transcript = transcribe_audio(job["audio_path"])
+        else:
+            transcript = self._whisper.submit(_transcribe_in_worker, job["audio_path"], current_context()).result()
+        if transcript is None:
+            raise RuntimeError("Could not transcribe the audio file. Please try a different file.")
+        return {"transcript": transcript, "audio_seconds": duration}
+
+    def _summarize(self, job, summarizer=None):
+        from summarize import summarize_text
+
+        # Stream the summary into the job row so the UI can show it as it is written
+        on_partial = lambda text: _update_job(job["id"], partial_summary=text)
+        if summarizer is not None:
+            summary = summarizer.finish(job["transcript"], on_partial)
+        else:
+            summary = summarize_text(job["transcript"], on_partial=on_partial)
+        return {"summary": summary}
+
+    def _export_paths(self, job):
+        base_filename = f"care_log_{job['id']}_{os.path.splitext(os.path.basename(job['audio_path']))[0]}"
+        return {"base_filename": base_filename, **export_paths(base_filename)}
+
+    def _export(self, job, pdf=None):
+        # Without HOMECARE_KEEP_EXPORT_FILES nothing is written; downloads render from the summary
+        paths = self._export_paths(job)
+        save_exports(paths, job["summary"], pdf)
+        return paths
+
+    def _log(self, job):
+        if job.get("log_saved"):
+            # Already logged, e.g. by an older version that logged while exporting
+            return {"log_saved": job["log_saved"]}
+
+        saved = log_care_summary(
+            job["username"],
+            job["original_filename"],
+            job["transcript"],
+            job["summary"],
+            job["txt_path"],
+            job["pdf_path"],
+            job["audio_path"],
+            job["audio_seconds"]
+        )
+        return {"log_saved": int(saved)}
+
+
+def _warm_worker():
+    from model_pool import get_pool
+    get_pool().warm()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+_warm_thread = None
+
+
+def start_workers():
+    """
+    Start the job runner once per process and resume unfinished jobs.
+
+    Safe to call on every Streamlit rerun. Whisper isn't loaded until a job
+    needs it or warm_up() runs after login.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+            _runner.recover()
+        return _runner
+
+
+def enqueue_job(username, original_filename, audio_path):
+    """
+    Queue an archived upload for processing and return the new job id.
+
+    Args:
+        username (str): Name of the caregiver
+        original_filename (str): Original audio filename
+        audio_path (str): Path of the archived upload
+    """
+    job_id = execute_write(
+        "INSERT INTO jobs (username, original_filename, audio_path) VALUES (?, ?, ?)",
+        (username, original_filename, audio_path)
+    ).result().lastrowid
+
+    start_workers().submit(job_id)
+    return job_id
+
+
+def _import_pipeline():
+    for name in PIPELINE_MODULES:
+        importlib.import_module(name)
+    # Creating the summarizer backend imports its client library (e.g. google.generativeai).
+    # A failure here is reported by the first job that needs it instead.
+    from summarizer_backends import get_backend
+    try:
+        get_backend()
+    except Exception:
+        pass
+    start_workers().warm()
+
+
+def warm_up():
+    """
+    Import the pipeline modules and load Whisper in a background thread, once per process.
+
+    Called after login, so the login page doesn't wait on (or pay for) whisper,
+    torch or the LLM client while the first upload still finds them loaded.
+    """
+    global _warm_thread
+    with _runner_lock:
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=_import_pipeline, name="import-warmup", daemon=True)
+            _warm_thread.start()
+        return _warm_thread
@@ -0,0 +1,266 @@
+"""
+Outbound email queue.
+
+The app records each email in the outbox table and returns immediately; a
+background MailWorker sends them over one reused SMTP connection, retrying
+failures with exponential backoff. Emails queued as digest items are held
+until the daily digest time and then sent as one message per recipient
+with every PDF attached.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from database import get_connection, execute_write, run_in_writer
+from tracing import span
+
+# email_utils (smtplib, email.mime) is imported by the worker when it first sends,
+# so queueing from app.py doesn't load it
+
+# "daily" lets the UI put care logs into a once-a-day digest per recipient
+DIGEST_MODE = os.getenv("HOMECARE_MAIL_DIGEST", "off")
+DIGEST_HOUR = int(os.getenv("HOMECARE_MAIL_DIGEST_HOUR", "18"))
+
+MAX_ATTEMPTS = int(os.getenv("HOMECARE_MAIL_MAX_ATTEMPTS", "6"))
+RETRY_BACKOFF_SECONDS = 30
+POLL_SECONDS = 5
+CLAIM_BATCH_SIZE = 50
+# A worker refreshes the claim on its rows before every send; rows claimed
+# longer ago than this belong to a worker that died and are queued again
+STALE_CLAIM_SECONDS = 10 * 60
+
+OUTBOX_FIELDS = [
+    "id", "recipient", "subject", "body", "attachment", "attachment_name",
+    "digest", "attempts"
+]
+
+
+def next_digest_time(now=None):
+    """Return the next daily digest time as a Unix timestamp."""
+    now = now or datetime.now()
+    digest_at = now.replace(hour=DIGEST_HOUR, minute=0, second=0, microsecond=0)
+    if digest_at <= now:
+        digest_at += timedelta(days=1)
+    return digest_at.timestamp()
+
+
+def queue_email(recipient_email, subject, body, pdf=None, filename=None, digest=False):
+    """
+    Queue an email for the background worker and return its outbox id.
+
+    Args:
+        recipient_email (str): Address to send to
+        subject (str): Email subject
+        body (str): Plain-text message body
+        pdf (bytes): PDF to attach, if any
+        filename (str): Attachment name
+        digest (bool): Hold it for the recipient's next daily digest
+    """
+    send_at = next_digest_time() if digest else time.time()
+    outbox_id = execute_write('''
+        INSERT INTO outbox (recipient, subject, body, attachment, attachment_name, digest, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (recipient_email, subject, body, pdf, filename, int(digest), send_at)).result().lastrowid
+
+    start_mail_worker().wake()
+    return outbox_id
+
+
+def outbox_status(outbox_id):
+    """Return (status, error) for a queued email, or None if it doesn't exist."""
+    return get_connection().execute("SELECT status, error FROM outbox WHERE id = ?", (outbox_id,)).fetchone()
+
+
+def _is_permanent(error):
+    import smtplib
+
+    # 5xx replies won't succeed on retry; connection and 4xx problems might
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return False
+
+
+def digest_message(sender, recipient_email, items):
+    """Build one digest email carrying the attachments of every item."""
+    from email_utils import build_message
+
+    day = datetime.now().strftime("%Y-%m-%d")
+    lines = [f"Care log digest for {day}: {len(items)} care log(s) attached.", ""]
+    lines.extend(f"- {item['subject']}" for item in items)
+    attachments = [(item["attachment_name"], item["attachment"]) for item in items if item["attachment"]]
+    return build_message(sender, recipient_email, f"Care Log Digest - {day}", "\n".join(lines), attachments)
+
+
+class MailWorker:
+    """
+    Background thread that drains the outbox.
+
+    Due emails are claimed in batches inside a write transaction and stamped
+    with the worker's owner id, so two processes never send the same email;
+    only claims that have gone stale (their worker died) are queued again.
+    Sent emails keep their row (without the attachment) as a delivery record.
+    """
+
+    def __init__(self, settings=None):
+        # settings override smtp_settings(), e.g. to point at a local aiosmtpd
+        self._settings = settings
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._connection = None
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="mail-worker", daemon=True)
+
+    def start(self):
+        self._requeue_stale()
+        self._thread.start()
+
+    def _requeue_stale(self):
+        """Queue again rows whose sending worker hasn't renewed its claim in STALE_CLAIM_SECONDS."""
+        return execute_write(
+            "UPDATE outbox SET status = 'queued', owner = NULL WHERE status = 'sending' AND coalesce(claimed_at, 0) < ?",
+            (time.time() - STALE_CLAIM_SECONDS,)
+        ).result().rowcount
+
+    def _renew_claims(self):
+        execute_write(
+            "UPDATE outbox SET claimed_at = ? WHERE status = 'sending' AND owner = ?",
+            (time.time(), self.owner)
+        ).result()
+
+    def wake(self):
+        """Check the outbox now instead of at the next poll."""
+        self._wake.set()
+
+    def _claim_due(self):
+        def claim(conn):
+            now = time.time()
+            fields = ', '.join(OUTBOX_FIELDS)
+            rows = conn.execute(f'''
+                SELECT {fields} FROM outbox
+                WHERE status = 'queued' AND digest = 0 AND next_attempt_at <= ?
+                ORDER BY id
+                LIMIT ?
+            ''', (now, CLAIM_BATCH_SIZE)).fetchall()
+            # Digest items are claimed per recipient, all of them at once, so a
+            # recipient's digest is never split across several messages
+            recipients = conn.execute('''
+                SELECT recipient FROM outbox
+                WHERE status = 'queued' AND digest = 1 AND next_attempt_at <= ?
+                GROUP BY recipient
+                ORDER BY min(id)
+                LIMIT ?
+            ''', (now, CLAIM_BATCH_SIZE)).fetchall()
+            for (recipient,) in recipients:
+                rows += conn.execute(f'''
+                    SELECT {fields} FROM outbox
+                    WHERE status = 'queued' AND digest = 1 AND recipient = ? AND next_attempt_at <= ?
+                    ORDER BY id
+                ''', (recipient, now)).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', owner = ?, claimed_at = ? WHERE id = ?",
+                [(self.owner, now, row[0]) for row in rows]
+            )
+            return [dict(zip(OUTBOX_FIELDS, row)) for row in rows]
+
+        return run_in_writer(claim).result()
+
+    def _get_connection(self):
+        from email_utils import SmtpConnection, smtp_settings
+
+        if self._connection is None:
+            settings = self._settings or smtp_settings()
+            if settings is None:
+                raise RuntimeError("Email is not configured")
+            self._connection = SmtpConnection(settings)
+        return self._connection
+
+    def _run(self):
+        while True:
+            try:
+                items = self._claim_due()
+            except Exception as e:
+                print(f"Mail queue error: {e}")
+                items = []
+            if not items:
+                try:
+                    # Pick up mail left by workers that died while this one was running
+                    self._requeue_stale()
+                except Exception as e:
+                    print(f"Mail queue error: {e}")
+                if self._connection is not None:
+                    self._connection.close_if_idle()
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+                continue
+
+            # Digest items for the same recipient go out as one message
+            groups = {}
+            for item in items:
+                key = ("digest", item["recipient"]) if item["digest"] else ("single", item["id"])
+                groups.setdefault(key, []).append(item)
+            for group in groups.values():
+                self._send(group)
+
+    def _send(self, group):
+        from email_utils import build_message
+
+        ids = [(item["id"],) for item in group]
+        try:
+            # Keeps every row this worker still holds from looking abandoned
+            self._renew_claims()
+            connection = self._get_connection()
+            first = group[0]
+            if first["digest"]:
+                msg = digest_message(connection.settings["sender"], first["recipient"], group)
+            else:
+                msg = build_message(
+                    connection.settings["sender"], first["recipient"], first["subject"], first["body"],
+                    [(first["attachment_name"], first["attachment"])] if first["attachment"] else []
+                )
+            with span("send_email", queued=True, digest=bool(first["digest"]), messages=len(group)):
+                connection.send(msg)
+        except Exception as e:
+            if self._connection is not None:
+                self._connection.close()
+            attempts = max(item["attempts"] for item in group) + 1
+            # Parameters are built here: `e` is unbound once the except block ends
+            error = str(e)
+            if attempts >= MAX_ATTEMPTS or _is_permanent(e):
+                params = [(error, item_id) for (item_id,) in ids]
+                run_in_writer(lambda conn: conn.executemany(
+                    "UPDATE outbox SET status = 'failed', attempts = attempts + 1, error = ? WHERE id = ?", params
+                )).result()
+            else:
+                retry_at = time.time() + RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+                params = [(error, retry_at, item_id) for (item_id,) in ids]
+                run_in_writer(lambda conn: conn.executemany(
+                    "UPDATE outbox SET status = 'queued', attempts = attempts + 1, error = ?, next_attempt_at = ? WHERE id = ?",
+                    params
+                )).result()
+            return
+
+        run_in_writer(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = 'sent', attachment = NULL, error = NULL, sent_at = CURRENT_TIMESTAMP WHERE id = ?",
+            ids
+        )).result()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start_mail_worker(settings=None):
+    """
+    Start the mail worker once per process.
+
+    Safe to call on every Streamlit rerun.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = MailWorker(settings)
+            _worker.start()
+        return _worker
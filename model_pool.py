@@ -0,0 +1,247 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Inference profiles. "precision" is fp32, fp16 (CUDA only) or int8 (dynamic
+# quantization of the linear layers, CPU only); a beam_size of None decodes
+# greedily and a language of None lets Whisper detect it on every file.
+PROFILES = {
+    "default": {"model": "base", "precision": "fp32", "language": None, "beam_size": None},
+    "cpu": {"model": "base", "precision": "int8", "language": "en", "beam_size": None},
+    "cpu-small": {"model": "small", "precision": "int8", "language": "en", "beam_size": None},
+    "cpu-accurate": {"model": "small", "precision": "int8", "language": "en", "beam_size": 5},
+}
+
+# Non-secret settings come from the environment (see load_dotenv in app.py).
+# The individual settings override the chosen profile.
+PROFILE_NAME = os.getenv("HOMECARE_WHISPER_PROFILE", "default")
+if PROFILE_NAME not in PROFILES:
+    raise ValueError(
+        f"Unknown HOMECARE_WHISPER_PROFILE {PROFILE_NAME!r}; choose one of: {', '.join(PROFILES)}"
+    )
+PROFILE = PROFILES[PROFILE_NAME]
+DEFAULT_MODEL = os.getenv("HOMECARE_WHISPER_MODEL", PROFILE["model"])
+DEFAULT_DEVICE = os.getenv("HOMECARE_WHISPER_DEVICE", "")
+DEFAULT_PRECISION = os.getenv("HOMECARE_WHISPER_PRECISION", PROFILE["precision"])
+LANGUAGE = os.getenv("HOMECARE_WHISPER_LANGUAGE", PROFILE["language"] or "") or None
+BEAM_SIZE = int(os.getenv("HOMECARE_WHISPER_BEAM_SIZE", PROFILE["beam_size"] or 0)) or None
+# Torch threads per process that runs Whisper (0 lets torch use every core)
+TORCH_THREADS = int(os.getenv("HOMECARE_WHISPER_THREADS", "0"))
+INSTANCES_PER_MODEL = int(os.getenv("HOMECARE_WHISPER_INSTANCES", "1"))
+MAX_LOADED_MODELS = int(os.getenv("HOMECARE_WHISPER_MAX_MODELS", "2"))
+WARM_MODELS = [name.strip() for name in os.getenv("HOMECARE_WHISPER_WARM", DEFAULT_MODEL).split(",") if name.strip()]
+# Cross-request batching (see whisper_batcher.py); a batch size of 1 turns it off
+MAX_BATCH_SIZE = int(os.getenv("HOMECARE_WHISPER_BATCH_SIZE", "1"))
+MAX_BATCH_WAIT_MS = float(os.getenv("HOMECARE_WHISPER_BATCH_WAIT_MS", "50"))
+
+
+def resolve_device(device=None):
+    """Return the device Whisper should run on ("cuda" when available, else "cpu")."""
+    device = device or DEFAULT_DEVICE
+    if device:
+        return device
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def set_thread_budget(threads=None):
+    """
+    Limit torch to ``threads`` intra-op threads in this process.
+
+    Several Whisper processes on one machine each default to one thread per
+    core and end up fighting over them, so every worker gets a share.
+    """
+    threads = threads or TORCH_THREADS
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _plain_linears(module):
+    """Swap Whisper's Linear subclass for torch.nn.Linear so quantize_dynamic recognises it."""
+    import torch
+
+    for name, child in module.named_children():
+        if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+            linear = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+            linear.weight = child.weight
+            linear.bias = child.bias
+            setattr(module, name, linear)
+        else:
+            _plain_linears(child)
+
+
+def load_whisper_model(name, device, precision):
+    """
+    Load a Whisper model for the given device and precision.
+
+    Args:
+        name (str): Whisper model size, e.g. "base" or "small"
+        device (str): Torch device string
+        precision (str): "fp32", "fp16" (only honoured on CUDA) or "int8" (only honoured on CPU)
+    """
+    # Imported here so processes that never load a model don't pay for whisper and torch
+    import whisper
+
+    model = whisper.load_model(name, device=device)
+    if precision == "fp16" and device.startswith("cuda"):
+        model = model.half()
+    elif precision == "int8" and device == "cpu":
+        import torch
+        _plain_linears(model)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model
+
+
+def transcribe_options(model):
+    """
+    Keyword arguments for ``model.transcribe`` under the configured profile.
+
+    fp16 is only requested for half-precision (CUDA) models, which avoids
+    Whisper's FP16-on-CPU warning and fallback.
+    """
+    import torch
+
+    options = {"fp16": next(model.parameters()).dtype == torch.float16}
+    if LANGUAGE:
+        options["language"] = LANGUAGE
+    if BEAM_SIZE:
+        options["beam_size"] = BEAM_SIZE
+    return options
+
+
+def profile_settings():
+    """The settings that change a transcript, for cache keys."""
+    return {"precision": DEFAULT_PRECISION, "language": LANGUAGE, "beam_size": BEAM_SIZE}
+
+
+class _ModelSlot:
+    """All loaded instances of one (name, device, precision) combination."""
+
+    def __init__(self, key):
+        self.key = key
+        self.idle = []
+        self.total = 0
+        self.in_use = 0
+
+
+class ModelPool:
+    """
+    Process-wide registry of loaded Whisper models.
+
+    Each (name, device, precision) key holds at most ``instances_per_model``
+    loaded copies that are lent out to callers, so N concurrent transcriptions
+    share M models. When more than ``max_models`` keys are loaded, the least
+    recently used key with no instances on loan is evicted.
+    """
+
+    def __init__(self, instances_per_model=INSTANCES_PER_MODEL, max_models=MAX_LOADED_MODELS, loader=load_whisper_model):
+        self.instances_per_model = max(1, instances_per_model)
+        self.max_models = max(1, max_models)
+        self._loader = loader
+        self._slots = OrderedDict()
+        self._cond = threading.Condition()
+
+    def _key(self, name, device, precision):
+        return (name or DEFAULT_MODEL, resolve_device(device), precision or DEFAULT_PRECISION)
+
+    def _evict_idle(self):
+        """Drop least recently used slots that have nothing on loan. Caller holds the lock."""
+        for key in list(self._slots):
+            if len(self._slots) <= self.max_models:
+                return
+            slot = self._slots[key]
+            if slot.in_use == 0:
+                del self._slots[key]
+
+    def _checkout(self, key):
+        """Reserve an instance for ``key``; returns a model, or None if the caller must load one."""
+        with self._cond:
+            while True:
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._slots[key] = _ModelSlot(key)
+                self._slots.move_to_end(key)
+                if slot.idle:
+                    slot.in_use += 1
+                    return slot.idle.pop()
+                if slot.total < self.instances_per_model:
+                    # Reserve the instance now; it is loaded outside the lock
+                    slot.total += 1
+                    slot.in_use += 1
+                    self._evict_idle()
+                    return None
+                self._cond.wait()
+
+    def _checkin(self, key, model):
+        with self._cond:
+            slot = self._slots.get(key)
+            if slot is not None:
+                slot.in_use -= 1
+                if model is None:
+                    slot.total -= 1
+                else:
+                    slot.idle.append(model)
+                self._evict_idle()
+            self._cond.notify_all()
+
+    @contextmanager
+    def acquire(self, name=None, device=None, precision=None):
+        """
+        Borrow a loaded model, loading it on first use.
+
+        Blocks while every instance for the key is already on loan.
+        """
+        key = self._key(name, device, precision)
+        model = self._checkout(key)
+        try:
+            if model is None:
+                model = self._loader(*key)
+            yield model
+        except BaseException:
+            self._checkin(key, model)
+            raise
+        else:
+            self._checkin(key, model)
+
+    def warm(self, names=None, device=None, precision=None):
+        """Load one instance of each named model so the first request does not pay for it."""
+        for name in names or WARM_MODELS:
+            with self.acquire(name, device, precision):
+                pass
+
+    def loaded(self):
+        """Return {key: number of loaded instances}, most recently used last."""
+        with self._cond:
+            return {key: slot.total for key, slot in self._slots.items()}
+
+
+_pool = ModelPool()
+_warm_thread = None
+_warm_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide model pool."""
+    return _pool
+
+
+def acquire_model(name=None, device=None, precision=None):
+    """Borrow a model from the process-wide pool (use as a context manager)."""
+    return _pool.acquire(name, device, precision)
+
+
+def warm_up(names=None):
+    """
+    Load the configured models in a background thread, once per process.
+
+    Safe to call on every Streamlit rerun.
+    """
+    global _warm_thread
+    with _warm_lock:
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=_pool.warm, args=(names,), name="whisper-warmup", daemon=True)
+            _warm_thread.start()
+        return _warm_thread
@@ -1,35 +1,36 @@
 import requests
 import subprocess
 import time
-import streamlit as st
 
-def ensure_ollama_ready(model_name: str = "llama3"):
-    """
-    This function is temporarily disabled as we're using Gemini instead of LLaMA.
+# How long to wait for the Ollama server to answer a health check
+OLLAMA_CHECK_TIMEOUT_SECONDS = 5
+
+
+def ensure_ollama_ready(model_name: str = "llama3", base_url: str = "http://localhost:11434", timeout: float = OLLAMA_CHECK_TIMEOUT_SECONDS):
     """
-    return True  # Always return True since we're not using LLaMA
+    Check that Ollama is running and start the model if it isn't available yet.
     
+    Args:
+        model_name (str): Ollama model to use, e.g. "llama3"
+        base_url (str): Address of the Ollama server
+        timeout (float): Seconds to wait for the server to answer
+
+    Raises:
+        RuntimeError: If the Ollama server can't be reached
     """
-    # Original LLaMA implementation (commented out)
     try:
         # Check if Ollama API is reachable
-        response = requests.get("http://localhost:11434/api/tags")
-        if response.status_code != 200:
-            st.error("Ollama is not running. Please install Ollama from https://ollama.com")
-            return False
-        
-        # Check if model is available
-        models = response.json().get("models", [])
-        model_exists = any(model["name"] == model_name for model in models)
-        
-        if not model_exists:
-            st.info(f"Starting {model_name} model...")
-            subprocess.Popen(["ollama", "run", model_name])
-            time.sleep(5)  # Wait for model to start
-            
-        return True
-        
-    except requests.exceptions.ConnectionError:
-        st.error("Ollama is not running. Please install Ollama from https://ollama.com")
-        return False
-    """ 
\ No newline at end of file
+        response = requests.get(f"{base_url}/api/tags", timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        raise RuntimeError(f"Ollama is not running at {base_url}. Please install Ollama from https://ollama.com") from e
+    if response.status_code != 200:
+        raise RuntimeError(f"Ollama is not running at {base_url}. Please install Ollama from https://ollama.com")
+
+    # Check if model is available (tags are listed as e.g. "llama3:latest")
+    models = response.json().get("models", [])
+    model_exists = any(model["name"].split(":")[0] == model_name.split(":")[0] for model in models)
+
+    if not model_exists:
+        print(f"Starting {model_name} model...")
+        subprocess.Popen(["ollama", "run", model_name])
+        time.sleep(5)  # Wait for model to start
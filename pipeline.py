@@ -0,0 +1,134 @@
+"""
+Summarize a transcript while it is still being transcribed.
+
+Long recordings are transcribed chunk by chunk. IncrementalSummarizer takes
+the transcript as it grows and, once it is long enough to need map-reduce
+summarization, starts section notes for every full section right away, so
+by the time Whisper finishes only the last section and the final combining
+call remain. JobRunner uses it to overlap its transcribe and summarize
+stages.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from summarize import (
+    LONG_TRANSCRIPT_TOKENS, MAX_CONCURRENT_SECTIONS, SEGMENT_TOKENS,
+    estimate_tokens, generate_with_retry, reduce_prompt, stream_summary,
+    section_prompt, summarize_text, summary_cache, summary_key
+)
+from summarizer_backends import get_backend
+from tracing import span, annotate
+
+
+def _section_end(words, start, max_tokens):
+    """
+    Return where a section starting at ``words[start]`` should end.
+
+    Sections end after the last full sentence that fits in ``max_tokens``
+    (or at the limit if no sentence ends in time). Returns None while the
+    remaining words don't fill a section yet.
+    """
+    budget = max_tokens * 4
+    length = 0
+    end = start
+    sentence_end = None
+    while end < len(words) and length + len(words[end]) + 1 <= budget:
+        length += len(words[end]) + 1
+        end += 1
+        if words[end - 1][-1] in ".!?":
+            sentence_end = end
+    if end == len(words):
+        return None
+    return sentence_end or max(end, start + 1)
+
+
+class IncrementalSummarizer:
+    """
+    Map-reduce summarizer fed with a growing transcript.
+
+    Call update() with the transcript so far as often as it changes, then
+    finish() with the final transcript. Short transcripts never start
+    section notes, and finish() summarizes them with summarize_text as usual.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_SECTIONS, segment_tokens=SEGMENT_TOKENS):
+        self.segment_tokens = segment_tokens
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="section")
+        self._lock = threading.Lock()
+        self._backend = None
+        self._words = []
+        self._consumed = 0
+        self._notes = []
+        self._disabled = False
+
+    def _submit(self, end):
+        prompt = section_prompt(len(self._notes) + 1, " ".join(self._words[self._consumed:end]))
+        self._notes.append(self._executor.submit(self._section_notes, prompt))
+        self._consumed = end
+
+    def _section_notes(self, prompt):
+        # Already on one of the executor's threads, so the blocking call is fine here
+        return generate_with_retry(self._backend.generate, prompt)
+
+    def update(self, text):
+        """Take the transcript so far and start notes for any newly completed sections."""
+        with self._lock:
+            if self._disabled:
+                return
+            self._words = text.split()
+            if not self._notes and estimate_tokens(text) <= LONG_TRANSCRIPT_TOKENS:
+                return
+            if self._backend is None:
+                try:
+                    self._backend = get_backend()
+                except Exception:
+                    # Never break transcription; finish() reports the error through summarize_text
+                    self._disabled = True
+                    return
+            # The words after the last full section may still be mid-sentence, so they wait
+            while (end := _section_end(self._words, self._consumed, self.segment_tokens)) is not None:
+                self._submit(end)
+
+    def finish(self, text, on_partial=None):
+        """
+        Return the summary of the final transcript ``text``.
+
+        Args:
+            text (str): Complete transcript
+            on_partial (callable): Called with the summary so far while it streams in
+        """
+        try:
+            with self._lock:
+                words = text.split()
+                started = bool(self._notes) and words[:self._consumed] == self._words[:self._consumed]
+                if started:
+                    self._words = words
+                    while (end := _section_end(words, self._consumed, self.segment_tokens)) is not None:
+                        self._submit(end)
+                    if self._consumed < len(words):
+                        self._submit(len(words))
+            if not started:
+                return summarize_text(text, on_partial)
+            return self._reduce(text, on_partial)
+        finally:
+            self.close()
+
+    def _reduce(self, text, on_partial):
+        with span("summarize", incremental=True, sections=len(self._notes), transcript_chars=len(text)):
+            key = summary_key(text, self._backend)
+            cached = summary_cache.get(key)
+            if cached is not None:
+                annotate(cache_hit=True)
+                return cached
+            try:
+                notes = [future.result() for future in self._notes]
+                summary = stream_summary(self._backend, reduce_prompt(notes), on_partial)
+            except Exception:
+                # Let the regular path (with its own retries and error reporting) have a go
+                return summarize_text(text, on_partial)
+            summary_cache.put(key, summary)
+            annotate(cache_hit=False, summary_chars=len(summary))
+            return summary
+
+    def close(self):
+        """Stop any section notes that haven't started (e.g. after a failed transcription)."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,175 @@
+"""
+Supervisor reporting over the precomputed rollups.
+
+care_logs rows are never scanned here: counts, audio minutes and follow-ups
+come from caregiver_daily_stats / caregiver_stats, which triggers keep up to
+date as logs are saved (see database._create_sections_and_rollups), and
+open follow-ups come from the indexed care_log_sections table.
+
+Run `python reports.py backfill` once after upgrading to fill in the audio
+length of older logs and rebuild the rollups.
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from database import get_connection, init_db, run_in_writer, execute_write, section_values, rebuild_rollups, SECTION_COLUMNS
+
+ROLLUP_FIELDS = ["logs", "audio_seconds", "follow_ups", "open_follow_ups"]
+FOLLOW_UP_FIELDS = ["id", "username", "timestamp", "original_filename", "follow_up_notes"]
+
+
+def day_range(days):
+    """
+    Return (start, end) day strings covering the last ``days`` days, today included.
+
+    Days are UTC, like the CURRENT_TIMESTAMP that care_logs are stamped with.
+    """
+    today = datetime.now(timezone.utc).date()
+    return (today - timedelta(days=days - 1)).isoformat(), today.isoformat()
+
+
+def _range_conditions(start, end, username, alias=""):
+    prefix = f"{alias}." if alias else ""
+    conditions = [f"{prefix}day BETWEEN ? AND ?"]
+    params = [start, end]
+    if username:
+        conditions.append(f"{prefix}username = ?")
+        params.append(username)
+    return " AND ".join(conditions), params
+
+
+def totals(start, end, username=None):
+    """Logs, audio seconds and follow-ups from day ``start`` through ``end`` (YYYY-MM-DD)."""
+    where, params = _range_conditions(start, end, username)
+    row = get_connection().execute(f'''
+        SELECT {', '.join(f'coalesce(SUM({field}), 0)' for field in ROLLUP_FIELDS)}
+        FROM caregiver_daily_stats WHERE {where}
+    ''', params).fetchone()
+    return dict(zip(ROLLUP_FIELDS, row))
+
+
+def daily_stats(start, end, username=None):
+    """One row per day with any logs, oldest first."""
+    where, params = _range_conditions(start, end, username)
+    rows = get_connection().execute(f'''
+        SELECT day, {', '.join(f'SUM({field})' for field in ROLLUP_FIELDS)}
+        FROM caregiver_daily_stats WHERE {where}
+        GROUP BY day ORDER BY day
+    ''', params).fetchall()
+    return [dict(zip(["day"] + ROLLUP_FIELDS, row)) for row in rows]
+
+
+def caregiver_stats(start, end):
+    """
+    One row per caregiver with logs in the range, busiest first.
+
+    Besides the range's totals, each row has ``open_now`` (open follow-ups
+    from any day) and ``last_log_at`` from the all-time rollup.
+    """
+    where, params = _range_conditions(start, end, None, alias="d")
+    fields = ["username"] + ROLLUP_FIELDS + ["open_now", "last_log_at"]
+    rows = get_connection().execute(f'''
+        SELECT d.username, {', '.join(f'SUM(d.{field})' for field in ROLLUP_FIELDS)},
+               c.open_follow_ups, c.last_log_at
+        FROM caregiver_daily_stats d JOIN caregiver_stats c ON c.username = d.username
+        WHERE {where}
+        GROUP BY d.username ORDER BY SUM(d.logs) DESC, d.username
+    ''', params).fetchall()
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def open_follow_ups(username=None, limit=50):
+    """Logs whose follow-up notes haven't been marked done, newest first."""
+    conditions = ["s.follow_up_open = 1"]
+    params = []
+    if username:
+        conditions.append("l.username = ?")
+        params.append(username)
+    rows = get_connection().execute(f'''
+        SELECT l.id, l.username, l.timestamp, l.original_filename, s.follow_up_notes
+        FROM care_log_sections s JOIN care_logs l ON l.id = s.log_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY l.timestamp DESC, l.id DESC
+        LIMIT ?
+    ''', (*params, limit)).fetchall()
+    return [dict(zip(FOLLOW_UP_FIELDS, row)) for row in rows]
+
+
+def close_follow_up(log_id):
+    """Mark a log's follow-up as done; returns False if it wasn't open."""
+    cursor = execute_write('''
+        UPDATE care_log_sections SET follow_up_open = 0, follow_up_closed_at = CURRENT_TIMESTAMP
+        WHERE log_id = ? AND follow_up_open = 1
+    ''', (log_id,)).result()
+    return cursor.rowcount == 1
+
+
+def backfill(probe_audio=True, batch_size=500):
+    """
+    Fill in audio lengths for older logs, re-parse every summary and rebuild the rollups.
+
+    Follow-ups already marked done stay done.
+
+    Returns:
+        int: Number of logs whose audio length was filled in
+    """
+    from uploads import UploadRejected, probe_audio as probe
+
+    probed = 0
+    if probe_audio:
+        missing = get_connection().execute('''
+            SELECT id, audio_path FROM care_logs
+            WHERE audio_seconds IS NULL AND audio_path IS NOT NULL AND audio_path != ''
+        ''').fetchall()
+        for start in range(0, len(missing), batch_size):
+            updates = []
+            for log_id, audio_path in missing[start:start + batch_size]:
+                try:
+                    seconds = probe(audio_path)["duration"]
+                except (UploadRejected, OSError):
+                    continue
+                if seconds is not None:
+                    updates.append((seconds, log_id))
+            run_in_writer(lambda conn, updates=updates: conn.executemany(
+                "UPDATE care_logs SET audio_seconds = ? WHERE id = ?", updates
+            )).result()
+            probed += len(updates)
+
+    def reparse(conn):
+        assignments = ", ".join(f"{column} = ?" for column in SECTION_COLUMNS if column != "follow_up_open")
+        for log_id, summary in conn.execute("SELECT id, summary FROM care_logs"):
+            values = section_values(summary)[:-1]
+            conn.execute("INSERT OR IGNORE INTO care_log_sections (log_id) VALUES (?)", (log_id,))
+            conn.execute(f"UPDATE care_log_sections SET {assignments} WHERE log_id = ?", (*values, log_id))
+            # Re-open only follow-ups that were never closed by hand
+            conn.execute(
+                "UPDATE care_log_sections SET follow_up_open = has_follow_up WHERE log_id = ? AND follow_up_closed_at IS NULL",
+                (log_id,)
+            )
+        rebuild_rollups(conn)
+
+    run_in_writer(reparse).result()
+    return probed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Care log reporting tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subcommands.add_parser("backfill", help="Fill in audio lengths and rebuild the rollups")
+    backfill_parser.add_argument("--no-probe", action="store_true", help="Don't read audio lengths with ffprobe")
+    summary = subcommands.add_parser("summary", help="Print per-caregiver totals")
+    summary.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "backfill":
+        print(f"Filled in the audio length of {backfill(not args.no_probe)} logs; rollups rebuilt")
+    elif args.command == "summary":
+        for row in caregiver_stats(*day_range(args.days)):
+            print(
+                f"{row['username']:<20} {row['logs']:>6} logs {row['audio_seconds'] / 60:>8.1f} audio min "
+                f"{row['open_follow_ups']:>4} open follow-ups"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import sqlite3
+import time
+from database import get_connection, execute_write, run_in_writer
+
+
+def make_key(*parts, options=None):
+    """
+    Build a cache key from content hashes, model names and decode options.
+
+    Options are serialized with sorted keys so equivalent dicts map to the same key.
+    """
+    payload = ":".join(str(part) for part in parts)
+    if options:
+        payload += ":" + json.dumps(options, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent, size-bounded LRU cache of text results stored in homecare.db.
+
+    The table is created by a schema migration (see database.create_cache_table).
+
+    Entries are evicted least recently used first once the stored text
+    exceeds ``max_bytes``. Hits and misses are recorded by the callers as
+    ``cache_hit`` on their tracing spans, which the metrics page reads.
+    """
+
+    def __init__(self, table, max_bytes):
+        self.table = table
+        self.max_bytes = max_bytes
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None on a miss."""
+        try:
+            row = get_connection().execute(f'SELECT value FROM {self.table} WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                # Don't make the caller wait for the LRU timestamp to be written
+                execute_write(f'UPDATE {self.table} SET last_access = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.Error as e:
+            print(f"Cache error: {e}")
+            row = None
+        return row[0] if row is not None else None
+
+    def put(self, key, value):
+        """Store ``value`` under ``key`` and evict old entries past the size limit."""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+
+        def store(conn):
+            conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)',
+                (key, value, size, now, now)
+            )
+            total = conn.execute(f'SELECT COALESCE(SUM(size), 0) FROM {self.table}').fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+
+        try:
+            run_in_writer(store).result()
+        except sqlite3.Error as e:
+            print(f"Cache error: {e}")
+
+    def _evict(self, conn, excess):
+        freed = 0
+        stale = []
+        for key, size in conn.execute(f'SELECT key, size FROM {self.table} ORDER BY last_access'):
+            if freed >= excess:
+                break
+            stale.append((key,))
+            freed += size
+        conn.executemany(f'DELETE FROM {self.table} WHERE key = ?', stale)
+
+    def stats(self):
+        """Return the stored entry count and size (None if the table can't be read)."""
+        try:
+            entries, size = get_connection().execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}').fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        return {"entries": entries, "bytes": size}
@@ -0,0 +1,81 @@
+"""
+Split a care log summary into its four sections.
+
+Summaries follow the structure PROMPT_TEMPLATE asks for (Patient Status,
+Key Observations, Actions Taken, Follow-up Notes), but models vary the
+heading style: "1. Patient Status", "**Patient Status:**", "## Patient
+Status" and so on. The sections are parsed once when a log is saved and
+stored in care_log_sections, so reports never re-parse the text.
+"""
+import re
+
+# (column in care_log_sections, heading pattern)
+SECTIONS = [
+    ("patient_status", r"patient\s+status"),
+    ("key_observations", r"(?:key\s+)?observations"),
+    ("actions_taken", r"actions?\s+taken"),
+    ("follow_up_notes", r"follow[\s-]?up(?:\s+notes)?"),
+]
+
+# A heading line: optional markdown/numbering and the section name, then either
+# the end of the line or a colon followed by the start of the section's text.
+# "Follow-up with the GP on Tuesday" is body text, not a heading.
+_HEADING = re.compile(
+    r"^[ \t#>*_-]*(?:\d+[.)][ \t]*)?[*_]*[ \t]*(?:"
+    + "|".join(f"(?P<{column}>{pattern})" for column, pattern in SECTIONS)
+    + r")[ \t]*[*_]*[ \t]*(?::[ \t]*[*_]*[ \t]*(?P<rest>.*?))?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Whole sentences that say there is nothing to follow up: "None", "None
+# required", "N/A", "Nothing to report", "No additional follow-up needed"...
+# Matched to the end of the sentence, so instructions that merely start the
+# same way ("Nothing by mouth after midnight", "Nil by mouth from 10pm",
+# "None of her medications until the GP reviews them") stay open.
+_QUALIFIERS = (
+    r"(?:\s+(?:is|are))?"
+    r"(?:\s+(?:required|needed|necessary|noted|planned|identified|reported|indicated"
+    r"|at\s+(?:this|the\s+moment|present)(?:\s+time)?|for\s+now|currently))*"
+)
+_NO_FOLLOW_UP = re.compile(
+    r"^(?:(?:none|n/?a|nil)" + _QUALIFIERS
+    + r"|nothing(?:\s+(?:further|else|new|(?:to\s+(?:report|note|add|follow[\s-]?up))))?" + _QUALIFIERS
+    + r"|no\s+(?:(?:additional|further|new|other|specific|immediate)\s+)*"
+    r"(?:follow[\s-]?ups?|actions?|concerns?|issues?)" + _QUALIFIERS + r")$",
+    re.IGNORECASE
+)
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+
+def parse_sections(summary):
+    """
+    Return {column: text} for the four sections found in ``summary``.
+
+    Sections that are missing come back as None. A heading that appears
+    twice keeps the first occurrence.
+    """
+    matches = list(_HEADING.finditer(summary or ""))
+    parsed = {column: None for column, _ in SECTIONS}
+    for index, match in enumerate(matches):
+        column = next(name for name, _ in SECTIONS if match.group(name))
+        if parsed[column] is not None:
+            continue
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(summary)
+        text = ((match.group("rest") or "") + summary[match.end():end]).strip()
+        parsed[column] = text or None
+    return parsed
+
+
+def needs_follow_up(follow_up_notes):
+    """
+    True if the Follow-up Notes section asks for something to be done.
+
+    Notes whose every sentence is a plain "none" / "no follow-up needed"
+    count as nothing to follow up.
+    """
+    sentences = [
+        re.sub(r"^[\s*•\-]+|[\s.!;*]+$", "", sentence)
+        for sentence in _SENTENCE_BREAK.split(follow_up_notes or "")
+    ]
+    sentences = [sentence for sentence in sentences if sentence]
+    return not all(_NO_FOLLOW_UP.match(sentence) for sentence in sentences)
@@ -0,0 +1,90 @@
+"""
+Import-time profile of app.py's startup.
+
+Imports everything app.py imports at module level in a fresh interpreter
+with `python -X importtime`, prints the slowest imports and fails if the
+total is over budget or a heavy dependency is loaded before login.
+
+    python startup_profile.py --budget 1.5
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+BUDGET_SECONDS = float(os.getenv("HOMECARE_STARTUP_BUDGET_SECONDS", "2.0"))
+
+# Packages that must only be imported on first use or by the warm-up thread
+HEAVY_MODULES = ["whisper", "torch", "google.generativeai", "fpdf", "smtplib"]
+
+
+def top_level_imports(script):
+    """Return the modules ``script`` imports at module level, in order."""
+    with open(script) as f:
+        tree = ast.parse(f.read(), filename=script)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def profile_imports(modules):
+    """
+    Import ``modules`` in a fresh interpreter and parse the -X importtime report.
+
+    Returns:
+        list: (module, self seconds, cumulative seconds, depth) per import, in load order
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing the app's modules failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the imports app.py pays for before the login page renders")
+    parser.add_argument("--script", default="app.py")
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS, help="Maximum total import time in seconds")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    args = parser.parse_args()
+
+    modules = top_level_imports(args.script)
+    imports = profile_imports(modules)
+
+    # Top-level entries (depth 0) are timed inclusive of everything they pull in
+    total = sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+    print(f"Total import time for {args.script}: {total:.3f}s (budget {args.budget:.3f}s)\n")
+
+    print("Slowest imports (cumulative):")
+    for name, self_time, cumulative, depth in sorted(imports, key=lambda item: item[2], reverse=True)[:args.top]:
+        print(f"  {cumulative:8.3f}s  {self_time:8.3f}s self  {name}")
+
+    loaded = {name for name, _, _, _ in imports}
+    leaked = [module for module in HEAVY_MODULES if module in loaded]
+    if leaked:
+        print(f"\nHeavy modules imported at startup: {', '.join(leaked)}")
+
+    if total > args.budget or leaked:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+Storage layout, compaction and retention for audio and exported summaries.
+
+Archived audio lives in hashed shards under audio_uploads/ (see uploads.py).
+Once a memo has been transcribed and logged for HOMECARE_COMPACT_AFTER_HOURS,
+the maintenance job transcodes the original to mono Opus, which is a small
+fraction of the size of a WAV and plenty for listening back or
+re-transcribing. After HOMECARE_COLD_AFTER_DAYS, audio (and any kept
+exports) is moved to HOMECARE_COLD_STORAGE_DIR, e.g. a cheaper disk or a
+mounted bucket. Every move updates the paths stored in the database.
+
+TXT and PDF files are rendered from care_logs.summary when someone
+downloads, emails or archives them, so they are no longer written at the
+end of every job unless HOMECARE_KEEP_EXPORT_FILES is on. The maintenance
+job also deletes old metrics and reclaims free database pages a batch at a
+time with incremental VACUUM.
+
+    python storage.py maintain
+    python storage.py maintain --full-vacuum   # once, to switch an existing database to incremental vacuum
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+from database import get_connection, run_in_writer, _connect
+
+EXPORT_DIR = "summaries"
+KEEP_EXPORT_FILES = os.getenv("HOMECARE_KEEP_EXPORT_FILES", "off").lower() in ("on", "1", "true")
+
+COMPACT_EXTENSION = ".opus"
+OPUS_BITRATE = os.getenv("HOMECARE_OPUS_BITRATE", "24k")
+COMPACT_AFTER_HOURS = float(os.getenv("HOMECARE_COMPACT_AFTER_HOURS", "24"))
+
+# Cold tier is off unless a folder is configured
+COLD_STORAGE_DIR = os.getenv("HOMECARE_COLD_STORAGE_DIR", "")
+COLD_AFTER_DAYS = float(os.getenv("HOMECARE_COLD_AFTER_DAYS", "90"))
+
+METRICS_RETENTION_DAYS = float(os.getenv("HOMECARE_METRICS_RETENTION_DAYS", "30"))
+# How often the app runs maintenance in the background (0 turns it off, e.g. when cron runs it)
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("HOMECARE_MAINTENANCE_HOURS", "24"))
+
+# An archived recording uploaded again this recently is left where it is, since its job may not be queued yet
+REUSE_GRACE_SECONDS = 3600
+
+# Files changed per maintenance step and pass, and free pages returned to the OS per pass
+MAINTENANCE_BATCH = 200
+VACUUM_PAGES = 2000
+
+# Every column that stores a path to an audio file or export, so moves can update them all
+AUDIO_REFERENCES = [("care_logs", "audio_path"), ("jobs", "audio_path"), ("ingest_files", "audio_path")]
+EXPORT_REFERENCES = [
+    ("care_logs", "txt_path"), ("care_logs", "pdf_path"),
+    ("jobs", "txt_path"), ("jobs", "pdf_path"),
+    ("ingest_files", "txt_path"), ("ingest_files", "pdf_path"),
+]
+
+
+def shard_path(root, name):
+    """Return ``root/<aa>/<bb>/name``, sharded by a hash of ``name`` so no folder grows huge."""
+    digest = hashlib.sha256(name.encode("utf-8")).hexdigest()
+    return os.path.join(root, digest[:2], digest[2:4], name)
+
+
+def export_paths(base_filename):
+    """
+    Where a job's TXT and PDF go, or empty paths when exports aren't kept.
+
+    Paths are known before the files are written, so the care log can be
+    saved alongside the export.
+    """
+    if not KEEP_EXPORT_FILES:
+        return {"txt_path": "", "pdf_path": ""}
+    # Both files share one shard
+    base_path = shard_path(EXPORT_DIR, base_filename)
+    return {"txt_path": f"{base_path}.txt", "pdf_path": f"{base_path}.pdf"}
+
+
+def save_exports(paths, summary, pdf=None):
+    """
+    Write the TXT and PDF to ``paths`` (from export_paths), if exports are kept.
+
+    Args:
+        paths (dict): txt_path and pdf_path
+        summary (str): Summary text
+        pdf (CareLogPDF): Document already set up ahead of time
+    """
+    if not paths["pdf_path"]:
+        return
+    from export_pdf import export_to_pdf
+
+    os.makedirs(os.path.dirname(paths["txt_path"]), exist_ok=True)
+    with open(paths["txt_path"], "w") as f:
+        f.write(summary)
+    data = export_to_pdf(summary, pdf=pdf)
+    with open(paths["pdf_path"], "wb") as f:
+        f.write(data)
+
+
+def _unfinished_references(conn, path):
+    """True if a queued or running job (or pending import) still needs the file at ``path``."""
+    return conn.execute('''
+        SELECT 1 FROM jobs WHERE audio_path = ? AND status IN ('queued', 'running')
+        UNION ALL
+        SELECT 1 FROM ingest_files WHERE audio_path = ? AND status = 'pending'
+    ''', (path, path)).fetchone() is not None
+
+
+def _recently_reused(path):
+    # ingest_upload touches an archived recording when it is uploaded again
+    try:
+        return os.path.getmtime(path) > time.time() - REUSE_GRACE_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+def _replace_file(old_path, new_path, references):
+    """
+    Point every reference to ``old_path`` at ``new_path`` and delete ``old_path``.
+
+    Both happen in one writer transaction, which is also where ingest_upload
+    reuses an archived recording, so an upload can't pick up the old file
+    between the check and the delete. Returns False, changing nothing, if
+    unfinished work still needs the old file or it was reused in the last
+    REUSE_GRACE_SECONDS (its job may not be queued yet).
+    """
+    def update(conn):
+        if _unfinished_references(conn, old_path) or _recently_reused(old_path):
+            return False
+        for table, column in references:
+            conn.execute(f"UPDATE {table} SET {column} = ? WHERE {column} = ?", (new_path, old_path))
+        _remove(old_path)
+        return True
+
+    return run_in_writer(update).result()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # Already gone, e.g. a duplicate upload compacted earlier
+
+
+def transcode_to_opus(source, target):
+    """
+    Transcode ``source`` to mono Opus at ``target`` (written to a temp file, then renamed).
+
+    Raises:
+        RuntimeError: If FFmpeg fails
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = target + ".part"
+    process = subprocess.run(
+        [
+            "ffmpeg",
+            "-v", "error",
+            "-y",
+            "-i", source,
+            "-ac", "1",
+            "-c:a", "libopus",
+            "-b:a", OPUS_BITRATE,
+            "-application", "voip",   # Tuned for speech
+            "-f", "ogg",
+            tmp_path
+        ],
+        stdin=subprocess.DEVNULL,
+        capture_output=True
+    )
+    if process.returncode != 0:
+        _remove(tmp_path)
+        raise RuntimeError(process.stderr.decode("utf-8", errors="replace"))
+    os.replace(tmp_path, target)
+
+
+def _logged_before(column, cutoff_sql, extra_where=""):
+    # Paths whose most recent care log is older than the cutoff (one recording may be logged twice)
+    return [row[0] for row in get_connection().execute(f'''
+        SELECT {column} FROM care_logs
+        WHERE {column} IS NOT NULL AND {column} != '' {extra_where}
+        GROUP BY {column}
+        HAVING max(timestamp) < datetime('now', ?)
+    ''', (cutoff_sql,)).fetchall()]
+
+
+def compact_audio():
+    """Transcode archived originals logged more than COMPACT_AFTER_HOURS ago to Opus; returns bytes saved."""
+    saved = 0
+    paths = _logged_before(
+        "audio_path", f"-{COMPACT_AFTER_HOURS} hours",
+        f"AND audio_path NOT LIKE '%{COMPACT_EXTENSION}'"
+    )
+    handled = 0
+    for path in paths:
+        if handled >= MAINTENANCE_BATCH:
+            break
+        if not os.path.exists(path):
+            continue
+        handled += 1
+        target = os.path.splitext(path)[0] + COMPACT_EXTENSION
+        try:
+            if not os.path.exists(target):
+                transcode_to_opus(path, target)
+        except (RuntimeError, OSError) as e:
+            print(f"Could not compact {path}: {e}")
+            continue
+        size = os.path.getsize(path)
+        if _replace_file(path, target, AUDIO_REFERENCES):
+            saved += size - os.path.getsize(target)
+    return saved
+
+
+def drop_exports():
+    """Delete stored TXT/PDF files of old care logs; they are rendered from the summary when needed."""
+    removed = 0
+    for column in ("txt_path", "pdf_path"):
+        for path in _logged_before(column, f"-{COMPACT_AFTER_HOURS} hours")[:MAINTENANCE_BATCH]:
+            if _replace_file(path, "", EXPORT_REFERENCES):
+                removed += 1
+    return removed
+
+
+def _cold_path(path):
+    """
+    Mirror ``path`` (relative to the app folder) under COLD_STORAGE_DIR.
+
+    Raises:
+        ValueError: If ``path`` is outside the app folder, so it can't escape the cold tier
+    """
+    relpath = os.path.relpath(os.path.abspath(path))
+    if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+        raise ValueError(f"{path} is outside the app folder")
+    return os.path.join(COLD_STORAGE_DIR, relpath)
+
+
+def move_to_cold():
+    """Move audio and exports of care logs older than COLD_AFTER_DAYS to the cold tier; returns files moved."""
+    if not COLD_STORAGE_DIR:
+        return 0
+    cold_root = os.path.abspath(COLD_STORAGE_DIR)
+    moved = 0
+    targets = [("audio_path", AUDIO_REFERENCES)]
+    if KEEP_EXPORT_FILES:
+        targets += [("txt_path", EXPORT_REFERENCES), ("pdf_path", EXPORT_REFERENCES)]
+    for column, references in targets:
+        for path in _logged_before(column, f"-{COLD_AFTER_DAYS} days"):
+            if moved >= MAINTENANCE_BATCH:
+                break
+            if os.path.abspath(path).startswith(cold_root + os.sep) or not os.path.exists(path):
+                continue
+            try:
+                target = _cold_path(path)
+            except ValueError as e:
+                print(f"Could not move {path} to cold storage: {e}")
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Copied first, so the hot copy is only deleted once the cold one is complete
+            shutil.copyfile(path, target + ".part")
+            os.replace(target + ".part", target)
+            if _replace_file(path, target, references):
+                moved += 1
+            else:
+                _remove(target)
+    return moved
+
+
+def prune_metrics():
+    """Delete timing spans older than METRICS_RETENTION_DAYS; returns rows deleted."""
+    cutoff = time.time() - METRICS_RETENTION_DAYS * 86400
+    return run_in_writer(lambda conn: conn.execute("DELETE FROM metrics WHERE started_at < ?", (cutoff,)).rowcount).result()
+
+
+def vacuum(full=False):
+    """
+    Return free database pages to the OS.
+
+    Incremental vacuum only works once the database uses auto_vacuum=INCREMENTAL,
+    which an existing database only switches to with one full VACUUM (``full``).
+    Runs on its own connection, since VACUUM can't run inside the writer's
+    transactions.
+    """
+    conn = _connect()
+    try:
+        if full:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return False
+        # execute() would step the pragma once and free a single page; executescript runs it to completion
+        conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES});")
+        return True
+    finally:
+        conn.close()
+
+
+def run_maintenance(full_vacuum=False):
+    """Run every compaction and retention step once and return what each did."""
+    results = {
+        "audio_bytes_saved": compact_audio(),
+        "exports_removed": 0 if KEEP_EXPORT_FILES else drop_exports(),
+        "moved_to_cold": move_to_cold(),
+        "metrics_deleted": prune_metrics(),
+    }
+    results["vacuumed"] = vacuum(full_vacuum)
+    return results
+
+
+_maintenance_thread = None
+_maintenance_lock = threading.Lock()
+
+
+def _maintenance_loop():
+    while True:
+        try:
+            print(f"Storage maintenance: {run_maintenance()}")
+        except Exception as e:
+            print(f"Storage maintenance failed: {e}")
+        time.sleep(MAINTENANCE_INTERVAL_HOURS * 3600)
+
+
+def start_maintenance():
+    """
+    Run storage maintenance every MAINTENANCE_INTERVAL_HOURS in a background thread, once per process.
+
+    Safe to call on every Streamlit rerun.
+    """
+    global _maintenance_thread
+    with _maintenance_lock:
+        if _maintenance_thread is None and MAINTENANCE_INTERVAL_HOURS > 0:
+            _maintenance_thread = threading.Thread(target=_maintenance_loop, name="storage-maintenance", daemon=True)
+            _maintenance_thread.start()
+        return _maintenance_thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact and expire stored audio, exports and metrics")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    maintain = subparsers.add_parser("maintain", help="Run every maintenance step once")
+    maintain.add_argument("--full-vacuum", action="store_true", help="Switch the database to incremental vacuum with one full VACUUM")
+    args = parser.parse_args()
+
+    from database import init_db
+    init_db()
+    for step, result in run_maintenance(args.full_vacuum).items():
+        print(f"{step}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,18 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import streamlit as st
-import google.generativeai as genai
+from result_cache import ResultCache, make_key
+from summarizer_backends import get_backend
+from tracing import traced, annotate, record_error
 
-def summarize_text(text):
-    """
-    Summarize the given text using Google's Gemini API.
-    """
-    if "GEMINI_API_KEY" not in st.secrets:
-        st.warning("Missing Gemini API key in Streamlit secrets.")
-        return "Error: Gemini API key not configured."
-    
-    try:
-        # Configure Gemini API
-        genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
-        
-        # Initialize the model
-        model = genai.GenerativeModel('gemini-pro')
-        
-        # Create the prompt
-        prompt = f"""
+# Bump whenever PROMPT_TEMPLATE changes so cached summaries from the old prompt are not reused
+PROMPT_VERSION = 1
+PROMPT_TEMPLATE = """
         As a healthcare documentation specialist, please summarize the following caregiver's voice memo 
         into a clear, professional care log. Focus on key medical observations, patient status, 
         and any actions taken. Use medical terminology where appropriate but keep it accessible.
@@ -31,40 +26,239 @@ def summarize_text(text):
         3. Actions Taken
         4. Follow-up Notes
         """
+
+# Transcripts longer than this are summarized section by section, then combined
+LONG_TRANSCRIPT_TOKENS = int(os.getenv("HOMECARE_LONG_TRANSCRIPT_TOKENS", "4000"))
+SEGMENT_TOKENS = int(os.getenv("HOMECARE_SEGMENT_TOKENS", "1500"))
+MAX_CONCURRENT_SECTIONS = int(os.getenv("HOMECARE_MAX_CONCURRENT_SECTIONS", "4"))
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 1.0
+
+SECTION_PROMPT_TEMPLATE = """
+        You are helping a healthcare documentation specialist. Below is {part} 
+        of a caregiver's voice memo transcript. Write concise notes covering everything in this 
+        part that relates to patient status, observations, actions taken and follow-up needs. 
+        Do not invent details that are not in the transcript.
         
-        # Generate the summary
-        response = model.generate_content(prompt)
+        Transcript {part}:
+        {text}
+        """
+
+REDUCE_PROMPT_TEMPLATE = """
+        As a healthcare documentation specialist, combine the following notes, taken in order 
+        from sections of one caregiver's voice memo, into a clear, professional care log. 
+        Use medical terminology where appropriate but keep it accessible.
         
-        return response.text
+        Section notes:
+        {notes}
         
-    except Exception as e:
-        st.error(f"Error generating summary: {str(e)}")
-        return f"Error: {str(e)}"
-
-# Original LLaMA implementation (commented out for now)
-"""
-def summarize_text(text: str) -> str:
-    # Summarizes text using Ollama's LLaMA 3 model.
-    
+        Please provide a structured summary with these sections:
+        1. Patient Status
+        2. Key Observations
+        3. Actions Taken
+        4. Follow-up Notes
+        """
+
+SUMMARY_CACHE_BYTES = int(float(os.getenv("HOMECARE_SUMMARY_CACHE_MB", "64")) * 1024 * 1024)
+summary_cache = ResultCache("summary_cache", SUMMARY_CACHE_BYTES)
+
+# Minimum gap between on_partial callbacks while a summary streams in
+PARTIAL_INTERVAL_SECONDS = 0.2
+
+# Summaries currently being generated, keyed like the cache
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def split_transcript(text, max_tokens=SEGMENT_TOKENS):
+    """
+    Split a transcript into segments of at most ``max_tokens`` estimated tokens.
+
+    Segments break between sentences where possible, and between words
+    when a single sentence is too long.
+    """
+    segments = []
+    current = []
+    current_tokens = 0
+
+    pieces = []
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        if estimate_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words = sentence.split()
+        step = max(1, max_tokens * 4 // 6)  # ~6 characters per word including the space
+        pieces.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            segments.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        segments.append(" ".join(current))
+    return segments
+
+
+def generate_with_retry(generate, prompt, retries=MAX_RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+    """Call ``generate``, retrying failed calls with exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return generate(prompt)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random() / 2))
+
+
+def section_prompt(index, text, total=None):
+    """
+    Build the map-step prompt for one section of a transcript.
+
+    ``total`` may be None when the transcript is still being transcribed.
+    """
+    part = f"part {index} of {total}" if total else f"part {index}"
+    return SECTION_PROMPT_TEMPLATE.format(part=part, text=text)
+
+
+def reduce_prompt(notes):
+    """Build the prompt that combines section notes into the four-section care log."""
+    numbered = "\n\n".join(f"Section {index}:\n{note.strip()}" for index, note in enumerate(notes, start=1))
+    return REDUCE_PROMPT_TEMPLATE.format(notes=numbered)
+
+
+def summarize_sections(text, backend=None, max_concurrency=MAX_CONCURRENT_SECTIONS, segment_tokens=SEGMENT_TOKENS):
+    """
+    Map step: summarize each segment of a long transcript concurrently.
+
+    At most ``max_concurrency`` calls run at once, in a thread pool; failed
+    calls are retried with exponential backoff.
+
     Args:
-        text (str): Text to summarize
-        
+        text (str): Full transcript
+        backend (SummarizerBackend): Backend to call (default: the configured one)
+        max_concurrency (int): Maximum simultaneous ``generate`` calls
+        segment_tokens (int): Maximum estimated tokens per segment
+
     Returns:
-        str: Summarized text
-    
-    prompt = f"Summarize this caregiver voice note into a professional, clear care log: {text}"
-    
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "llama3",
-            "prompt": prompt,
-            "stream": False
-        }
-    )
-    
-    if response.status_code == 200:
-        return response.json()["response"]
-    else:
-        raise Exception(f"Error from Ollama API: {response.text}")
-""" 
\ No newline at end of file
+        list: Notes for each segment, in transcript order
+    """
+    backend = backend or get_backend()
+    segments = split_transcript(text, segment_tokens)
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="section") as pool:
+        return list(pool.map(
+            lambda item: generate_with_retry(backend.generate, section_prompt(item[0], item[1], len(segments))),
+            enumerate(segments, start=1)
+        ))
+
+
+def summarize_long(text, backend=None, on_partial=None):
+    """
+    Blocking map-reduce summarization for use from threads and scripts.
+
+    The map step runs concurrently; the final reduce step is streamed
+    through ``on_partial`` like a regular summary.
+    """
+    backend = backend or get_backend()
+    notes = summarize_sections(text, backend)
+    return stream_summary(backend, reduce_prompt(notes), on_partial)
+
+
+def stream_summary(backend, prompt, on_partial=None):
+    """Generate a summary, passing the text so far to ``on_partial`` as it streams in."""
+    if on_partial is None:
+        return backend.generate(prompt)
+
+    parts = []
+    last_update = 0.0
+    for piece in backend.stream(prompt):
+        parts.append(piece)
+        now = time.monotonic()
+        if now - last_update >= PARTIAL_INTERVAL_SECONDS:
+            on_partial("".join(parts))
+            last_update = now
+    summary = "".join(parts)
+    on_partial(summary)
+    return summary
+
+
+def summary_key(text, backend):
+    """Cache key for a transcript under the current prompt and the backend's model."""
+    return make_key(hashlib.sha256(text.encode("utf-8")).hexdigest(), PROMPT_VERSION, backend.name, backend.model_name)
+
+
+@traced("summarize")
+def summarize_text(text, on_partial=None):
+    """
+    Summarize the given text with the configured backend (Gemini by default).
+
+    Results are cached by transcript hash, prompt version and model name,
+    and concurrent requests for the same transcript share one backend call.
+
+    Args:
+        text (str): Transcript to summarize
+        on_partial (callable): Called with the summary so far while it streams in
+
+    Raises:
+        ValueError: If the backend is unknown or the Gemini API key is missing
+        Exception: Whatever the backend raised, so callers can report it
+    """
+    backend = get_backend()
+    if backend.name == "gemini" and "GEMINI_API_KEY" not in st.secrets:
+        raise ValueError("Gemini API key not configured.")
+
+    annotate(backend=backend.name, model=backend.model_name, transcript_chars=len(text))
+    key = summary_key(text, backend)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        annotate(cache_hit=True)
+        return cached
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+    if not leader:
+        annotate(cache_hit=False, coalesced=True)
+        return future.result()
+
+    annotate(cache_hit=False, coalesced=False)
+    summary = error = None
+    try:
+        # Generate the summary
+        long_transcript = estimate_tokens(text) > LONG_TRANSCRIPT_TOKENS
+        annotate(map_reduce=long_transcript)
+        if long_transcript:
+            summary = summarize_long(text, backend, on_partial)
+        else:
+            summary = stream_summary(backend, PROMPT_TEMPLATE.format(text=text), on_partial)
+        summary_cache.put(key, summary)
+        annotate(summary_chars=len(summary))
+
+    except BaseException as e:
+        error = e
+        if isinstance(e, Exception):
+            record_error(str(e))
+        raise
+
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+        # Resolved here so waiting requests never hang, even when the leader is
+        # stopped by a BaseException (KeyboardInterrupt, Streamlit's StopException)
+        if error is None:
+            future.set_result(summary)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            future.set_exception(RuntimeError("Summary generation was interrupted."))
+
+    return summary
@@ -0,0 +1,180 @@
+import abc
+import json
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import streamlit as st
+from ollama_helper import ensure_ollama_ready
+
+# Which backend summarize.py uses: "gemini", "ollama" or "stub"
+SUMMARIZER_BACKEND = os.getenv("HOMECARE_SUMMARIZER", "gemini")
+GEMINI_MODEL = os.getenv("HOMECARE_GEMINI_MODEL", "gemini-pro")
+OLLAMA_URL = os.getenv("HOMECARE_OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("HOMECARE_OLLAMA_MODEL", "llama3")
+OLLAMA_POOL_SIZE = int(os.getenv("HOMECARE_OLLAMA_POOL_SIZE", "8"))
+OLLAMA_TIMEOUT_SECONDS = 300
+
+# Sections every care log summary is asked for, in order
+SECTION_TITLES = ["Patient Status", "Key Observations", "Actions Taken", "Follow-up Notes"]
+
+
+class SummarizerBackend(abc.ABC):
+    """
+    Interface every summarizer backend implements.
+
+    Subclasses provide ``stream``; ``generate`` is built on it
+    unless the backend has a cheaper non-streaming call.
+    """
+
+    name = "base"
+    model_name = ""
+
+    @abc.abstractmethod
+    def stream(self, prompt):
+        """Yield the response to ``prompt`` piece by piece as it is generated."""
+
+    def generate(self, prompt):
+        """Return the full response to ``prompt``."""
+        return "".join(self.stream(prompt))
+
+
+class GeminiBackend(SummarizerBackend):
+    """Google Gemini, configured once per API key."""
+
+    name = "gemini"
+
+    def __init__(self, model_name=GEMINI_MODEL):
+        import google.generativeai as genai
+        self._genai = genai
+        self.model_name = model_name
+        self._model = None
+        self._api_key = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if "GEMINI_API_KEY" not in st.secrets:
+            raise ValueError("Gemini API key not configured.")
+        api_key = st.secrets["GEMINI_API_KEY"]
+        with self._lock:
+            if self._model is None or self._api_key != api_key:
+                self._genai.configure(api_key=api_key)
+                self._model = self._genai.GenerativeModel(self.model_name)
+                self._api_key = api_key
+            return self._model
+
+    def stream(self, prompt):
+        for chunk in self._get_model().generate_content(prompt, stream=True):
+            yield chunk.text
+
+    def generate(self, prompt):
+        return self._get_model().generate_content(prompt).text
+
+
+class OllamaBackend(SummarizerBackend):
+    """A local Ollama server, reached over a pooled HTTP session."""
+
+    name = "ollama"
+
+    def __init__(self, model_name=OLLAMA_MODEL, base_url=OLLAMA_URL, pool_size=OLLAMA_POOL_SIZE):
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        # Raises if the server is down, so a backend that can't work is never cached
+        ensure_ollama_ready(model_name, self.base_url)
+        # Keep-alive connections are reused across requests and threads
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _post(self, prompt, stream):
+        response = self._session.post(
+            f"{self.base_url}/api/generate",
+            json={"model": self.model_name, "prompt": prompt, "stream": stream},
+            stream=stream,
+            timeout=OLLAMA_TIMEOUT_SECONDS
+        )
+        if response.status_code != 200:
+            raise Exception(f"Error from Ollama API: {response.text}")
+        return response
+
+    def stream(self, prompt):
+        with self._post(prompt, stream=True) as response:
+            # Ollama streams one JSON object per line
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    break
+
+    def generate(self, prompt):
+        return self._post(prompt, stream=False).json()["response"]
+
+
+class StubBackend(SummarizerBackend):
+    """
+    Deterministic offline stand-in for an LLM.
+
+    Echoes the first line of the transcript or notes, so the summarization
+    paths can be exercised and benchmarked without network access.
+    """
+
+    name = "stub"
+    model_name = "stub"
+
+    def generate(self, prompt):
+        body = prompt.split(":\n", 1)[-1]
+        lines = [line.strip() for line in body.splitlines() if line.strip() and not line.strip().endswith(":")]
+        first_line = lines[0] if lines else ""
+        if "1. Patient Status" in prompt:
+            return "\n\n".join(f"{number}. {title}\n- {first_line[:200]}" for number, title in enumerate(SECTION_TITLES, start=1))
+        return f"- {first_line[:200]}"
+
+    def stream(self, prompt):
+        text = self.generate(prompt)
+        for start in range(0, len(text), 16):
+            yield text[start:start + 16]
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "ollama": OllamaBackend,
+    "stub": StubBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+# One lock per backend name, so a slow start (e.g. Ollama's health check)
+# only holds up callers of that backend
+_build_locks = {}
+
+
+def get_backend(name=None):
+    """
+    Return the shared instance of the named backend (default: HOMECARE_SUMMARIZER).
+
+    A backend whose constructor fails isn't cached, so the next call tries again.
+
+    Raises:
+        ValueError: If the backend name is unknown
+        RuntimeError: If the backend can't be used, e.g. Ollama isn't running
+    """
+    name = name or SUMMARIZER_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown summarizer backend: {name}")
+    with _backends_lock:
+        backend = _backends.get(name)
+        build_lock = _build_locks.setdefault(name, threading.Lock())
+    if backend is not None:
+        return backend
+    with build_lock:
+        with _backends_lock:
+            backend = _backends.get(name)
+        if backend is None:
+            backend = BACKENDS[name]()
+            with _backends_lock:
+                _backends[name] = backend
+        return backend
@@ -0,0 +1,17 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def database_file(tmp_path, monkeypatch):
+    """A freshly migrated homecare.db in a temporary folder, used for the rest of the test."""
+    path = tmp_path / "homecare.db"
+    monkeypatch.setattr(database, "DB_PATH", str(path))
+    database.init_db()
+    return path
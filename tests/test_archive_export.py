@@ -0,0 +1,71 @@
+"""Streaming ZIP and tar audit archives."""
+import io
+import json
+import tarfile
+import zipfile
+import pytest
+from archive_export import _StreamBuffer, _TarWriter, _ZipWriter, stream_archive
+from database import log_care_summary
+
+AUDIO = bytes(range(256)) * 5000  # Spans more than one copy chunk
+
+
+def _write(writer_class, fmt):
+    sink = _StreamBuffer()
+    writer = writer_class(sink, fmt)
+    pieces = []
+    writer.add_bytes("notes/summary.txt", b"Slept well.")
+    pieces.extend(writer.iter_add_stream("audio/memo.wav", io.BytesIO(AUDIO), len(AUDIO), compress=False))
+    pieces.extend(writer.iter_add_stream("empty.txt", io.BytesIO(b""), 0))
+    writer.close()
+    pieces.append(sink.drain())
+    return b"".join(pieces)
+
+
+def test_zip_writer():
+    with zipfile.ZipFile(io.BytesIO(_write(_ZipWriter, "zip"))) as archive:
+        assert archive.testzip() is None
+        assert archive.read("notes/summary.txt") == b"Slept well."
+        assert archive.read("audio/memo.wav") == AUDIO
+        assert archive.getinfo("audio/memo.wav").compress_type == zipfile.ZIP_STORED
+        assert archive.read("empty.txt") == b""
+
+
+@pytest.mark.parametrize("fmt", ["tar", "tar.gz"])
+def test_tar_writer(fmt):
+    with tarfile.open(fileobj=io.BytesIO(_write(_TarWriter, fmt))) as archive:
+        assert archive.getnames() == ["notes/summary.txt", "audio/memo.wav", "empty.txt"]
+        assert archive.extractfile("notes/summary.txt").read() == b"Slept well."
+        assert archive.extractfile("audio/memo.wav").read() == AUDIO
+        assert archive.extractfile("empty.txt").read() == b""
+
+
+def test_tar_writer_rejects_short_streams():
+    writer = _TarWriter(_StreamBuffer(), "tar")
+    with pytest.raises(OSError, match="ended before"):
+        list(writer.iter_add_stream("memo.wav", io.BytesIO(b"abc"), 10))
+
+
+@pytest.mark.parametrize("fmt", ["zip", "tar"])
+def test_stream_archive(database_file, tmp_path, fmt):
+    audio_path = tmp_path / "memo.wav"
+    audio_path.write_bytes(AUDIO)
+    log_care_summary("caregiver1", "memo.wav", "Slept well.", "1. Patient Status\nSettled.", "", "", str(audio_path))
+    data = b"".join(stream_archive("2000-01-01", "2100-01-01", fmt=fmt))
+
+    if fmt == "zip":
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        names, read = archive.namelist(), archive.read
+    else:
+        archive = tarfile.open(fileobj=io.BytesIO(data))
+        names, read = archive.getnames(), lambda name: archive.extractfile(name).read()
+
+    manifest = [json.loads(line) for line in read("manifest.jsonl").splitlines()]
+    assert len(manifest) == 1 and manifest[0]["pdf_rendered"]
+    row = manifest[0]
+    assert read(row["transcript_file"]) == b"Slept well."
+    assert read(row["pdf_file"]).startswith(b"%PDF")
+    assert read(row["audio_file"]) == AUDIO
+    assert set(names) == {row["transcript_file"], row["summary_file"], row["pdf_file"], row["audio_file"],
+                          "manifest.csv", "manifest.jsonl"}
+    assert read("manifest.csv").decode("utf-8").splitlines()[1].startswith(f"{row['id']},caregiver1,")
@@ -0,0 +1,79 @@
+"""Job runner claims, heartbeats and failures."""
+import time
+import jobs
+from database import execute_write, get_connection
+from jobs import JobRunner, get_job
+
+
+def _enqueue():
+    # Not jobs.enqueue_job, which would start the process-wide runner
+    return execute_write(
+        "INSERT INTO jobs (username, original_filename, audio_path) VALUES ('carer', 'memo.wav', 'memo.wav')"
+    ).result().lastrowid
+
+
+def _make_stale(job_id):
+    execute_write("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - 2 * jobs.STALE_JOB_SECONDS, job_id)).result()
+
+
+def _fail(job):
+    raise RuntimeError("Could not transcribe the audio file.")
+
+
+def test_failed_job_is_marked_failed(database_file, monkeypatch):
+    runner = JobRunner(threads=1)
+    monkeypatch.setattr(runner, "_run_overlapped", _fail)
+    job_id = _enqueue()
+    runner._run(job_id)
+
+    job = get_job(job_id)
+    assert (job["status"], job["error"]) == ("failed", "Could not transcribe the audio file.")
+    assert runner._requeue_stale() == []
+
+
+def test_job_is_retried_when_its_failure_cannot_be_saved(database_file, monkeypatch):
+    runner = JobRunner(threads=1)
+    monkeypatch.setattr(runner, "_run_overlapped", _fail)
+    update_job = jobs._update_job
+
+    def broken_update(job_id, **fields):
+        if fields.get("status") == "failed":
+            raise OSError("disk I/O error")
+        update_job(job_id, **fields)
+
+    monkeypatch.setattr(jobs, "_update_job", broken_update)
+    job_id = _enqueue()
+    runner._run(job_id)
+    assert get_job(job_id)["status"] == "running"
+
+    # The runner stops vouching for the job, so it goes stale and is requeued
+    _make_stale(job_id)
+    runner._beat()
+    assert runner._requeue_stale() == [job_id]
+    assert get_connection().execute("SELECT status, owner FROM jobs WHERE id = ?", (job_id,)).fetchone() == ("queued", None)
+
+
+def test_only_one_runner_claims_a_job(database_file):
+    first, second = JobRunner(threads=1), JobRunner(threads=1)
+    job_id = _enqueue()
+    assert first._claim(job_id)
+    assert not second._claim(job_id)
+    assert get_connection().execute("SELECT status, owner FROM jobs WHERE id = ?", (job_id,)).fetchone() == ("running", first.owner)
+
+
+def test_only_stale_jobs_are_requeued(database_file):
+    live, crashed, restarted = JobRunner(threads=1), JobRunner(threads=1), JobRunner(threads=1)
+    live_job, crashed_job = _enqueue(), _enqueue()
+    assert live._claim(live_job) and crashed._claim(crashed_job)
+    live._active.add(live_job)
+
+    # A process starting up leaves jobs with a fresh heartbeat alone...
+    assert restarted._requeue_stale() == []
+
+    # ...and takes over those whose runner stopped beating
+    _make_stale(live_job)
+    _make_stale(crashed_job)
+    live._beat()
+    assert restarted._requeue_stale() == [crashed_job]
+    assert get_job(live_job)["status"] == "running"
+    assert get_job(crashed_job)["status"] == "queued"
@@ -0,0 +1,82 @@
+"""Claiming, retrying and recovering queued email."""
+import time
+import database
+import mail_queue
+from database import get_connection, run_in_writer
+from mail_queue import MailWorker
+
+
+def _queue(rows):
+    # rows: (recipient, digest, next_attempt_at)
+    run_in_writer(lambda conn: conn.executemany(
+        "INSERT INTO outbox (recipient, subject, body, digest, next_attempt_at) VALUES (?, 's', 'b', ?, ?)", rows
+    )).result()
+
+
+def _statuses():
+    return dict(get_connection().execute("SELECT id, status FROM outbox").fetchall())
+
+
+def test_claim_keeps_each_digest_whole(database_file):
+    now = time.time()
+    _queue([("a@example.com", 1, now - 1)] * 80 + [("b@example.com", 1, now - 1)] * 3
+           + [("c@example.com", 0, now - 1)] * 60 + [("d@example.com", 1, now + 3600)])
+    items = MailWorker()._claim_due()
+
+    counts = {}
+    for item in items:
+        counts[(item["recipient"], item["digest"])] = counts.get((item["recipient"], item["digest"]), 0) + 1
+    assert counts == {("a@example.com", 1): 80, ("b@example.com", 1): 3, ("c@example.com", 0): mail_queue.CLAIM_BATCH_SIZE}
+
+
+def test_claims_are_stamped_and_only_stale_ones_requeued(database_file):
+    _queue([("a@example.com", 0, time.time() - 1)] * 2)
+    live, restarted = MailWorker(), MailWorker()
+    claimed = live._claim_due()
+    assert {item["id"] for item in claimed} == {1, 2}
+    assert get_connection().execute("SELECT DISTINCT owner FROM outbox").fetchall() == [(live.owner,)]
+
+    # A second process starting up leaves the live worker's mail alone...
+    assert restarted._requeue_stale() == 0
+    assert set(_statuses().values()) == {"sending"}
+
+    # ...but takes it back once the claim has not been renewed for too long
+    database.execute_write("UPDATE outbox SET claimed_at = ?", (time.time() - mail_queue.STALE_CLAIM_SECONDS - 1,)).result()
+    assert restarted._requeue_stale() == 2
+    assert set(_statuses().values()) == {"queued"}
+
+
+class _FailingConnection:
+    settings = {"sender": "care@example.com"}
+
+    def __init__(self, error):
+        self.error = error
+
+    def send(self, msg):
+        raise self.error
+
+    def close(self):
+        pass
+
+
+def test_failed_send_is_retried_with_backoff_then_given_up(database_file, monkeypatch):
+    import smtplib
+
+    _queue([("a@example.com", 0, time.time() - 1)])
+    worker = MailWorker()
+    worker._connection = _FailingConnection(smtplib.SMTPServerDisconnected("gone"))
+    monkeypatch.setattr(worker, "_get_connection", lambda: worker._connection)
+
+    before = time.time()
+    worker._send(worker._claim_due())
+    status, attempts, error, next_attempt_at = get_connection().execute(
+        "SELECT status, attempts, error, next_attempt_at FROM outbox"
+    ).fetchone()
+    assert (status, attempts, error) == ("queued", 1, "gone")
+    assert next_attempt_at >= before + mail_queue.RETRY_BACKOFF_SECONDS
+
+    # A permanent (5xx) refusal fails the email without further retries
+    database.execute_write("UPDATE outbox SET next_attempt_at = 0").result()
+    worker._connection = _FailingConnection(smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no such user")}))
+    worker._send(worker._claim_due())
+    assert get_connection().execute("SELECT status, attempts FROM outbox").fetchone() == ("failed", 2)
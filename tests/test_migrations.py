@@ -0,0 +1,77 @@
+"""Migrating a database created by the original app to the latest schema."""
+import sqlite3
+import database
+from database import MIGRATIONS, init_db, log_care_summary, schema_version
+from history import search_logs
+from reports import open_follow_ups, totals
+
+SUMMARY = """1. Patient Status
+Comfortable and alert.
+
+2. Key Observations
+Slight swelling in the left ankle after the fall.
+
+3. Actions Taken
+Applied a cold compress.
+
+4. Follow-up Notes
+{follow_up}
+"""
+
+
+def _baseline_db(path):
+    # The schema and rows as the app wrote them before migrations existed (user_version 0)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS care_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            original_filename TEXT NOT NULL,
+            transcript TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            txt_path TEXT NOT NULL,
+            pdf_path TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO care_logs (username, original_filename, transcript, summary, txt_path, pdf_path, timestamp) "
+        "VALUES (?, ?, ?, ?, 'summaries/a.txt', 'summaries/a.pdf', ?)",
+        [
+            ("caregiver1", "fall.wav", "She fell in the bathroom this morning.",
+             SUMMARY.format(follow_up="Ask the GP to look at the ankle."), "2024-03-01 09:00:00"),
+            ("caregiver1", "evening.wav", "Quiet evening, ate all of her dinner.",
+             SUMMARY.format(follow_up="None."), "2024-03-01 19:00:00"),
+            ("caregiver2", "meds.wav", "Gave the evening medication.",
+             SUMMARY.format(follow_up="Nil by mouth from 10pm."), "2024-03-02 20:00:00"),
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_database_migrates_to_latest(tmp_path, monkeypatch):
+    path = tmp_path / "homecare.db"
+    _baseline_db(path)
+    monkeypatch.setattr(database, "DB_PATH", str(path))
+
+    init_db()
+    assert schema_version() == MIGRATIONS[-1][0]
+
+    # Existing logs are searchable, parsed into sections and counted in the rollups
+    assert [log["original_filename"] for log in search_logs("fell bathroom")] == ["fall.wav"]
+    assert sorted(log["original_filename"] for log in open_follow_ups()) == ["fall.wav", "meds.wav"]
+    assert totals("2024-03-01", "2024-03-02") == {"logs": 3, "audio_seconds": 0, "follow_ups": 2, "open_follow_ups": 2}
+    assert totals("2024-03-01", "2024-03-02", "caregiver2")["logs"] == 1
+
+    # Running it again changes nothing, and new logs go through the new triggers
+    init_db()
+    assert schema_version() == MIGRATIONS[-1][0]
+    assert log_care_summary("caregiver2", "new.wav", "Walked to the shop.", SUMMARY.format(follow_up="None."), "", "")
+    assert [log["original_filename"] for log in search_logs("shop")] == ["new.wav"]
+    assert totals("2000-01-01", "2100-01-01")["logs"] == 4
+
+
+def test_migrations_are_numbered_in_order():
+    versions = [version for version, _ in MIGRATIONS]
+    assert versions == list(range(1, len(MIGRATIONS) + 1))
@@ -0,0 +1,73 @@
+"""Lending and evicting models in the Whisper model pool, with a fake loader."""
+import threading
+import pytest
+from model_pool import ModelPool
+
+
+class _Loader:
+    def __init__(self):
+        self.loads = []
+
+    def __call__(self, name, device, precision):
+        self.loads.append(name)
+        return object()
+
+
+def _use(pool, name):
+    with pool.acquire(name, "cpu", "fp32") as model:
+        return model
+
+
+def test_least_recently_used_model_is_evicted():
+    loader = _Loader()
+    pool = ModelPool(max_models=2, loader=loader)
+    base = _use(pool, "base")
+    _use(pool, "small")
+    assert _use(pool, "base") is base  # Reused, and now the most recently used
+    _use(pool, "medium")
+
+    assert list(pool.loaded()) == [("base", "cpu", "fp32"), ("medium", "cpu", "fp32")]
+    _use(pool, "small")
+    assert loader.loads == ["base", "small", "medium", "small"]
+
+
+def test_model_on_loan_is_not_evicted():
+    pool = ModelPool(max_models=1, loader=_Loader())
+    with pool.acquire("base", "cpu", "fp32"):
+        _use(pool, "small")
+        # small was more recent, but base was still on loan
+        assert list(pool.loaded()) == [("base", "cpu", "fp32")]
+    assert list(pool.loaded()) == [("base", "cpu", "fp32")]
+
+
+def test_callers_wait_for_a_free_instance():
+    loader = _Loader()
+    pool = ModelPool(instances_per_model=1, loader=loader)
+    borrowed = []
+
+    with pool.acquire("base", "cpu", "fp32") as first:
+        thread = threading.Thread(target=lambda: borrowed.append(_use(pool, "base")))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()  # Blocked until the first caller is done
+    thread.join(5)
+
+    assert borrowed == [first]
+    assert loader.loads == ["base"]
+
+
+def test_failed_load_frees_its_reservation():
+    calls = []
+
+    def flaky(name, device, precision):
+        calls.append(name)
+        if len(calls) == 1:
+            raise RuntimeError("out of memory")
+        return object()
+
+    pool = ModelPool(instances_per_model=1, loader=flaky)
+    with pytest.raises(RuntimeError):
+        _use(pool, "base")
+    assert pool.loaded() == {("base", "cpu", "fp32"): 0}
+    _use(pool, "base")
+    assert calls == ["base", "base"]
@@ -0,0 +1,45 @@
+"""Parsing summary sections and deciding whether follow-up notes are open."""
+import pytest
+from sections import needs_follow_up, parse_sections
+
+SUMMARY = """**1. Patient Status:** Stable, in good spirits.
+
+## Key Observations
+- Ate all of breakfast
+
+3) Actions Taken: Gave morning medication.
+
+Follow-up Notes:
+Follow-up with the GP on Tuesday about the rash."""
+
+
+def test_parse_sections_handles_heading_styles():
+    assert parse_sections(SUMMARY) == {
+        "patient_status": "Stable, in good spirits.",
+        "key_observations": "- Ate all of breakfast",
+        "actions_taken": "Gave morning medication.",
+        "follow_up_notes": "Follow-up with the GP on Tuesday about the rash.",
+    }
+
+
+@pytest.mark.parametrize("notes", [
+    None, "", "None", "N/A", "**None**", "None required.", "- None noted",
+    "No additional follow-up needed", "No further action needed at this time.",
+    "Nothing further.", "None. No further action needed.", "Nothing to report at this time.",
+    "No follow-up is required", "N/A at present",
+])
+def test_notes_without_follow_up(notes):
+    assert not needs_follow_up(notes)
+
+
+@pytest.mark.parametrize("notes", [
+    "Recheck BP tomorrow", "None, but recheck BP tomorrow", "None required. Monitor BP daily.",
+    "No fever; recheck BP", "- No changes to medication\n- Call GP Monday",
+    # Instructions that merely start like "none"
+    "Nothing by mouth after midnight before Tuesday's procedure.",
+    "Nil by mouth from 10pm.",
+    "None of her evening medications should be given until the GP reviews them.",
+    "No visitors until the infection clears.",
+])
+def test_notes_with_follow_up(notes):
+    assert needs_follow_up(notes)
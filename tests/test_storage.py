@@ -0,0 +1,51 @@
+"""Compaction and cold-tier moves against uploads of the same recording."""
+import io
+import os
+import time
+import pytest
+import storage
+import uploads
+from database import get_connection, run_in_writer
+
+
+def _log_audio(path):
+    run_in_writer(lambda conn: conn.execute(
+        "INSERT INTO care_logs (username, original_filename, transcript, summary, txt_path, pdf_path, audio_path, timestamp) "
+        "VALUES ('carer', 'memo.wav', 't', 's', '', '', ?, datetime('now', '-2 days'))", (path,)
+    )).result()
+
+
+def _archived(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(uploads, "probe_audio", lambda path: {"duration": 1.0})
+    path, _ = uploads.ingest_upload(io.BytesIO(b"RIFF memo"), "memo.wav")
+    old = time.time() - 2 * storage.REUSE_GRACE_SECONDS
+    os.utime(path, (old, old))
+    return path
+
+
+def test_replace_file_repoints_and_deletes(database_file, tmp_path, monkeypatch):
+    path = _archived(tmp_path, monkeypatch)
+    _log_audio(path)
+    assert storage._replace_file(path, "moved.opus", storage.AUDIO_REFERENCES)
+    assert not os.path.exists(path)
+    assert get_connection().execute("SELECT audio_path FROM care_logs").fetchone() == ("moved.opus",)
+
+
+def test_reuploaded_recording_is_not_deleted(database_file, tmp_path, monkeypatch):
+    path = _archived(tmp_path, monkeypatch)
+    _log_audio(path)
+    # The same memo uploaded again; its job isn't queued yet
+    assert uploads.ingest_upload(io.BytesIO(b"RIFF memo"), "again.wav")[0] == path
+
+    assert not storage._replace_file(path, "moved.opus", storage.AUDIO_REFERENCES)
+    assert os.path.exists(path)
+    assert get_connection().execute("SELECT audio_path FROM care_logs").fetchone() == (path,)
+
+
+def test_cold_path_rejects_files_outside_the_app_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path / "..")
+    monkeypatch.setattr(storage, "COLD_STORAGE_DIR", "cold")
+    assert storage._cold_path(os.path.join(tmp_path.name, "a.wav")) == os.path.join("cold", tmp_path.name, "a.wav")
+    with pytest.raises(ValueError):
+        storage._cold_path(os.path.join(tmp_path.name, "..", "..", "etc", "passwd"))
@@ -0,0 +1,94 @@
+"""Map-reduce summarization against the offline stub backend."""
+import threading
+import time
+import pytest
+import summarizer_backends
+from summarize import (
+    generate_with_retry, reduce_prompt, split_transcript,
+    summarize_long, summarize_sections, summarize_text
+)
+from summarizer_backends import StubBackend
+
+# Six sentences of about 20 tokens each, so a 40-token segment holds two
+TRANSCRIPT = " ".join(f"Sentence {index} about the patient's breakfast, medication and mood." for index in range(1, 7))
+
+
+def test_split_transcript_keeps_sentences_whole():
+    segments = split_transcript(TRANSCRIPT, max_tokens=40)
+    assert len(segments) == 3
+    assert " ".join(segments) == TRANSCRIPT
+
+
+def test_summarize_sections_with_stub_backend():
+    notes = summarize_sections(TRANSCRIPT, StubBackend(), segment_tokens=40)
+    assert notes == [f"- Sentence {index} about the patient's breakfast, medication and mood. "
+                     f"Sentence {index + 1} about the patient's breakfast, medication and mood." for index in (1, 3, 5)]
+
+
+def test_summarize_sections_keeps_order_with_one_worker():
+    backend = StubBackend()
+    assert summarize_sections(TRANSCRIPT, backend, max_concurrency=1, segment_tokens=40) == \
+        summarize_sections(TRANSCRIPT, backend, max_concurrency=3, segment_tokens=40)
+
+
+def test_generate_with_retry_retries_failed_calls():
+    backend = StubBackend()
+    failures = []
+
+    def flaky(prompt):
+        if len(failures) < 2:
+            failures.append(prompt)
+            raise ConnectionError("dropped")
+        return backend.generate(prompt)
+
+    assert generate_with_retry(flaky, "Patient ate well.", backoff=0) == backend.generate("Patient ate well.")
+    assert len(failures) == 2
+
+
+def test_generate_with_retry_gives_up_after_retries():
+    calls = []
+
+    def down(prompt):
+        calls.append(prompt)
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        generate_with_retry(down, "Patient ate well.", retries=2, backoff=0)
+    assert len(calls) == 3
+
+
+def test_summarize_long_runs_repeatedly():
+    backend = StubBackend()
+    summaries = [summarize_long(TRANSCRIPT, backend) for _ in range(2)]
+    assert summaries[0] == summaries[1]
+    assert summaries[0].startswith("1. Patient Status")
+    assert summaries[0] == backend.generate(reduce_prompt(summarize_sections(TRANSCRIPT, backend)))
+
+
+class _Interrupted(StubBackend):
+    """Stub whose generate is stopped by a BaseException once a follower is waiting."""
+
+    def __init__(self):
+        self.started = threading.Event()
+
+    def generate(self, prompt):
+        self.started.set()
+        time.sleep(0.2)
+        raise KeyboardInterrupt
+
+
+def test_followers_do_not_hang_when_leader_is_interrupted(database_file, monkeypatch):
+    backend = _Interrupted()
+    monkeypatch.setattr(summarizer_backends, "_backends", {"stub": backend})
+    monkeypatch.setattr(summarizer_backends, "SUMMARIZER_BACKEND", "stub")
+
+    def leader():
+        with pytest.raises(KeyboardInterrupt):
+            summarize_text("Patient slept through the night.")
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    backend.started.wait(5)
+    with pytest.raises(RuntimeError, match="interrupted"):
+        summarize_text("Patient slept through the night.")
+    thread.join(5)
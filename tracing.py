@@ -0,0 +1,220 @@
+"""
+Lightweight timing spans for the care log pipeline.
+
+    @traced("summarize")
+    def summarize_text(text): ...
+
+    with span("whisper", model="base"):
+        ...
+
+Spans nest through a context variable, so a span opened inside another
+records it as its parent, and annotate() adds attributes (audio length,
+cache hits) to whichever span is current. Finished spans are queued on the
+database writer without waiting, so tracing never blocks the pipeline.
+"""
+import contextvars
+import functools
+import json
+import math
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+# Set HOMECARE_TRACING=off to stop recording spans
+TRACING_ENABLED = os.getenv("HOMECARE_TRACING", "on").lower() not in ("off", "0", "false")
+
+# Spans that transcribe audio; their duration / audio_seconds is the real-time factor
+TRANSCRIBE_SPANS = ["transcribe", "transcribe_long"]
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation and its attributes."""
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id, self.parent_id = parent or (uuid.uuid4().hex, None)
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.duration = None
+        self.error = None
+
+
+def current_context():
+    """
+    Return (trace_id, span_id) of the current span, or None.
+
+    Pass it as ``parent`` to span() in another process to continue the trace there.
+    """
+    current = _current_span.get()
+    return (current.trace_id, current.span_id) if current is not None else None
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """
+    Time the enclosed block as a span named ``name``.
+
+    Args:
+        name (str): Span name, e.g. "transcribe"
+        parent (tuple): (trace_id, span_id) from current_context(); defaults to the current span
+        attributes: Initial attributes; more can be added with annotate()
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+
+    current = Span(name, parent or current_context(), **attributes)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        _record(current)
+
+
+def traced(name=None):
+    """Decorator that runs every call of the function inside a span."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def annotate(**attributes):
+    """Add attributes to the current span (no-op outside a span)."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def record_error(message):
+    """Mark the current span as failed, for code that reports errors instead of raising."""
+    current = _current_span.get()
+    if current is not None:
+        current.error = message
+
+
+def _record(finished):
+    # Imported here because database.py itself is traced
+    from database import execute_write
+
+    try:
+        execute_write('''
+            INSERT INTO metrics (trace_id, span_id, parent_id, name, started_at, duration, error, attributes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            finished.trace_id, finished.span_id, finished.parent_id, finished.name,
+            finished.started_at, finished.duration, finished.error,
+            json.dumps(finished.attributes, default=str)
+        ))
+    except Exception as e:
+        print(f"Could not record span {finished.name}: {e}")
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def stage_percentiles(since):
+    """
+    Latency percentiles for every span name recorded since ``since``.
+
+    Args:
+        since (float): Unix timestamp
+
+    Returns:
+        list: Dicts with name, count, errors, p50, p95 and p99 (seconds)
+    """
+    from database import get_connection
+
+    rows = get_connection().execute('''
+        SELECT name, duration, error IS NOT NULL FROM metrics
+        WHERE started_at >= ?
+        ORDER BY name, duration
+    ''', (since,)).fetchall()
+
+    stats = {}
+    for name, duration, failed in rows:
+        entry = stats.setdefault(name, {"durations": [], "errors": 0})
+        entry["durations"].append(duration)
+        entry["errors"] += failed
+
+    return [
+        {
+            "name": name,
+            "count": len(entry["durations"]),
+            "errors": entry["errors"],
+            "p50": percentile(entry["durations"], 0.50),
+            "p95": percentile(entry["durations"], 0.95),
+            "p99": percentile(entry["durations"], 0.99),
+        }
+        for name, entry in stats.items()
+    ]
+
+
+def transcription_rtf(since):
+    """
+    Real-time factor (processing seconds per second of audio) of transcriptions since ``since``.
+
+    Cache hits are left out, since they don't run Whisper.
+
+    Returns:
+        dict: count, p50, p95 and p99, or None if nothing was transcribed
+    """
+    from database import get_connection
+
+    placeholders = ", ".join("?" for _ in TRANSCRIBE_SPANS)
+    rows = get_connection().execute(f'''
+        SELECT duration / json_extract(attributes, '$.audio_seconds') AS rtf FROM metrics
+        WHERE name IN ({placeholders})
+          AND started_at >= ?
+          AND error IS NULL
+          AND json_extract(attributes, '$.audio_seconds') > 0
+          AND NOT coalesce(json_extract(attributes, '$.cache_hit'), 0)
+        ORDER BY rtf
+    ''', (*TRANSCRIBE_SPANS, since)).fetchall()
+    values = [row[0] for row in rows]
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+    }
+
+
+def cache_hit_rates(since):
+    """
+    Cache hits per span name since ``since``, from the ``cache_hit`` attribute.
+
+    Spans are recorded by whichever process did the work (a Whisper worker,
+    a job thread), so these counts cover every process, unlike in-memory counters.
+
+    Returns:
+        list: Dicts with name, lookups and hits
+    """
+    from database import get_connection
+
+    rows = get_connection().execute('''
+        SELECT name, COUNT(*), SUM(json_extract(attributes, '$.cache_hit')) FROM metrics
+        WHERE started_at >= ? AND json_extract(attributes, '$.cache_hit') IS NOT NULL
+        GROUP BY name
+        ORDER BY name
+    ''', (since,)).fetchall()
+    return [{"name": name, "lookups": lookups, "hits": hits} for name, lookups, hits in rows]
@@ -1,55 +1,416 @@
-import whisper
-import tempfile
+import hashlib
+import multiprocessing
 import os
-import streamlit as st
 import subprocess
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+import streamlit as st
+from model_pool import acquire_model, set_thread_budget, TORCH_THREADS, transcribe_options, profile_settings, DEFAULT_MODEL, MAX_BATCH_SIZE
+from result_cache import ResultCache, make_key
+from tracing import traced, span, annotate, record_error
+
+SAMPLE_RATE = 16000
+
+# Containers that may keep their index at the end of the file, which ffmpeg
+# can only read from a seekable input rather than a pipe
+SEEKABLE_FORMATS = {".m4a", ".mp4", ".mov"}
+
+# Recordings longer than this are transcribed in parallel chunks
+LONG_AUDIO_SECONDS = float(os.getenv("HOMECARE_LONG_AUDIO_SECONDS", "300"))
+LONG_AUDIO_WORKERS = int(os.getenv("HOMECARE_LONG_AUDIO_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+MIN_CHUNK_SECONDS = 60
+MAX_CHUNK_SECONDS = 120
+
+# Batched decoding works on whole Whisper windows, cut at a quiet point in their last 10 s
+BATCH_WINDOW_SECONDS = 30
+MIN_BATCH_WINDOW_SECONDS = 20
 
-def transcribe_audio(file_path):
+# Transcripts are cached in homecare.db, keyed by a hash of the decoded audio
+TRANSCRIPT_CACHE_BYTES = int(float(os.getenv("HOMECARE_TRANSCRIPT_CACHE_MB", "256")) * 1024 * 1024)
+transcript_cache = ResultCache("transcript_cache", TRANSCRIPT_CACHE_BYTES)
+
+
+@contextmanager
+def _ffmpeg_input(source, file_extension=None):
     """
-    Transcribe audio file using Whisper with proper FFmpeg preprocessing.
-    Supports .wav, .mp3, and .m4a files.
+    Work out how to hand ``source`` to ffmpeg/ffprobe.
+
+    Yields (input_arg, stdin_data). Only formats that need seeking pay for
+    a temp copy of the original bytes; everything else is piped on stdin.
     """
-    try:
-        # Load Whisper model
-        model = whisper.load_model("base")
-        
-        # Create a temporary .wav file for FFmpeg conversion
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source), None
+    elif (file_extension or "").lower() in SEEKABLE_FORMATS:
+        with tempfile.NamedTemporaryFile(suffix=file_extension.lower(), delete=False) as tmp:
+            tmp.write(source)
             tmp_path = tmp.name
-        
-        # Convert audio to 16kHz mono WAV using FFmpeg
-        ffmpeg_cmd = [
-            "ffmpeg",
-            "-i", file_path,
-            "-ar", "16000",  # Set sample rate to 16kHz
-            "-ac", "1",      # Convert to mono
-            "-f", "wav",     # Force WAV format
-            "-y",            # Overwrite output file if it exists
-            tmp_path
-        ]
-        
-        # Run FFmpeg command
+        try:
+            yield tmp_path, None
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass  # Ignore cleanup errors
+    else:
+        yield "pipe:0", source
+
+
+def _pcm_command(input_arg):
+    # Decode to raw 16-bit PCM on stdout instead of writing a WAV file
+    return [
+        "ffmpeg",
+        "-v", "error",
+        "-i", input_arg,
+        "-f", "s16le",             # Raw little-endian PCM
+        "-acodec", "pcm_s16le",
+        "-ar", str(SAMPLE_RATE),   # Set sample rate to 16kHz
+        "-ac", "1",                # Convert to mono
+        "pipe:1"
+    ]
+
+
+def decode_audio(source, file_extension=None):
+    """
+    Decode audio to 16kHz mono float32 samples, entirely in memory.
+
+    Args:
+        source (str | bytes): Path to an audio file, or the raw uploaded bytes
+        file_extension (str): Extension of the uploaded bytes (e.g. ".mp3"),
+            used to decide whether ffmpeg needs a seekable temp file
+
+    Returns:
+        np.ndarray: Samples in [-1, 1]
+
+    Raises:
+        RuntimeError: If FFmpeg cannot decode the input
+    """
+    with _ffmpeg_input(source, file_extension) as (input_arg, stdin_data):
         process = subprocess.run(
-            ffmpeg_cmd,
-            capture_output=True,
-            text=True
+            _pcm_command(input_arg),
+            input=stdin_data,
+            stdin=None if stdin_data is not None else subprocess.DEVNULL,
+            capture_output=True
         )
-        
-        if process.returncode != 0:
-            st.error(f"❌ Audio conversion failed: {process.stderr}")
-            return None
-        
-        # Transcribe the converted audio
-        result = model.transcribe(tmp_path)
-        return result["text"]
-        
-    except Exception as e:
-        st.error(f"❌ Transcription failed: {str(e)}")
+
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.decode("utf-8", errors="replace"))
+
+    return np.frombuffer(process.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def probe_duration(source, file_extension=None):
+    """
+    Return the duration of the audio in seconds using ffprobe, or None if unknown.
+    """
+    with _ffmpeg_input(source, file_extension) as (input_arg, stdin_data):
+        process = subprocess.run(
+            [
+                "ffprobe",
+                "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                input_arg
+            ],
+            input=stdin_data,
+            stdin=None if stdin_data is not None else subprocess.DEVNULL,
+            capture_output=True
+        )
+    try:
+        return float(process.stdout.decode().strip())
+    except ValueError:
         return None
-        
+
+
+def iter_pcm_blocks(source, file_extension=None, block_seconds=10):
+    """
+    Stream decoded samples from ffmpeg in fixed-size blocks.
+
+    Memory use is bounded by ``block_seconds`` regardless of recording length.
+
+    Raises:
+        RuntimeError: If FFmpeg cannot decode the input
+    """
+    block_bytes = int(block_seconds * SAMPLE_RATE) * 2
+    with _ffmpeg_input(source, file_extension) as (input_arg, stdin_data):
+        process = subprocess.Popen(
+            _pcm_command(input_arg),
+            stdin=subprocess.PIPE if stdin_data is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        stderr = []
+        helpers = [threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)]
+        if stdin_data is not None:
+            helpers.append(threading.Thread(target=_feed_stdin, args=(process.stdin, stdin_data), daemon=True))
+        for helper in helpers:
+            helper.start()
+
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                # Drop a trailing odd byte; ffmpeg only ever emits whole samples at EOF
+                data = data[:len(data) - len(data) % 2]
+                yield np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+            for helper in helpers:
+                helper.join()
+
+    if returncode != 0:
+        raise RuntimeError(b"".join(stderr).decode("utf-8", errors="replace"))
+
+
+def _feed_stdin(pipe, data):
+    try:
+        pipe.write(data)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its stderr explains why
     finally:
-        # Clean up temporary file
         try:
-            os.remove(tmp_path)
-        except:
-            pass  # Ignore cleanup errors 
\ No newline at end of file
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+def split_on_silence(blocks, min_chunk_seconds=MIN_CHUNK_SECONDS, max_chunk_seconds=MAX_CHUNK_SECONDS):
+    """
+    Regroup a stream of sample blocks into chunks cut at quiet points.
+
+    Each chunk is between ``min_chunk_seconds`` and ``max_chunk_seconds`` long
+    (except the last). The cut is placed at the lowest-energy 30 ms frame in
+    that window so words are not split in half.
+
+    Yields:
+        numpy.ndarray: Samples of each chunk
+    """
+    frame = int(SAMPLE_RATE * 0.03)
+    min_samples = int(min_chunk_seconds * SAMPLE_RATE)
+    max_samples = int(max_chunk_seconds * SAMPLE_RATE)
+    buffer = np.zeros(0, dtype=np.float32)
+
+    for block in blocks:
+        buffer = np.concatenate([buffer, block])
+        while len(buffer) >= max_samples:
+            # RMS energy of each frame in the window where a cut is allowed
+            window = buffer[min_samples:max_samples]
+            n_frames = len(window) // frame
+            energy = np.sqrt(np.mean(window[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+            cut = min_samples + int(np.argmin(energy)) * frame + frame // 2
+            yield buffer[:cut].copy()
+            buffer = buffer[cut:]
+
+    if len(buffer):
+        yield buffer
+
+
+def _init_chunk_worker(threads):
+    # Keep each worker from claiming every core, since several run side by side
+    set_thread_budget(threads)
+
+
+def _transcribe_chunk(samples):
+    """Transcribe one chunk in a pool worker and return the text of its segments."""
+    with acquire_model() as model:
+        result = model.transcribe(samples, **transcribe_options(model))
+    return [segment["text"].strip() for segment in result["segments"]]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the long-audio process pool, started on first use and kept warm."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            threads = TORCH_THREADS or max(1, (os.cpu_count() or 1) // LONG_AUDIO_WORKERS)
+            _executor = ProcessPoolExecutor(
+                max_workers=LONG_AUDIO_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_chunk_worker,
+                initargs=(threads,)
+            )
+        return _executor
+
+
+def iter_long_segments(source, file_extension=None):
+    """
+    Transcribe a long recording chunk by chunk across the process pool.
+
+    Chunks are decoded and submitted as ffmpeg produces them, with at most
+    two chunks per worker in flight, so memory stays flat for any length.
+
+    Yields:
+        list: Text of each segment of a chunk, chunk by chunk in order
+    """
+    executor = _get_executor()
+    pending = deque()
+    chunks = split_on_silence(iter_pcm_blocks(source, file_extension))
+
+    for samples in chunks:
+        pending.append(executor.submit(_transcribe_chunk, samples))
+        del samples
+        while len(pending) >= LONG_AUDIO_WORKERS * 2:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def hash_source(source):
+    """Return the SHA-256 of the raw upload bytes or of the file at ``source``."""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    else:
+        digest.update(source)
+    return digest.hexdigest()
+
+
+def hash_audio(samples):
+    """Return the SHA-256 of decoded samples, given as one array or an iterable of blocks."""
+    digest = hashlib.sha256()
+    for block in [samples] if isinstance(samples, np.ndarray) else samples:
+        digest.update(block.tobytes())
+    return digest.hexdigest()
+
+
+def _tally_blocks(blocks, lengths):
+    """Pass ``blocks`` through, recording each block's sample count in ``lengths``."""
+    for block in blocks:
+        lengths.append(len(block))
+        yield block
+
+
+def _cache_options(mode):
+    return {**profile_settings(), "mode": mode}
+
+
+def _transcribe_batched(audio):
+    """Transcribe decoded samples through the shared WhisperBatcher, one window per batch slot."""
+    from whisper_batcher import get_batcher
+
+    windows = list(split_on_silence([audio], MIN_BATCH_WINDOW_SECONDS, BATCH_WINDOW_SECONDS))
+    return get_batcher().transcribe_windows(windows)
+
+
+@traced("transcribe_long")
+def transcribe_long(source, file_extension=None, on_partial=None):
+    """
+    Transcribe a long recording in parallel chunks.
+
+    Args:
+        source (str | bytes): Path to an audio file, or the raw uploaded bytes
+        file_extension (str): Extension of the uploaded bytes, e.g. ".m4a"
+        on_partial (callable): Called with the transcript so far after each chunk
+    """
+    options = _cache_options("chunked")
+    source_key = make_key("source", hash_source(source), DEFAULT_MODEL, options=options)
+    cached = transcript_cache.get(source_key)
+    if cached is not None:
+        annotate(cache_hit=True, transcript_chars=len(cached))
+        return cached
+
+    parts = []
+    try:
+        # A streaming decode pass to hash the audio is cheap next to Whisper
+        with span("decode_audio", mode="streaming"):
+            block_lengths = []
+            digest = hash_audio(_tally_blocks(iter_pcm_blocks(source, file_extension), block_lengths))
+        # On the transcribe_long span, where transcription_rtf reads it
+        annotate(audio_seconds=sum(block_lengths) / SAMPLE_RATE)
+        audio_key = make_key("audio", digest, DEFAULT_MODEL, options=options)
+        cached = transcript_cache.get(audio_key)
+        if cached is not None:
+            annotate(cache_hit=True, transcript_chars=len(cached))
+            transcript_cache.put(source_key, cached)
+            return cached
+
+        annotate(cache_hit=False, model=DEFAULT_MODEL, workers=LONG_AUDIO_WORKERS)
+        for segments in iter_long_segments(source, file_extension):
+            parts.extend(segments)
+            if on_partial is not None:
+                on_partial(" ".join(parts))
+        transcript = " ".join(parts)
+        annotate(transcript_chars=len(transcript))
+
+    except RuntimeError as e:
+        st.error(f"❌ Audio conversion failed: {str(e)}")
+        record_error(str(e))
+        return None
+    except Exception as e:
+        st.error(f"❌ Transcription failed: {str(e)}")
+        record_error(str(e))
+        return None
+
+    transcript_cache.put(audio_key, transcript)
+    transcript_cache.put(source_key, transcript)
+    return transcript
+
+
+@traced("transcribe")
+def transcribe_audio(source, file_extension=None):
+    """
+    Transcribe audio using Whisper with in-memory FFmpeg preprocessing.
+    Supports .wav, .mp3, and .m4a files.
+
+    Repeat uploads of the same memo are answered from the transcript cache:
+    first by a hash of the raw bytes (no decode needed), then by a hash of
+    the decoded audio.
+
+    Args:
+        source (str | bytes): Path to an audio file, or the raw uploaded bytes
+        file_extension (str): Extension of the uploaded bytes, e.g. ".m4a"
+    """
+    options = _cache_options("batched" if MAX_BATCH_SIZE > 1 else "single")
+    source_key = make_key("source", hash_source(source), DEFAULT_MODEL, options=options)
+    cached = transcript_cache.get(source_key)
+    if cached is not None:
+        annotate(cache_hit=True, transcript_chars=len(cached))
+        return cached
+
+    try:
+        with span("decode_audio", mode="buffered"):
+            audio = decode_audio(source, file_extension)
+    except RuntimeError as e:
+        st.error(f"❌ Audio conversion failed: {str(e)}")
+        record_error(str(e))
+        return None
+    annotate(audio_seconds=len(audio) / SAMPLE_RATE)
+
+    audio_key = make_key("audio", hash_audio(audio), DEFAULT_MODEL, options=options)
+    cached = transcript_cache.get(audio_key)
+    if cached is not None:
+        annotate(cache_hit=True, transcript_chars=len(cached))
+        transcript_cache.put(source_key, cached)
+        return cached
+
+    annotate(cache_hit=False, model=DEFAULT_MODEL)
+    try:
+        # Transcribe the decoded samples with a model borrowed from the shared pool,
+        # or batched with other requests' windows when batching is on
+        with span("whisper", model=DEFAULT_MODEL, audio_seconds=len(audio) / SAMPLE_RATE, batched=MAX_BATCH_SIZE > 1):
+            if MAX_BATCH_SIZE > 1:
+                text = _transcribe_batched(audio)
+            else:
+                with acquire_model() as model:
+                    text = model.transcribe(audio, **transcribe_options(model))["text"]
+    except Exception as e:
+        st.error(f"❌ Transcription failed: {str(e)}")
+        record_error(str(e))
+        return None
+
+    annotate(transcript_chars=len(text))
+    transcript_cache.put(audio_key, text)
+    transcript_cache.put(source_key, text)
+    return text
@@ -0,0 +1,148 @@
+"""
+Ingest uploaded voice memos into the content-addressed audio archive.
+
+Uploads are copied to disk in fixed-size chunks while their SHA-256 is
+computed, checked against the size limit as they are copied and against the
+duration limit with a quick ffprobe of the container header, and only then
+moved to audio_uploads/<aa>/<bb>/<sha256><ext>. Identical recordings share
+one file, and two uploads can never overwrite each other.
+"""
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from database import run_in_writer
+
+UPLOAD_DIR = "audio_uploads"
+ALLOWED_EXTENSIONS = {".wav", ".mp3", ".m4a"}
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("HOMECARE_MAX_UPLOAD_MB", "200")) * 1024 * 1024)
+MAX_UPLOAD_SECONDS = float(os.getenv("HOMECARE_MAX_UPLOAD_MINUTES", "120")) * 60
+COPY_CHUNK_BYTES = 1024 * 1024
+PROBE_TIMEOUT_SECONDS = 15
+
+
+class UploadRejected(ValueError):
+    """The upload is too large, too long or not audio; the message says which."""
+
+
+def archive_path(digest, file_extension):
+    """Return where the upload with SHA-256 ``digest`` is stored."""
+    return os.path.join(UPLOAD_DIR, digest[:2], digest[2:4], digest + file_extension)
+
+
+def _copy_chunks(src, dst, max_bytes):
+    sha256 = hashlib.sha256()
+    size = 0
+    while chunk := src.read(COPY_CHUNK_BYTES):
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadRejected(f"The file is larger than the {max_bytes / (1024 * 1024):g} MB limit.")
+        sha256.update(chunk)
+        dst.write(chunk)
+    if size == 0:
+        raise UploadRejected("The file is empty.")
+    return sha256.hexdigest()
+
+
+def probe_audio(path):
+    """
+    Read the container header of ``path`` with ffprobe, without decoding it.
+
+    Returns:
+        dict: format_name and duration (seconds, or None if the container doesn't say)
+
+    Raises:
+        UploadRejected: If ffprobe can't read the file or it has no audio stream
+    """
+    try:
+        process = subprocess.run(
+            [
+                "ffprobe",
+                "-v", "error",
+                "-show_entries", "format=format_name,duration:stream=codec_type",
+                "-of", "json",
+                path
+            ],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            timeout=PROBE_TIMEOUT_SECONDS
+        )
+    except subprocess.TimeoutExpired:
+        raise UploadRejected("The file could not be read as audio.")
+
+    try:
+        info = json.loads(process.stdout or b"{}")
+    except ValueError:
+        info = {}
+    streams = info.get("streams") or []
+    if process.returncode != 0 or not any(stream.get("codec_type") == "audio" for stream in streams):
+        raise UploadRejected("The file is not a supported audio recording or is corrupted.")
+
+    fmt = info.get("format") or {}
+    try:
+        duration = float(fmt["duration"])
+    except (KeyError, TypeError, ValueError):
+        duration = None
+    return {"format_name": fmt.get("format_name"), "duration": duration}
+
+
+def _store(tmp_path, path):
+    if os.path.exists(path):
+        # Same recording uploaded before; keep the archived copy, touched so
+        # storage maintenance doesn't compact or move it before the job is queued
+        os.utime(path)
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+
+def ingest_upload(src, original_filename, size=None, max_bytes=None, max_seconds=None):
+    """
+    Copy an upload into the audio archive and return its path and duration.
+
+    Args:
+        src: Readable binary file object (e.g. Streamlit's UploadedFile)
+        original_filename (str): Name the caregiver uploaded, used for the extension
+        size (int): Size in bytes if already known, to reject oversized files before copying
+        max_bytes (int): Size limit (defaults to HOMECARE_MAX_UPLOAD_MB)
+        max_seconds (float): Duration limit (defaults to HOMECARE_MAX_UPLOAD_MINUTES)
+
+    Returns:
+        tuple: (archive path, duration in seconds or None if the container doesn't say)
+
+    Raises:
+        UploadRejected: If the upload breaks a limit or isn't readable audio
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    max_seconds = max_seconds or MAX_UPLOAD_SECONDS
+
+    file_extension = os.path.splitext(original_filename)[1].lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise UploadRejected(f"Unsupported file type '{file_extension}'. Please upload a WAV, MP3 or M4A file.")
+    if size is not None and size > max_bytes:
+        raise UploadRejected(f"The file is larger than the {max_bytes / (1024 * 1024):g} MB limit.")
+
+    # Staged next to the archive so the final move is an atomic rename
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=".upload-", suffix=file_extension, delete=False)
+    try:
+        with tmp:
+            digest = _copy_chunks(src, tmp, max_bytes)
+
+        duration = probe_audio(tmp.name)["duration"]
+        if duration is not None and duration > max_seconds:
+            raise UploadRejected(f"The recording is longer than the {max_seconds / 60:g} minute limit.")
+
+        path = archive_path(digest, file_extension)
+        # On the writer thread, where storage maintenance checks a file before deleting it
+        run_in_writer(lambda conn: _store(tmp.name, path)).result()
+        return path, duration
+    except BaseException:
+        try:
+            os.remove(tmp.name)
+        except OSError:
+            pass  # Already moved or removed
+        raise
@@ -0,0 +1,161 @@
+"""
+Cross-request batching for Whisper.
+
+When several memos are transcribed at once, each would otherwise run its
+own one-window encoder and decoder passes. WhisperBatcher collects the
+30-second windows of every pending request for up to
+HOMECARE_WHISPER_BATCH_WAIT_MS, runs up to HOMECARE_WHISPER_BATCH_SIZE of
+them through whisper.decode as one batch, and hands each caller its own
+results back. A batch size of 1 (the default) leaves it switched off.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from model_pool import acquire_model, transcribe_options, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS
+from tracing import span
+
+# whisper and torch are imported by the server thread, when the first window arrives
+
+# Windows with Whisper's own "this was silence" signal are dropped, as model.transcribe does
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+
+
+class WhisperBatcher:
+    """
+    In-process inference server that batches windows from concurrent requests.
+
+    transcribe_windows() may be called from any number of threads; a single
+    server thread owns the model and runs the batched forward passes.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batches = 0
+        self._windows = 0
+        self._wait_seconds = 0.0
+
+    def _ensure_started(self):
+        # Called with self._lock held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._serve, name="whisper-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, samples):
+        """Queue one window of at most 30 s of 16 kHz samples; returns a Future of its text."""
+        future = Future()
+        # Under the lock, so a window is never queued for a server thread that is shutting down
+        with self._lock:
+            self._ensure_started()
+            self._queue.put((samples, future, time.perf_counter()))
+        return future
+
+    def transcribe_windows(self, windows):
+        """Transcribe consecutive windows of one recording and return the joined text."""
+        futures = [self.submit(samples) for samples in windows]
+        return " ".join(text for text in (future.result() for future in futures) if text)
+
+    def _collect(self):
+        """Block for the first window, then take more until the batch is full or the wait is up."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _serve(self):
+        try:
+            while True:
+                self._run_batch(self._collect())
+        except BaseException as e:
+            # Only a BaseException (e.g. SystemExit) gets here. Fail everything still
+            # queued and let the next submit() start a new server thread.
+            error = RuntimeError(f"Whisper batcher stopped: {e!r}")
+            with self._lock:
+                self._thread = None
+                while True:
+                    try:
+                        _, future, _ = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    future.set_exception(error)
+            raise
+
+    def _run_batch(self, batch):
+        futures = [future for _, future, _ in batch]
+        started = time.perf_counter()
+        try:
+            with span("whisper_batch", batch_size=len(batch)):
+                texts = self._decode([samples for samples, _, _ in batch])
+        except BaseException as e:
+            error = e if isinstance(e, Exception) else RuntimeError(f"Whisper batch was interrupted: {e!r}")
+            for future in futures:
+                future.set_exception(error)
+            if isinstance(e, Exception):
+                return
+            raise
+        with self._lock:
+            self._batches += 1
+            self._windows += len(batch)
+            self._wait_seconds += sum(started - queued_at for _, _, queued_at in batch)
+        for future, text in zip(futures, texts):
+            future.set_result(text)
+
+    def _decode(self, windows):
+        import torch
+        import whisper
+
+        with acquire_model() as model:
+            options = transcribe_options(model)
+            mel = torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(samples)), model.dims.n_mels)
+                for samples in windows
+            ]).to(model.device)
+            decoding = whisper.DecodingOptions(
+                language=options.get("language"),
+                beam_size=options.get("beam_size"),
+                fp16=options["fp16"],
+                without_timestamps=True
+            )
+            with torch.inference_mode():
+                results = whisper.decode(model, mel, decoding)
+
+        return [
+            "" if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+            else result.text.strip()
+            for result in results
+        ]
+
+    def stats(self):
+        """Return batches run, windows decoded, mean batch size and mean queue wait (seconds)."""
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "windows": self._windows,
+                "mean_batch_size": self._windows / self._batches if self._batches else 0.0,
+                "mean_wait": self._wait_seconds / self._windows if self._windows else 0.0,
+            }
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Return the process-wide batcher, created on first use."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = WhisperBatcher()
+        return _batcher